@@ -0,0 +1,153 @@
+# accounts.py - v1.0.1
+"""
+Registre des comptes Garmin / Gmail (un par bateau)
+
+Un seul processus sert toute la flotte : chaque compte a sa boîte IMAP,
+son jeton Gmail, ses fichiers de synchro et ses identifiants Garmin pour
+les réponses. Les jobs portent le nom de leur compte (request['account']).
+
+ACCOUNTS_FILE (JSON) :
+    [
+        {"name": "alizee", "username": "alizee.inreach@gmail.com",
+         "password_env": "ALIZEE_PASSWORD"},
+        {"name": "toucan", "username": "toucan@gmail.com", "password_env": "TOUCAN_PASSWORD",
+         "garmin_password_env": "TOUCAN_GARMIN_PASSWORD", "gmail_token_file": "toucan.pickle"}
+    ]
+
+Sans fichier, un compte unique 'default' reprend GARMIN_USERNAME /
+GARMIN_PASSWORD et les fichiers d'état historiques.
+
+v1.0.1: nom de compte inconnu → KeyError (plus de repli sur un autre
+bateau) ; adresse de destination comparée exactement, pas en sous-chaîne
+"""
+
+import json
+import os
+import threading
+from email.utils import getaddresses
+from config import (ACCOUNTS_FILE, GARMIN_USERNAME, GARMIN_PASSWORD, IMAP_HOST, IMAP_PORT,
+                    IMAP_USE_SSL, GMAIL_TOKEN_FILE, MAILBOX_STATE_FILE, GMAIL_HISTORY_STATE_FILE)
+
+DEFAULT_ACCOUNT = 'default'
+
+
+def _suffixed(path, name):
+    """mailbox_state.json → mailbox_state.<name>.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{name}{ext}"
+
+
+class Account:
+    """Identifiants et fichiers d'état d'un compte"""
+
+    def __init__(self, name, username, password, garmin_password=None,
+                 imap_host=IMAP_HOST, imap_port=IMAP_PORT, imap_use_ssl=IMAP_USE_SSL,
+                 gmail_token_file=None, mailbox_state_file=None, gmail_history_state_file=None):
+        legacy = name == DEFAULT_ACCOUNT
+        self.name = name
+        self.username = username
+        self.password = password
+        self.garmin_password = garmin_password or password
+        self.imap_host = imap_host
+        self.imap_port = int(imap_port)
+        self.imap_use_ssl = imap_use_ssl
+        self.gmail_token_file = gmail_token_file or (
+            GMAIL_TOKEN_FILE if legacy else _suffixed(GMAIL_TOKEN_FILE, name))
+        self.mailbox_state_file = mailbox_state_file or (
+            MAILBOX_STATE_FILE if legacy else _suffixed(MAILBOX_STATE_FILE, name))
+        self.gmail_history_state_file = gmail_history_state_file or (
+            GMAIL_HISTORY_STATE_FILE if legacy else _suffixed(GMAIL_HISTORY_STATE_FILE, name))
+
+    def to_public(self):
+        """Description sans secret (pour /status)"""
+        return {
+            'name': self.name,
+            'username': self.username,
+            'imap_host': self.imap_host,
+            'password_configured': bool(self.password),
+        }
+
+
+def _from_entry(entry):
+    def secret(key):
+        if entry.get(f'{key}_env'):
+            return os.environ.get(entry[f'{key}_env'])
+        return entry.get(key)
+
+    return Account(
+        name=entry['name'],
+        username=entry['username'],
+        password=secret('password'),
+        garmin_password=secret('garmin_password'),
+        imap_host=entry.get('imap_host', IMAP_HOST),
+        imap_port=entry.get('imap_port', IMAP_PORT),
+        imap_use_ssl=entry.get('imap_use_ssl', IMAP_USE_SSL),
+        gmail_token_file=entry.get('gmail_token_file'),
+        mailbox_state_file=entry.get('mailbox_state_file'),
+        gmail_history_state_file=entry.get('gmail_history_state_file'),
+    )
+
+
+def load_accounts(path=ACCOUNTS_FILE):
+    """
+    Charge le registre
+
+    Returns:
+        list: [Account], le premier sert aux jobs sans compte (antérieurs au registre)
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return [Account(DEFAULT_ACCOUNT, GARMIN_USERNAME, GARMIN_PASSWORD)]
+
+    accounts = [_from_entry(entry) for entry in entries]
+    names = [account.name for account in accounts]
+    if not accounts or len(set(names)) != len(names):
+        raise ValueError(f"{path}: registre vide ou noms de comptes en double")
+    return accounts
+
+
+_accounts = None
+_accounts_lock = threading.Lock()
+
+
+def get_accounts():
+    """Comptes du processus (chargés une fois)"""
+    global _accounts
+    with _accounts_lock:
+        if _accounts is None:
+            _accounts = load_accounts()
+            print(f"👥 {len(_accounts)} compte(s): {', '.join(a.name for a in _accounts)}", flush=True)
+        return _accounts
+
+
+def get_account(name=None):
+    """
+    Compte par nom ; None ou 'default' → premier compte du registre
+
+    Args:
+        name: Nom du compte, ou Account (renvoyé tel quel)
+
+    Raises:
+        KeyError: Nom absent du registre (compte renommé ou supprimé) : on
+                  n'emprunte jamais les identifiants d'un autre bateau
+    """
+    if isinstance(name, Account):
+        return name
+    accounts = get_accounts()
+    for account in accounts:
+        if account.name == name:
+            return account
+    if name not in (None, DEFAULT_ACCOUNT):
+        raise KeyError(f"Compte inconnu '{name}' (absent de {ACCOUNTS_FILE})")
+    return accounts[0]
+
+
+def account_for_address(address):
+    """Compte dont l'adresse figure dans address (en-tête To / Delivered-To), sinon None"""
+    wanted = {addr.strip().lower() for _, addr in getaddresses([address or '']) if addr}
+    for account in get_accounts():
+        if account.username and account.username.strip().lower() in wanted:
+            return account
+    return None
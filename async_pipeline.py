@@ -0,0 +1,491 @@
+# async_pipeline.py - v1.10.0
+"""
+Mode d'exécution asyncio (EXECUTION_MODE=asyncio)
+
+Ingestion IMAP (aioimaplib, IDLE), appels LLM et POST Garmin (httpx),
+envois inReachLink (playwright.async_api) et attentes Saildocs
+(asyncio.Future) tournent dans une seule boucle d'événements : un
+processus peut garder des centaines de requêtes en vol, surtout des
+attentes Saildocs et des délais entre messages, sans un thread par job.
+
+Les jobs restent ceux de job_store : même machine à états, même reprise
+après redémarrage que job_runner. Seuls l'envoi Gmail vers Saildocs
+(client googleapiclient synchrone) et l'encodage GRIB (CPU) passent par
+asyncio.to_thread.
+
+v1.10.0: une boucle d'ingestion par compte du registre (boîte, marqueur UID
+et nom de compte propres) ; Saildocs lu en asyncio sur le premier compte
+v1.9.0: notifications de suivi envoyées une seule fois par job (claim_notice)
+v1.8.0: transitions d'état, textes de suivi et découpage repris de
+job_runner / grib_handler ; seules les E/S restent propres à asyncio
+v1.7.0: requête Saildocs envoyée depuis le compte du job ; pour un compte
+autre que la boîte principale, attente via son démultiplexeur (thread)
+v1.6.0: job en erreur relancé après son délai (job_runner.record_job_error) ;
+lot d'un groupe déclenché seulement par un enfant arrivé au bout de sa part
+v1.5.0: format de réponse GRIB du job (request['format'], compact_grid)
+v1.4.0: réponses inReach via les identifiants du compte du job (accounts) ;
+ingestion et attente Saildocs restent sur la boîte du compte principal
+v1.3.0: backlog trié à l'ingestion et à la reprise (backlog_triage)
+v1.2.0: jobs groupés (plusieurs commandes par email, lot combiné)
+v1.1.0: soumission depuis un autre thread (endpoint /inbound)
+v1.0.1: corps inReach en octets, analysés par inreach_parser
+"""
+
+import asyncio
+import re
+import time
+import aioimaplib
+import httpx
+from config import (IMAP_IDLE_TIMEOUT, CHECK_INTERVAL_MINUTES,
+                    SAILDOCS_RESPONSE_EMAIL, SAILDOCS_TIMEOUT, SAILDOCS_POLL_INTERVAL,
+                    ASYNC_MAX_IN_FLIGHT,
+                    PLAYWRIGHT_BROWSER_PATH)
+from imap_session import (parse_fetch_data, parse_status_line, group_by_section,
+                          decode_part_bytes, find_part, find_text_part, envelope_subject)
+from mailbox_state import load_state, save_state
+from email_monitor import sync_criteria, select_text_targets, collect_requests
+from saildocs_router import normalize_request, match_reply
+from job_store import get_job_store, FINAL_STATES
+from job_runner import (record_job_error, CHILD_READY_STATES, save_ai_response, split_ai_response,
+                        save_saildocs_sent, save_grib_data, save_grib_messages, begin_send, finish_send,
+                        prepare_group)
+from backlog_triage import triage_jobs
+from grib_handler import (wait_for_saildocs_response, send_saildocs_request, grib_size_error,
+                          accepted_message, STATUS_MESSAGES)
+from accounts import get_account, get_accounts
+from saildocs_router import get_saildocs_demux
+from utils import encode_and_split_grib
+from claude_handler import (handle_claude_async, MARITIME_SYSTEM_PROMPT as CLAUDE_MARITIME,
+                            GENERIC_SYSTEM_PROMPT as CLAUDE_GENERIC)
+from mistral_handler import (handle_mistral_async, MARITIME_SYSTEM_PROMPT as MISTRAL_MARITIME,
+                             GENERIC_SYSTEM_PROMPT as MISTRAL_GENERIC, WEATHER_SYSTEM_PROMPT)
+from inreach_sender import send_to_inreach_async
+
+# type → appel LLM async (découpage: job_runner.AI_HANDLERS)
+AI_HANDLERS_ASYNC = {
+    'claude_maritime': lambda c, req: handle_claude_async(c, req['question'], CLAUDE_MARITIME, 512),
+    'claude_generic': lambda c, req: handle_claude_async(c, req['question'], CLAUDE_GENERIC, req['max_tokens']),
+    'mistral_maritime': lambda c, req: handle_mistral_async(c, req['question'], MISTRAL_MARITIME, 512),
+    'mistral_generic': lambda c, req: handle_mistral_async(c, req['question'], MISTRAL_GENERIC, req['max_tokens']),
+    'weather': lambda c, req: handle_mistral_async(c, req['question'], WEATHER_SYSTEM_PROMPT, 512),
+}
+
+_FETCH_PREFIX_RE = re.compile(rb'^(\d+) FETCH ')
+_LITERAL_RE = re.compile(rb'\{\d+\}$')
+
+
+def aio_fetch_to_imaplib(lines):
+    """Convertit les lignes FETCH d'aioimaplib au format imaplib (tuples préfixe/littéral)"""
+    data = []
+    lines = list(lines[:-1])  # dernière ligne: statut de fin de commande
+    i = 0
+    while i < len(lines):
+        line = _FETCH_PREFIX_RE.sub(rb'\1 ', bytes(lines[i]))
+        if _LITERAL_RE.search(line) and i + 1 < len(lines) and isinstance(lines[i + 1], bytearray):
+            data.append((line, bytes(lines[i + 1])))
+            i += 2
+        else:
+            data.append(line)
+            i += 1
+    return data
+
+
+class AsyncPendingGrib:
+    """Attente d'une réponse Saildocs (variante asyncio de PendingGrib)"""
+
+    def __init__(self, grib_request):
+        self.grib_request = grib_request
+        self.key = normalize_request(grib_request)
+        self.created = time.time()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class AsyncMailbox:
+    """Connexion aioimaplib d'un compte avec les mêmes opérations que imap_session"""
+
+    def __init__(self, account=None):
+        self.account = get_account(account)
+        self.imap = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        account = self.account
+        if account.imap_use_ssl:
+            self.imap = aioimaplib.IMAP4_SSL(host=account.imap_host, port=account.imap_port)
+        else:
+            self.imap = aioimaplib.IMAP4(host=account.imap_host, port=account.imap_port)
+        await self.imap.wait_hello_from_server()
+        response = await self.imap.login(account.username, account.password)
+        if response.result != 'OK':
+            raise aioimaplib.Abort(f"login IMAP refusé ({account.name})")
+        await self.imap.select('INBOX')
+        print(f"🔌 [{account.name}] IMAP async connecté ({account.imap_host})", flush=True)
+
+    async def ensure(self):
+        if self.imap is None or self.imap.get_state() not in ('AUTH', 'SELECTED'):
+            await self.connect()
+
+    async def status(self):
+        response = await self.imap.status('INBOX', '(UIDVALIDITY UIDNEXT)')
+        return parse_status_line(bytes(response.lines[0]))
+
+    async def search(self, criteria):
+        response = await self.imap.uid_search(criteria)
+        if response.result != 'OK' or not response.lines:
+            return []
+        return bytes(response.lines[0]).replace(b'SEARCH', b'').split()
+
+    async def uid_fetch(self, uids, items):
+        if not uids:
+            return {}
+        response = await self.imap.uid('fetch', b','.join(uids).decode(), items)
+        if response.result != 'OK':
+            raise aioimaplib.Abort(f"UID FETCH {items} refusé")
+        return parse_fetch_data(aio_fetch_to_imaplib(response.lines))
+
+    async def fetch_parts(self, targets):
+        payloads = {}
+        for section, uids in group_by_section(targets).items():
+            fetched = await self.uid_fetch(uids, f'(UID BODY.PEEK[{section}])')
+            key = f'BODY[{section}]'.encode()
+            for uid, fields in fetched.items():
+                if uid in targets:
+                    payloads[uid] = decode_part_bytes(fields.get(key), targets[uid][2])
+        return payloads
+
+    async def fetch_text_parts(self, targets):
+        texts = {}
+        for uid, payload in (await self.fetch_parts(targets)).items():
+            try:
+                texts[uid] = payload.decode(targets[uid][3], errors='ignore')
+            except LookupError:
+                texts[uid] = payload.decode('utf-8', errors='ignore')
+        return texts
+
+    async def mark_seen(self, uids):
+        if uids:
+            await self.imap.uid('store', b','.join(uids).decode(), '+FLAGS', '(\\Seen)')
+
+    async def idle_wait(self, timeout):
+        """IMAP IDLE ; True si le serveur a signalé un nouveau message"""
+        idle = await self.imap.idle_start(timeout=timeout)
+        try:
+            pushed = await asyncio.wait_for(self.imap.wait_server_push(), timeout)
+        except asyncio.TimeoutError:
+            pushed = []
+        finally:
+            self.imap.idle_done()
+            await asyncio.wait_for(idle, 10)
+        return any(b'EXISTS' in bytes(line) for line in (pushed or []) if isinstance(line, (bytes, bytearray)))
+
+
+class AsyncPipeline:
+    """Boucle unique: ingestion, lecteur Saildocs et exécution des jobs"""
+
+    def __init__(self, max_in_flight=ASYNC_MAX_IN_FLIGHT):
+        self.store = get_job_store()
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        # Une boîte par compte ; celle du premier compte sert aussi au lecteur Saildocs
+        self.mailboxes = {account.name: AsyncMailbox(account) for account in get_accounts()}
+        self.mailbox = self.mailboxes[get_account().name]
+        self.client = None
+        self.loop = None
+        self.tasks = {}
+        self.waiters = []
+        self.mail_event = asyncio.Event()
+        self._playwright = None
+        self._browser = None
+        self._browser_lock = asyncio.Lock()
+
+    # ---------- Cycle de vie ----------
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        async with httpx.AsyncClient(timeout=30) as client:
+            self.client = client
+            await self.mailbox.connect()
+            for job_id, _, _ in triage_jobs(job['job_id'] for job in self.store.incomplete()):
+                self.submit(job_id)
+            saildocs_task = asyncio.create_task(self._saildocs_loop())
+            try:
+                await asyncio.gather(*(self._ingest_loop(mailbox.account)
+                                       for mailbox in self.mailboxes.values()))
+            finally:
+                saildocs_task.cancel()
+                if self._browser:
+                    await self._browser.close()
+                    await self._playwright.stop()
+
+    async def _get_browser(self):
+        """Chromium partagé, lancé à la première URL inreachlink.com"""
+        async with self._browser_lock:
+            if self._browser is None:
+                from playwright.async_api import async_playwright
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(
+                    headless=True,
+                    args=['--no-sandbox', '--disable-setuid-sandbox'],
+                    executable_path=PLAYWRIGHT_BROWSER_PATH
+                )
+            return self._browser
+
+    def submit(self, job_id):
+        if job_id in self.tasks:
+            return
+        task = asyncio.create_task(self._run_job(job_id))
+        self.tasks[job_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+
+    def submit_threadsafe(self, job_id):
+        """submit() depuis un thread hors boucle (requêtes Flask)"""
+        self.loop.call_soon_threadsafe(self.submit, job_id)
+
+    def is_main_account(self, account):
+        """Compte dont la boîte est lue par le lecteur Saildocs asyncio"""
+        return get_account(account).name == self.mailbox.account.name
+
+    def notify_new_mail(self, account=None):
+        """Réveil du lecteur Saildocs du compte (asyncio ou démultiplexeur synchrone)"""
+        if self.is_main_account(account):
+            self.mail_event.set()
+        else:
+            get_saildocs_demux(account).notify_new_mail()
+
+    def notify_new_mail_threadsafe(self, account=None):
+        self.loop.call_soon_threadsafe(self.notify_new_mail, account)
+
+    def get_stats(self):
+        return {'in_flight': len(self.tasks), 'saildocs_waiting': len(self.waiters)}
+
+    # ---------- Ingestion ----------
+
+    async def _ingest_loop(self, account):
+        """Ingestion d'un compte: connexion IDLE dédiée, synchro sur sa boîte"""
+        watcher = AsyncMailbox(account)
+        await watcher.connect()
+        supports_idle = watcher.imap.has_capability('IDLE')
+        print(f"📬 [{account.name}] Ingestion async: {'IDLE' if supports_idle else 'polling'}", flush=True)
+        while True:
+            try:
+                await self.sync_inbox(account)
+                if supports_idle:
+                    await watcher.ensure()
+                    if await watcher.idle_wait(IMAP_IDLE_TIMEOUT):
+                        self.notify_new_mail(account)
+                else:
+                    await asyncio.sleep(CHECK_INTERVAL_MINUTES * 60)
+            except Exception as e:
+                print(f"⚠️ [{account.name}] Erreur ingestion async: {e}", flush=True)
+                await asyncio.sleep(5)
+
+    async def sync_inbox(self, account=None):
+        """Équivalent asyncio de check_gmail (même marqueur UID par compte, mêmes jobs)"""
+        account = get_account(account)
+        mailbox = self.mailboxes[account.name]
+        state_file = account.mailbox_state_file
+        async with mailbox.lock:
+            await mailbox.ensure()
+            box = await mailbox.status()
+            criteria, last_uid = sync_criteria(box, load_state(state_file))
+            if criteria is None:
+                return
+
+            uids = [uid for uid in await mailbox.search(criteria) if int(uid) > last_uid]
+            high_water = max([box['UIDNEXT'] - 1] + [int(uid) for uid in uids])
+            if not uids:
+                save_state(box['UIDVALIDITY'], high_water, state_file)
+                return
+
+            headers = await mailbox.uid_fetch(uids, '(UID ENVELOPE BODYSTRUCTURE)')
+            targets = select_text_targets(headers)
+            bodies = await mailbox.fetch_parts(targets)
+
+        # \Seen seulement une fois les jobs enregistrés (même ordre que check_gmail)
+        found = collect_requests(uids, headers, bodies, box['UIDVALIDITY'], targets, account=account.name)
+        async with mailbox.lock:
+            await mailbox.ensure()
+            await mailbox.mark_seen(uids)
+        for job_id, _, _ in triage_jobs(job_id for job_id, _, _ in found):
+            self.submit(job_id)
+        save_state(box['UIDVALIDITY'], high_water, state_file)
+
+    # ---------- Saildocs ----------
+
+    async def _saildocs_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.mail_event.wait(), SAILDOCS_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.mail_event.clear()
+            if not self.waiters:
+                continue
+            try:
+                await self._poll_saildocs()
+            except Exception as e:
+                print(f"⚠️ Erreur lecteur Saildocs async: {e}", flush=True)
+
+    async def _poll_saildocs(self):
+        async with self.mailbox.lock:
+            await self.mailbox.ensure()
+            uids = await self.mailbox.search(f'(UNSEEN FROM "{SAILDOCS_RESPONSE_EMAIL}")')
+            headers = await self.mailbox.uid_fetch(uids, '(UID ENVELOPE BODYSTRUCTURE)')
+            candidates = {}
+            for uid, fields in headers.items():
+                structure = fields.get(b'BODYSTRUCTURE')
+                grib_part = find_part(structure, b'APPLICATION', (b'OCTET-STREAM',))
+                if grib_part:
+                    candidates[uid] = (envelope_subject(fields.get(b'ENVELOPE')), grib_part,
+                                       find_text_part(structure, (b'PLAIN',)))
+            texts = await self.mailbox.fetch_text_parts(
+                {uid: c[2] for uid, c in candidates.items() if c[2]})
+
+            deliveries = {}
+            for uid in sorted(candidates, key=int):
+                taken = set(map(id, deliveries.values()))
+                waiting = [w for w in self.waiters if id(w) not in taken]
+                haystack = normalize_request(candidates[uid][0] + ' ' + texts.get(uid, ''))
+                pending = match_reply(haystack, waiting, len(self.waiters), bool(taken))
+                if pending:
+                    deliveries[uid] = pending
+
+            if not deliveries:
+                return
+            files = await self.mailbox.fetch_parts({uid: candidates[uid][1] for uid in deliveries})
+            await self.mailbox.mark_seen(list(deliveries))
+
+        for uid, pending in deliveries.items():
+            if files.get(uid) and not pending.future.done():
+                pending.future.set_result(files[uid])
+
+    async def wait_for_saildocs(self, grib_request, timeout=SAILDOCS_TIMEOUT):
+        pending = AsyncPendingGrib(grib_request)
+        self.waiters.append(pending)
+        self.mail_event.set()
+        try:
+            return await asyncio.wait_for(pending.future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.waiters.remove(pending)
+
+    # ---------- Jobs ----------
+
+    async def send(self, url, messages, on_sent=None, account=None):
+        return await send_to_inreach_async(self.client, url, messages, on_sent=on_sent,
+                                           get_browser=self._get_browser, account=account)
+
+    async def notify(self, url, message, account=None):
+        print(f"📡 Suivi: {message}", flush=True)
+        return await self.send(url, [message], account=account)
+
+    async def notify_once(self, job, notice, message):
+        """Variante asyncio de job_runner.notify_once (réservée avant l'envoi)"""
+        if self.store.claim_notice(job['job_id'], notice):
+            await self.notify(job['reply_url'], message, job['request'].get('account'))
+
+    async def _run_job(self, job_id):
+        async with self.semaphore:
+            job = self.store.get(job_id)
+            if job is None or job['state'] in FINAL_STATES:
+                return
+            try:
+                if job['type'] == 'batch':
+                    await self._run_batch_stages(job)
+                    return
+                if job['type'] == 'grib':
+                    await self._run_grib_stages(job)
+                else:
+                    await self._run_ai_stages(job)
+            except Exception as e:
+                print(f"❌ Erreur job async {job_id}: {e}", flush=True)
+                delay = record_job_error(self.store, job_id, e)
+                if delay is not None:
+                    self.loop.call_later(delay, self.submit, job_id)
+
+            # Enfant d'un groupe: le dernier terminé envoie le lot combiné (même tâche)
+            group_id = job['request'].get('group')
+            if not group_id or self.store.get(job_id)['state'] not in CHILD_READY_STATES:
+                return
+            group = self.store.get(group_id)
+            if group and group['state'] not in FINAL_STATES:
+                await self._run_batch_stages(group)
+
+    async def _run_batch_stages(self, job):
+        job = prepare_group(self.store, job)
+        if job is not None:
+            await self._run_send_stage(job)
+
+    async def _run_ai_stages(self, job):
+        ask = AI_HANDLERS_ASYNC[job['type']]
+        if job['state'] == 'received':
+            job = save_ai_response(self.store, job, *await ask(self.client, job['request']))
+        if job['state'] == 'fetched':
+            job = split_ai_response(self.store, job)
+        if not job['request'].get('group'):
+            await self._run_send_stage(job)
+
+    async def _run_grib_stages(self, job):
+        grib_request = job['request']['request']
+        url = job['reply_url']
+        account = job['request'].get('account')
+
+        if job['state'] == 'received':
+            await self.notify_once(job, 'accepted', accepted_message(grib_request))
+            sent = await asyncio.to_thread(send_saildocs_request, grib_request, account)
+            await self.notify_once(job, 'requested' if sent else 'gmail_error',
+                                   STATUS_MESSAGES['requested' if sent else 'gmail_error'])
+            job = save_saildocs_sent(self.store, job, sent)
+            if job is None:
+                return
+
+        if job['state'] == 'requested':
+            if self.is_main_account(account):
+                grib_data = await self.wait_for_saildocs(grib_request)
+            else:
+                # La réponse arrive dans la boîte du compte: son démultiplexeur la lit
+                grib_data = await asyncio.to_thread(wait_for_saildocs_response, url, SAILDOCS_TIMEOUT,
+                                                    grib_request, account=account)
+            if not grib_data and not job['request'].get('group'):
+                await self.notify_once(job, 'timeout', STATUS_MESSAGES['timeout'])
+            job = save_grib_data(self.store, job, grib_data)
+            if job is None:
+                return
+
+        if job['state'] == 'fetched':
+            await self.notify_once(job, 'fetched', STATUS_MESSAGES['fetched'])
+            messages = await asyncio.to_thread(encode_and_split_grib, job['grib_data'],
+                                               payload_format=job['request'].get('format'))
+            error = grib_size_error(messages)
+            if error:
+                print(f"❌ {error}", flush=True)
+                await self.notify_once(job, 'too_big', error)
+                messages = None
+            job = save_grib_messages(self.store, job, messages)
+            if job is None:
+                return
+
+        if not job['request'].get('group'):
+            await self._run_send_stage(job)
+
+    async def _run_send_stage(self, job):
+        remaining, on_sent = begin_send(self.store, job)
+        ok = not remaining or await self.send(job['reply_url'], remaining, on_sent=on_sent,
+                                              account=job['request'].get('account'))
+        finish_send(self.store, job, ok)
+
+
+_active_pipeline = None
+
+
+def get_active_pipeline():
+    """Pipeline en cours d'exécution, ou None avant son démarrage"""
+    pipeline = _active_pipeline
+    return pipeline if pipeline is not None and pipeline.loop is not None else None
+
+
+async def run_async_pipeline():
+    """Point d'entrée du mode asyncio (appelé par main.run_scheduler)"""
+    global _active_pipeline
+    _active_pipeline = AsyncPipeline()
+    await _active_pipeline.run()
@@ -0,0 +1,198 @@
+# backfill.py - v1.1.0
+"""
+Traitement hors ligne d'emails inReach (.eml ou Maildir)
+
+Rejoue la détection et les handlers sur un répertoire d'emails, réparti
+sur un pool de processus, sans la boîte Gmail en direct :
+- rejouer un incident (messages de la nuit, export Maildir)
+- vérifier un changement de parseur sur des milliers de vrais messages
+  (--detect-only, sortie JSONL triée à comparer avec diff)
+- mesurer le débit du pipeline
+
+Par défaut rien n'est envoyé : les messages sortants sont écrits dans
+<out>/outbound/. --send appelle réellement send_to_inreach.
+
+Usage:
+    python backfill.py <répertoire|Maildir> [--out backfill_out] [--workers N]
+                       [--detect-only] [--grib-file fichier.grb] [--send] [--all-senders]
+
+v1.1.0: format de réponse GRIB de la requête (compact_grid) respecté
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from inreach_parser import parse_inreach_email, read_headers
+from request_grammar import parse_requests
+
+# Options du processus courant (fixées par _init_worker dans chaque processus du pool)
+_options = {}
+
+
+def list_messages(path):
+    """
+    Fichiers emails d'un répertoire (.eml, récursif) ou d'une Maildir (cur/ + new/)
+
+    Returns:
+        list: Chemins triés
+    """
+    if os.path.isdir(os.path.join(path, 'cur')) or os.path.isdir(os.path.join(path, 'new')):
+        files = [os.path.join(path, sub, name)
+                 for sub in ('cur', 'new') if os.path.isdir(os.path.join(path, sub))
+                 for name in os.listdir(os.path.join(path, sub)) if not name.startswith('.')]
+    else:
+        files = [os.path.join(root, name)
+                 for root, _, names in os.walk(path)
+                 for name in names if name.lower().endswith('.eml')]
+    return sorted(files)
+
+
+def _init_worker(options):
+    _options.update(options)
+
+
+def _handle(request_info):
+    """Exécute un handler comme job_runner, sans job_store ni envoi"""
+    if request_info['type'] == 'grib':
+        if not _options.get('grib_data'):
+            return None, "GRIB ignoré (Saildocs indisponible hors ligne, voir --grib-file)"
+        from utils import encode_and_split_grib
+        return encode_and_split_grib(_options['grib_data'], payload_format=request_info.get('format')), None
+    from job_runner import AI_HANDLERS
+    ask, split = AI_HANDLERS[request_info['type']]
+    response, cost = ask(request_info)
+    return split(response, cost, 120), None
+
+
+def process_file(path):
+    """
+    Pipeline complet pour un fichier (exécuté dans un processus du pool)
+
+    Returns:
+        dict: Résultat sérialisable (détection, messages, durées par étape)
+    """
+    timings = {}
+    result = {'file': path, 'status': 'ignored'}
+    start = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        headers = read_headers(raw)
+        sender = headers.get('from', '').lower()
+        result['message_id'] = headers.get('message-id', '').strip()
+        if not _options.get('all_senders') and 'inreach' not in sender and 'garmin' not in sender:
+            return result
+
+        parsed = parse_inreach_email(raw)
+        requests = [r.to_dict() for r in parse_requests(parsed['text'])] if parsed else []
+        timings['parse_ms'] = (time.perf_counter() - start) * 1000
+        result.update(reply_url=parsed and parsed['reply_url'], requests=requests,
+                      status='detected' if requests else 'no_command')
+        if not requests or _options.get('detect_only'):
+            return result
+
+        messages, errors = [], []
+        handle_start = time.perf_counter()
+        for request_info in requests:
+            request_info['reply_url'] = parsed['reply_url']
+            part, error = _handle(request_info)
+            messages.extend(part or [])
+            if error:
+                errors.append(error)
+        timings['handle_ms'] = (time.perf_counter() - handle_start) * 1000
+        result.update(messages=messages, errors=errors, status='handled')
+
+        if _options.get('send') and messages and parsed['reply_url']:
+            from inreach_sender import send_to_inreach
+            send_start = time.perf_counter()
+            sent = send_to_inreach(parsed['reply_url'], messages)
+            timings['send_ms'] = (time.perf_counter() - send_start) * 1000
+            result['status'] = 'sent' if sent else 'send_failed'
+    except Exception as e:
+        result.update(status='error', error=str(e))
+    finally:
+        timings['total_ms'] = (time.perf_counter() - start) * 1000
+        result['timings'] = {k: round(v, 3) for k, v in timings.items()}
+    return result
+
+
+def _outbound_name(result):
+    base = result.get('message_id') or os.path.basename(result['file'])
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', base).strip('_')[:120] + '.txt'
+
+
+def write_outputs(results, source, out_dir, dry_run):
+    """detections.jsonl (ordre des fichiers, comparable avec diff) + messages sortants"""
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'detections.jsonl'), 'w', encoding='utf-8') as f:
+        for result in results:
+            line = {k: result.get(k) for k in ('message_id', 'status', 'reply_url', 'requests', 'errors')}
+            line['file'] = os.path.relpath(result['file'], source)
+            f.write(json.dumps(line, ensure_ascii=False, sort_keys=True) + '\n')
+
+    if not dry_run:
+        return
+    outbound_dir = os.path.join(out_dir, 'outbound')
+    os.makedirs(outbound_dir, exist_ok=True)
+    for result in results:
+        if result.get('messages'):
+            with open(os.path.join(outbound_dir, _outbound_name(result)), 'w', encoding='utf-8') as f:
+                f.write(f"# {result['reply_url']}\n")
+                f.write('\n'.join(result['messages']) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traitement hors ligne d'emails inReach (.eml / Maildir)")
+    parser.add_argument('source', help="Répertoire de fichiers .eml ou Maildir")
+    parser.add_argument('--out', default='backfill_out', help="Répertoire de sortie")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Processus du pool")
+    parser.add_argument('--detect-only', action='store_true', help="Détection seule, sans appel LLM")
+    parser.add_argument('--grib-file', help="Fichier GRIB local utilisé pour toutes les requêtes GRIB")
+    parser.add_argument('--send', action='store_true', help="Envoi réel vers inReach (sinon dry-run)")
+    parser.add_argument('--all-senders', action='store_true', help="Ne pas filtrer sur l'expéditeur inReach/Garmin")
+    args = parser.parse_args(argv)
+
+    files = list_messages(args.source)
+    if not files:
+        print(f"❌ Aucun email dans {args.source}")
+        return 1
+
+    options = {'detect_only': args.detect_only, 'send': args.send, 'all_senders': args.all_senders}
+    if args.grib_file:
+        with open(args.grib_file, 'rb') as f:
+            options['grib_data'] = f.read()
+
+    mode = 'détection seule' if args.detect_only else ('ENVOI RÉEL' if args.send else 'dry-run')
+    print("=" * 70)
+    print(f"📂 BACKFILL: {len(files)} email(s), {args.workers} processus, {mode}")
+    print("=" * 70)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(options,)) as pool:
+        results = list(pool.map(process_file, files, chunksize=max(1, len(files) // (args.workers * 8))))
+    elapsed = time.perf_counter() - start
+
+    write_outputs(results, args.source, args.out, dry_run=not args.send)
+
+    statuses = Counter(r['status'] for r in results)
+    types = Counter(req['type'] for r in results for req in r.get('requests') or [])
+    parse_ms = [r['timings']['parse_ms'] for r in results if 'parse_ms' in r.get('timings', {})]
+    print(f"\n📊 Statuts: {dict(statuses)}")
+    print(f"🧩 Requêtes: {dict(types)}")
+    print(f"⏱️  {elapsed:.2f}s, {len(files) / elapsed:.1f} emails/s"
+          + (f", analyse moyenne {sum(parse_ms) / len(parse_ms):.3f} ms" if parse_ms else ""))
+    print(f"📝 Résultats: {os.path.join(args.out, 'detections.jsonl')}")
+    for result in results:
+        if result['status'] == 'error':
+            print(f"❌ {result['file']}: {result['error']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# backlog_triage.py - v1.1.0
+"""
+Tri du backlog avant soumission aux workers (rattrapage après panne)
+
+- Requête trop vieille (REQUEST_TTL_MINUTES par type, depuis l'en-tête
+  Date) : un seul message "expirée, renvoyez" au lieu de la réponse ;
+  un GRIB de prévision périmée ne coûte plus 25 messages satellite
+- Même appareil, même requête (GRIB même modèle et même zone, ou même
+  question) en attente depuis plus de BACKLOG_DEDUP_MINUTES : seule la
+  plus récente est traitée, l'autre reçoit un avis d'une ligne
+- Requêtes fraîches soumises en premier, les plus récentes d'abord
+
+v1.1.0: doublon = même requête (et non plus même type), seulement dans un
+backlog ; la requête remplacée est prévenue au lieu d'échouer en silence
+"""
+
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from config import REQUEST_TTL_MINUTES, BACKLOG_DEDUP_MINUTES
+from job_store import get_job_store
+from saildocs_router import normalize_request
+
+EXPIRED_ERROR = "Expirée"
+SUPERSEDED_ERROR = "Remplacée par une requête plus récente"
+
+# Étapes où l'on peut encore renoncer sans avoir envoyé de réponse
+_TRIAGE_STATES = ('received', 'requested', 'fetched', 'encoded')
+
+_stats_lock = threading.Lock()
+_stats = {'expired': 0, 'superseded': 0}
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def parse_date_header(value):
+    """Timestamp d'un en-tête Date RFC 2822, None si illisible"""
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def request_label(job):
+    """Nom court d'une requête pour les messages d'état (GFS, claude_maritime...)"""
+    if job['type'] == 'grib':
+        return job['request']['request'].split(':')[0].upper()
+    return job['type']
+
+
+def _sent_at(job):
+    return job['request'].get('sent_at') or job['created_at']
+
+
+def _expire(store, job, age):
+    notice = f"⌛ {request_label(job)}: requete expiree ({age / 3600:.1f}h). Renvoyez-la si besoin."
+    store.advance(job['job_id'], 'encoded', messages=[notice], error=EXPIRED_ERROR)
+    print(f"⌛ Job {job['job_id']} expiré ({age / 60:.0f} min)", flush=True)
+
+
+def _supersede(store, job, newer):
+    notice = f"🔁 {request_label(job)}: requete en double, seule la plus recente est traitee."
+    store.advance(job['job_id'], 'encoded', messages=[notice], error=SUPERSEDED_ERROR)
+    print(f"🔁 Job {job['job_id']} remplacé par {newer['job_id']}", flush=True)
+
+
+def duplicate_key(job):
+    """
+    Clé de doublon: même appareil et même requête
+
+    Returns:
+        tuple: (URL de réponse, type, modèle et zone GRIB ou question normalisés)
+    """
+    request = job['request']
+    if job['type'] == 'grib':
+        # gfs:14N,20N,65W,60W|0.5,0.5|0,3..72|WIND → modèle et zone
+        return job['reply_url'], 'grib', normalize_request(request['request'].split('|')[0])
+    return job['reply_url'], job['type'], normalize_request(request.get('question'))
+
+
+def triage_jobs(job_ids, store=None, now=None):
+    """
+    Applique expiration, dédoublonnage et ordre de fraîcheur
+
+    Args:
+        job_ids: Jobs à soumettre (nouveaux ou repris)
+
+    Returns:
+        list: [(job_id, type, reply_url)] dans l'ordre de soumission :
+              jobs déjà en cours d'envoi, requêtes fraîches (récentes d'abord),
+              puis avis d'expiration
+    """
+    store = store or get_job_store()
+    now = now or time.time()
+    in_progress, fresh, notices = [], [], []
+    newest = {}
+    expired = superseded = 0
+
+    for job in store.get_many(list(job_ids)):
+        if job is None:
+            continue
+        if (job['type'] == 'batch' or job['state'] not in _TRIAGE_STATES
+                or job['error'] in (EXPIRED_ERROR, SUPERSEDED_ERROR)):
+            in_progress.append(job)
+            continue
+
+        age = now - _sent_at(job)
+        ttl = REQUEST_TTL_MINUTES.get(job['type'])
+        if ttl and age > ttl * 60:
+            _expire(store, job, age)
+            notices.append(job)
+            expired += 1
+            continue
+
+        # Un enfant de groupe garde sa place dans le lot combiné
+        if job['state'] == 'received' and not job['request'].get('group'):
+            key = duplicate_key(job)
+            previous = newest.get(key)
+            if previous is not None:
+                older, newer = sorted((previous, job), key=_sent_at)
+                newest[key] = newer
+                # Requêtes arrivées ensemble dans un cycle normal: toutes traitées
+                if now - _sent_at(older) > BACKLOG_DEDUP_MINUTES * 60:
+                    _supersede(store, older, newer)
+                    notices.append(store.get(older['job_id']))
+                    superseded += 1
+                    if older is previous:
+                        fresh.remove(previous)
+                    else:
+                        continue
+            else:
+                newest[key] = job
+        fresh.append(job)
+
+    if expired or superseded:
+        with _stats_lock:
+            _stats['expired'] += expired
+            _stats['superseded'] += superseded
+
+    fresh.sort(key=_sent_at, reverse=True)
+    return [(job['job_id'], job['type'], job['reply_url']) for job in in_progress + fresh + notices]
@@ -1,8 +1,12 @@
-# claude_handler.py - v1.4
+# claude_handler.py - v1.5
 """
 Handler pour API Claude (Anthropic)
 Compatible avec architecture modulaire email_monitor v3.2.3
 
+v1.5:
+- Prompts système en constantes
+- handle_claude_async() pour le mode asyncio
+
 v1.4: 
 - ALGORITHME ROBUSTE découpage équilibré
 - Messages 110 chars minimum (sauf exceptions)
@@ -21,6 +25,46 @@ from typing import Optional, Tuple
 CLAUDE_BALANCE = float(os.getenv('CLAUDE_BALANCE', '5.00'))
 
 
+# Prompts système (partagés avec les variantes async)
+MARITIME_SYSTEM_PROMPT = """Tu es un assistant maritime expert spécialisé pour les navigateurs en mer.
+
+Contexte:
+- L'utilisateur est en mer sur un voilier
+- Communications par satellite inReach (coûteuses, limitées)
+- Besoin de réponses CONCISES et PRÉCISES
+
+Domaines d'expertise:
+- Météo marine et interprétation GRIB
+- Navigation hauturière
+- Sécurité en mer
+- Manœuvres et gestion du bateau
+- Mécanique marine de base
+- Protocoles d'urgence
+
+IMPÉRATIF:
+- Réponses COURTES (max 120 caractères si possible)
+- Information essentielle UNIQUEMENT
+- Pas de bavardage
+- Vocabulaire maritime précis
+- Conseils pratiques et actionnables
+- TEXTE BRUT uniquement (pas de LaTeX, pas de formules mathématiques)
+
+Si question hors contexte maritime: répondre brièvement que tu es spécialisé en navigation."""
+
+GENERIC_SYSTEM_PROMPT = """Tu es un assistant intelligent et concis.
+
+RÈGLES STRICTES DE FORMATAGE:
+- TEXTE BRUT UNIQUEMENT
+- PAS de LaTeX (\\text{}, \\rightarrow, etc.)
+- PAS de notation mathématique complexe (^, _, subscript, superscript)
+- Formules chimiques: écris "Fe2+" au lieu de "Fe^{2+}"
+- Flèches: utilise "->" au lieu de "\\rightarrow"
+- Équations: écris "H2O" au lieu de "H_2O"
+- Exposants: écris "m2" au lieu de "m^2"
+
+Reste précis et informatif, mais en texte simple lisible sur tout appareil."""
+
+
 def handle_claude_maritime_assistant(user_message: str) -> Tuple[str, float]:
     """
     Assistant maritime spécialisé avec Claude
@@ -50,30 +94,7 @@ def handle_claude_maritime_assistant(user_message: str) -> Tuple[str, float]:
             "content-type": "application/json"
         }
         
-        system_prompt = """Tu es un assistant maritime expert spécialisé pour les navigateurs en mer.
-
-Contexte:
-- L'utilisateur est en mer sur un voilier
-- Communications par satellite inReach (coûteuses, limitées)
-- Besoin de réponses CONCISES et PRÉCISES
-
-Domaines d'expertise:
-- Météo marine et interprétation GRIB
-- Navigation hauturière
-- Sécurité en mer
-- Manœuvres et gestion du bateau
-- Mécanique marine de base
-- Protocoles d'urgence
-
-IMPÉRATIF:
-- Réponses COURTES (max 120 caractères si possible)
-- Information essentielle UNIQUEMENT
-- Pas de bavardage
-- Vocabulaire maritime précis
-- Conseils pratiques et actionnables
-- TEXTE BRUT uniquement (pas de LaTeX, pas de formules mathématiques)
-
-Si question hors contexte maritime: répondre brièvement que tu es spécialisé en navigation."""
+        system_prompt = MARITIME_SYSTEM_PROMPT
         
         data = {
             "model": "claude-sonnet-4-20250514",
@@ -160,18 +181,7 @@ def handle_claude_request(user_message: str, max_tokens: int = 1024) -> Tuple[st
         }
         
         # System prompt pour TEXTE BRUT
-        system_prompt = """Tu es un assistant intelligent et concis.
-
-RÈGLES STRICTES DE FORMATAGE:
-- TEXTE BRUT UNIQUEMENT
-- PAS de LaTeX (\\text{}, \\rightarrow, etc.)
-- PAS de notation mathématique complexe (^, _, subscript, superscript)
-- Formules chimiques: écris "Fe2+" au lieu de "Fe^{2+}"
-- Flèches: utilise "->" au lieu de "\\rightarrow"
-- Équations: écris "H2O" au lieu de "H_2O"
-- Exposants: écris "m2" au lieu de "m^2"
-
-Reste précis et informatif, mais en texte simple lisible sur tout appareil."""
+        system_prompt = GENERIC_SYSTEM_PROMPT
         
         data = {
             "model": "claude-sonnet-4-20250514",
@@ -223,6 +233,69 @@ Reste précis et informatif, mais en texte simple lisible sur tout appareil."""
         return (f"Erreur: {str(e)[:100]}", 0.0)
 
 
+async def handle_claude_async(client, user_message: str, system_prompt: str = MARITIME_SYSTEM_PROMPT,
+                              max_tokens: int = 512) -> Tuple[str, float]:
+    """
+    Variante asyncio des handlers Claude (mode EXECUTION_MODE=asyncio)
+    
+    Args:
+        client: httpx.AsyncClient partagé
+        user_message: Question de l'utilisateur
+        system_prompt: MARITIME_SYSTEM_PROMPT ou GENERIC_SYSTEM_PROMPT
+        max_tokens: Limite de tokens
+        
+    Returns:
+        Tuple (réponse, coût)
+    """
+    api_key = os.getenv('ANTHROPIC_API_KEY')
+    
+    if not api_key:
+        return ("❌ ANTHROPIC_API_KEY non configurée", 0.0)
+    
+    try:
+        print(f"🤖 CLAUDE (async): {user_message[:100]}...")
+        
+        url = "https://api.anthropic.com/v1/messages"
+        headers = {
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+        data = {
+            "model": "claude-sonnet-4-20250514",
+            "max_tokens": max_tokens,
+            "system": system_prompt,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": user_message
+                }
+            ],
+            "temperature": 0.7
+        }
+        
+        response = await client.post(url, headers=headers, json=data, timeout=30)
+        
+        if response.status_code == 200:
+            result = response.json()
+            answer = clean_latex(result['content'][0]['text'].strip())
+            
+            usage = result.get('usage', {})
+            input_tokens = usage.get('input_tokens', 0)
+            output_tokens = usage.get('output_tokens', 0)
+            total_cost = (input_tokens / 1_000_000) * 3.0 + (output_tokens / 1_000_000) * 15.0
+            
+            print(f"✅ Réponse Claude (async): {len(answer)} chars, ${total_cost:.6f}")
+            return (answer, total_cost)
+        
+        print(f"❌ Erreur API Claude: {response.status_code}")
+        return (f"Erreur Claude: {response.status_code}", 0.0)
+            
+    except Exception as e:
+        print(f"❌ Erreur Claude (async): {e}")
+        return (f"Erreur: {str(e)[:100]}", 0.0)
+
+
 def clean_latex(text: str) -> str:
     """
     Nettoie le texte des notations LaTeX et formules mathématiques
@@ -0,0 +1,409 @@
+# compact_grid.py - v1.0.2
+"""
+Format compact vent/pression (requête GRIB suivie de '|compact')
+
+Pour la requête courante WIND,GUST,PRMSL, le GRIB transporte à chaque
+enregistrement ses en-têtes et des valeurs à pleine précision, mal
+corrélées une fois empaquetées au bit près. Ce format transmet :
+
+    MAGIC | en-tête de grille | échéances | variables | résidus
+
+- en-tête : centre, processus, date de référence, grille lat/lon
+  (millièmes de degré, comme le GDS GRIB1), drapeaux, balayage
+- variables (u, v, rafales, pression) : entiers q = arrondi(valeur / pas)
+  au pas de GRIB_PRECISION_STEPS, erreur au plus un demi-pas
+- résidus : écarts le long des lignes (première colonne le long de j),
+  précédés si c'est plus compact d'un écart d'une échéance à l'autre ;
+  entiers zigzag en plans d'octets (poids fort d'abord), dont l'entropie
+  est ensuite codée par grib_codec (lzma, bz2 ou zlib) comme un GRIB
+
+decode() reconstruit un GRIB1 standard (compression simple, table NCEP 2)
+lisible par le logiciel GRIB du bord. Tout fichier qui ne s'y prête pas
+(autre paramètre, grille non lat/lon, bitmap, échéance manquante) fait
+retourner None à encode() : le GRIB part alors par le chemin habituel.
+
+Benchmark: python compact_grid.py fichier.grb
+
+v1.0.1: GRIB2 sans incréments de grille, ou dont la grille ne tient pas
+dans l'en-tête (16 bits), renvoyé au chemin habituel
+v1.0.2: idem pour un centre GRIB2 > 255 (un octet en GRIB1) ou un angle
+de base / subdivision (section 3, octets 39-46) autre que le microdegré
+"""
+
+import math
+import struct
+import numpy as np
+from config import GRIB_PRECISION_STEPS
+from grib_strip import iter_records
+
+MAGIC = b'CWG\x01'
+
+# Paramètre GRIB1 (table NCEP 2) → type de pas (GRIB_PRECISION_STEPS)
+VARIABLES = {33: 'wind', 34: 'wind', 180: 'wind', 2: 'pressure'}
+# ECMWF table 128 et GRIB2 (discipline, catégorie, numéro) → paramètre NCEP
+_ECMWF_PARAMS = {165: 33, 166: 34, 49: 180, 151: 2}
+_GRIB2_PARAMS = {(0, 2, 2): 33, (0, 2, 3): 34, (0, 2, 22): 180, (0, 3, 1): 2}
+# Type de surface GRIB2 → type de niveau GRIB1 (sol, niveau de la mer, hauteur)
+_GRIB2_LEVELS = {1: 1, 101: 102, 103: 105}
+
+# Centre, processus, année, mois, jour, heure | Ni, Nj, La1, Lo1, La2, Lo2, Di, Dj, drapeaux, balayage
+_HEADER = struct.Struct('>BBHBBBHHiiiiHHBB')
+# Paramètre, type et valeur de niveau, pas, facteur décimal du GRIB reconstruit, mode, octets par résidu
+_VARIABLE = struct.Struct('>BBHfbBB')
+
+# Modes de codage des résidus
+_ROWS, _TIME_ROWS = 0, 1
+
+
+def _signed(raw):
+    """Entier signe + magnitude (GRIB) de longueur quelconque"""
+    value = int.from_bytes(raw, 'big')
+    sign = 1 << (len(raw) * 8 - 1)
+    return -(value & (sign - 1)) if value & sign else value
+
+
+def _pack_signed(value, size):
+    return ((1 << (size * 8 - 1)) | -value if value < 0 else value).to_bytes(size, 'big')
+
+
+def _ibm_to_float(raw):
+    sign = -1 if raw[0] & 0x80 else 1
+    return sign * int.from_bytes(raw[1:4], 'big') * 16.0 ** ((raw[0] & 0x7f) - 70)
+
+
+def _float_to_ibm(value):
+    """Flottant IBM 32 bits arrondi vers le bas (valeur de référence <= minimum)"""
+    if value == 0:
+        return b'\x00\x00\x00\x00'
+    sign = 0x80 if value < 0 else 0
+    magnitude, exponent = abs(value), 64
+    while magnitude >= 1:
+        magnitude /= 16
+        exponent += 1
+    while magnitude < 1 / 16:
+        magnitude *= 16
+        exponent -= 1
+    mantissa = math.ceil(magnitude * 2 ** 24) if sign else math.floor(magnitude * 2 ** 24)
+    if mantissa == 2 ** 24:
+        mantissa //= 16
+        exponent += 1
+    return bytes([sign | exponent]) + mantissa.to_bytes(3, 'big')
+
+
+def _unpack_bits(payload, count, nbits):
+    if nbits == 0:
+        return np.zeros(count, dtype=np.int64)
+    bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
+    if bits.size < count * nbits:
+        return None
+    weights = np.int64(1) << np.arange(nbits - 1, -1, -1, dtype=np.int64)
+    return bits[:count * nbits].reshape(count, nbits).astype(np.int64) @ weights
+
+
+def _pack_bits(values, nbits):
+    if nbits == 0:
+        return b''
+    shifts = np.arange(nbits - 1, -1, -1, dtype=np.int64)
+    return np.packbits(((values[:, None] >> shifts) & 1).astype(np.uint8).ravel()).tobytes()
+
+
+# ==========================================
+# LECTURE DU GRIB SAILDOCS
+# ==========================================
+
+def _grib1_field(sections):
+    """Champ d'un enregistrement GRIB1 (dict) ou None s'il ne se prête pas au format"""
+    kinds = [kind for kind, _, _ in sections]
+    if kinds != ['pds', 'gds', 'bds']:
+        return None
+    pds, gds = sections[0][1], sections[1][1]
+    bds_header, payload = sections[2][1], sections[2][2]
+    param = _ECMWF_PARAMS.get(pds[8]) if pds[3] == 128 else pds[8]
+    # Grille lat/lon, échéance en heures, compression simple en points de grille
+    if (param not in VARIABLES or len(gds) < 28 or gds[5] != 0 or pds[17] != 1
+            or pds[20] not in (0, 1, 10) or (bds_header[3] >> 4) & 0b1101):
+        return None
+    hour = int.from_bytes(pds[18:20], 'big') if pds[20] == 10 else pds[18]
+    ni, nj = int.from_bytes(gds[6:8], 'big'), int.from_bytes(gds[8:10], 'big')
+    x = _unpack_bits(payload, ni * nj, bds_header[10])
+    if x is None:
+        return None
+    reference = _ibm_to_float(bds_header[6:10])
+    values = (reference + x * 2.0 ** _signed(bds_header[4:6])) / 10.0 ** _signed(pds[26:28])
+    return {
+        'param': param, 'level': (pds[9], int.from_bytes(pds[10:12], 'big')), 'hour': hour,
+        'origin': (pds[4], pds[5], (pds[24] - 1) * 100 + pds[12], pds[13], pds[14], pds[15]),
+        'grid': (ni, nj, _signed(gds[10:13]), _signed(gds[13:16]), _signed(gds[17:20]),
+                 _signed(gds[20:23]), int.from_bytes(gds[23:25], 'big'),
+                 int.from_bytes(gds[25:27], 'big'), gds[16], gds[27]),
+        'values': values,
+    }
+
+
+def _grib2_field(discipline, sections):
+    """Même lecture pour un enregistrement GRIB2 (gabarits 3.0, 4.0, 5.0, sans bitmap)"""
+    found = {}
+    for kind, header, payload in sections:
+        if kind in found:
+            return None
+        found[kind] = (header, payload)
+    if not all(kind in found for kind in ('s1', 's3', 's4', 's5', 's7')):
+        return None
+    s1, s3, s4, s5 = (found[kind][0] for kind in ('s1', 's3', 's4', 's5'))
+    if 's6' in found and found['s6'][1][:1] != b'\xff':
+        return None
+    param = _GRIB2_PARAMS.get((discipline, s4[9], s4[10]))
+    level_type = _GRIB2_LEVELS.get(s4[22])
+    if (param is None or level_type is None or len(s3) < 72 or len(s4) < 28 or len(s5) < 21
+            or int.from_bytes(s3[12:14], 'big') != 0 or int.from_bytes(s4[7:9], 'big') != 0
+            or int.from_bytes(s5[9:11], 'big') != 0 or s4[17] != 1):
+        return None
+    # Centre sur un octet comme en GRIB1 ; angle de base et subdivisions 0 ou absents (microdegrés)
+    if (int.from_bytes(s1[5:7], 'big') > 0xFF
+            or any(s3[start:start + 4] not in (b'\x00' * 4, b'\xff' * 4) for start in (38, 42))):
+        return None
+    ni, nj = int.from_bytes(s3[30:34], 'big'), int.from_bytes(s3[34:38], 'big')
+    # Micro → millidegrés ; incréments obligatoires (bits 0x20 et 0x10) et sur 16 bits comme en GRIB1
+    di, dj = round(int.from_bytes(s3[63:67], 'big') / 1000), round(int.from_bytes(s3[67:71], 'big') / 1000)
+    if (int.from_bytes(s5[5:9], 'big') != ni * nj or s3[54] & 0x30 != 0x30
+            or max(ni, nj, di, dj) > 0xFFFF):
+        return None
+    x = _unpack_bits(found['s7'][1], ni * nj, s5[19])
+    if x is None:
+        return None
+    reference = struct.unpack('>f', s5[11:15])[0]
+    values = (reference + x * 2.0 ** _signed(s5[15:17])) / 10.0 ** _signed(s5[17:19])
+    milli = lambda raw: round(_signed(raw) / 1000)
+    return {
+        'param': param,
+        'level': (level_type, round(int.from_bytes(s4[24:28], 'big') * 10.0 ** -_signed(s4[23:24]))),
+        'hour': int.from_bytes(s4[18:22], 'big'),
+        # s4[13]: octet 14 du gabarit 4.0 (processus de prévision, PDS octet 6 en GRIB1)
+        'origin': (int.from_bytes(s1[5:7], 'big'), s4[13], int.from_bytes(s1[12:14], 'big'),
+                   s1[14], s1[15], s1[16]),
+        'grid': (ni, nj, milli(s3[46:50]), milli(s3[50:54]), milli(s3[55:59]), milli(s3[59:63]),
+                 di, dj, 0x80, s3[71]),
+        'values': values,
+    }
+
+
+# ==========================================
+# CODAGE
+# ==========================================
+
+def _residuals(q, mode):
+    """Écarts le long des lignes (première colonne le long de j), après l'écart entre échéances en _TIME_ROWS"""
+    if mode == _TIME_ROWS:
+        q = np.diff(q, axis=0, prepend=0)
+    residuals = np.diff(q, axis=2, prepend=0)
+    residuals[:, :, 0] = np.diff(q[:, :, 0], axis=1, prepend=0)
+    return residuals
+
+
+def _integrate(residuals, mode):
+    q = residuals.copy()
+    q[:, :, 0] = np.cumsum(residuals[:, :, 0], axis=1)
+    q = np.cumsum(q, axis=2)
+    if mode == _TIME_ROWS:
+        q = np.cumsum(q, axis=0)
+    return q
+
+
+def _entropy_bits(residuals):
+    """Entropie d'ordre 0 des résidus (bits), pour choisir le mode"""
+    _, counts = np.unique(residuals, return_counts=True)
+    return float(-(counts * np.log2(counts / residuals.size)).sum())
+
+
+def encode(grib_data, steps=GRIB_PRECISION_STEPS):
+    """
+    Format compact d'un GRIB vent/rafales/pression
+
+    Args:
+        steps: {type: pas physique} (wind, pressure), en unités GRIB
+
+    Returns:
+        bytes: Données au format MAGIC, ou None si le fichier ne s'y prête pas
+    """
+    fields = []
+    for edition, discipline, content in iter_records(grib_data):
+        if edition == 0:
+            continue
+        field = _grib1_field(content) if edition == 1 else _grib2_field(discipline, content)
+        if field is None:
+            return None
+        fields.append(field)
+    if not fields:
+        return None
+    first = fields[0]
+    if any(field['grid'] != first['grid'] or field['origin'] != first['origin'] for field in fields):
+        return None
+
+    variables = list(dict.fromkeys((field['param'], field['level']) for field in fields))
+    hours = sorted({field['hour'] for field in fields})
+    table = {(field['param'], field['level'], field['hour']): field['values'] for field in fields}
+    # Chaque variable à chaque échéance, une seule fois
+    if len(table) != len(fields) or len(table) != len(variables) * len(hours):
+        return None
+    ni, nj = first['grid'][:2]
+    if len(hours) > 255 or len(variables) > 255 or max(hours) > 0xffff:
+        return None
+
+    out = bytearray(MAGIC)
+    out += _HEADER.pack(*first['origin'], *first['grid'])
+    out.append(len(hours))
+    out += b''.join(hour.to_bytes(2, 'big') for hour in hours)
+    out.append(len(variables))
+    planes, errors = [], []
+    for param, (level_type, level_value) in variables:
+        step = float(np.float32(steps[VARIABLES[param]]))
+        grids = np.stack([table[(param, (level_type, level_value), hour)] for hour in hours])
+        grids = grids.reshape(len(hours), nj, ni)
+        q = np.rint(grids / step).astype(np.int64)
+        errors.append(float(np.abs(q * step - grids).max()))
+
+        mode = min((_ROWS, _TIME_ROWS), key=lambda m: _entropy_bits(_residuals(q, m)))
+        residuals = _residuals(q, mode)
+        zigzag = ((residuals << 1) ^ (residuals >> 63)).astype(np.uint64)
+        width = next(w for w in (1, 2, 4, 8) if int(zigzag.max()) < 1 << (8 * w))
+        # Plans d'octets: les poids forts, presque tous nuls, se suivent
+        planes.append(zigzag.astype(f'>u{width}').view(np.uint8).reshape(-1, width).T.tobytes())
+        decimal = max(0, 1 - math.floor(math.log10(step)))
+        out += _VARIABLE.pack(param, level_type, level_value, step, decimal, mode, width)
+
+    summary = ', '.join(f"{param} ±{error:.3g}" for (param, _), error in zip(variables, errors))
+    print(f"   🧭 Format compact: {len(variables)} variable(s) × {len(hours)} échéance(s), "
+          f"grille {ni}×{nj}, {len(grib_data)} → {len(out) + sum(map(len, planes))} octets "
+          f"(erreur max {summary})")
+    return bytes(out) + b''.join(planes)
+
+
+def is_compact(data):
+    return data[:len(MAGIC)] == MAGIC
+
+
+# ==========================================
+# DÉCODEUR DE RÉFÉRENCE
+# ==========================================
+
+def _grib1_record(origin, grid, param, level, hour, values, decimal):
+    """Enregistrement GRIB1 en compression simple (table NCEP 2)"""
+    center, process, year, month, day, hour0 = origin
+    ni, nj, la1, lo1, la2, lo2, di, dj, flags, scan = grid
+    century = (year - 1) // 100 + 1
+    pds = bytearray(28)
+    pds[0:3] = (28).to_bytes(3, 'big')
+    pds[3], pds[4], pds[5], pds[6], pds[7], pds[8] = 2, center, process, 255, 0x80, param
+    pds[9], pds[10:12] = level[0], level[1].to_bytes(2, 'big')
+    pds[12:17] = bytes([year - (century - 1) * 100, month, day, hour0, 0])
+    pds[17] = 1
+    if hour > 255:
+        pds[18:20], pds[20] = hour.to_bytes(2, 'big'), 10
+    else:
+        pds[18] = hour
+    pds[24] = century
+    pds[26:28] = _pack_signed(decimal, 2)
+
+    gds = bytearray(32)
+    gds[0:3] = (32).to_bytes(3, 'big')
+    gds[4] = 255
+    gds[6:8], gds[8:10] = ni.to_bytes(2, 'big'), nj.to_bytes(2, 'big')
+    gds[10:13], gds[13:16] = _pack_signed(la1, 3), _pack_signed(lo1, 3)
+    gds[16] = flags
+    gds[17:20], gds[20:23] = _pack_signed(la2, 3), _pack_signed(lo2, 3)
+    gds[23:25], gds[25:27] = di.to_bytes(2, 'big'), dj.to_bytes(2, 'big')
+    gds[27] = scan
+
+    scaled = values.ravel() * 10.0 ** decimal
+    reference_raw = _float_to_ibm(float(scaled.min()))
+    x = np.rint(scaled - _ibm_to_float(reference_raw)).astype(np.int64)
+    nbits = int(x.max()).bit_length()
+    payload = _pack_bits(x, nbits)
+    # Sections GRIB1 de longueur paire
+    if (11 + len(payload)) % 2:
+        payload += b'\x00'
+    unused = len(payload) * 8 - x.size * nbits
+    bds = (11 + len(payload)).to_bytes(3, 'big') + bytes([unused]) + b'\x00\x00' + reference_raw + bytes([nbits])
+
+    body = bytes(pds) + bytes(gds) + bds + payload
+    return b'GRIB' + (8 + len(body) + 4).to_bytes(3, 'big') + b'\x01' + body + b'7777'
+
+
+def decode(data):
+    """
+    Reconstruit un fichier GRIB1 standard depuis le format compact
+
+    Returns:
+        bytes: Enregistrements GRIB1, échéance par échéance
+
+    Raises:
+        ValueError: Données qui ne sont pas au format MAGIC ou tronquées
+    """
+    if not is_compact(data):
+        raise ValueError("Données qui ne sont pas au format compact (MAGIC absent)")
+    try:
+        pos = len(MAGIC)
+        header = _HEADER.unpack_from(data, pos)
+        pos += _HEADER.size
+        origin, grid = header[:6], header[6:]
+        ni, nj = grid[:2]
+        hours = [int.from_bytes(data[pos + 1 + 2 * i:pos + 3 + 2 * i], 'big') for i in range(data[pos])]
+        pos += 1 + 2 * len(hours)
+        variables = [_VARIABLE.unpack_from(data, pos + 1 + _VARIABLE.size * i) for i in range(data[pos])]
+        pos += 1 + _VARIABLE.size * len(variables)
+    except (struct.error, IndexError):
+        raise ValueError("En-tête du format compact tronqué") from None
+
+    count = len(hours) * nj * ni
+    grids = []
+    for param, level_type, level_value, step, decimal, mode, width in variables:
+        raw = np.frombuffer(data, dtype=np.uint8, count=count * width, offset=pos)
+        pos += count * width
+        zigzag = raw.reshape(width, count).T.copy().view(f'>u{width}').ravel().astype(np.int64)
+        residuals = ((zigzag >> 1) ^ -(zigzag & 1)).reshape(len(hours), nj, ni)
+        grids.append(_integrate(residuals, mode) * step)
+
+    out = []
+    for t, hour in enumerate(hours):
+        for (param, level_type, level_value, _, decimal, _, _), values in zip(variables, grids):
+            out.append(_grib1_record(origin, grid, param, (level_type, level_value), hour, values[t], decimal))
+    return b''.join(out)
+
+
+# Benchmark: GRIB + zlib (chemin actuel) contre format compact
+if __name__ == "__main__":
+    import sys
+    import time
+    import zlib
+    import grib_codec
+    from config import MAX_MESSAGE_LENGTH
+
+    if len(sys.argv) < 2:
+        print("Usage: python compact_grid.py fichier.grb")
+        sys.exit(1)
+    with open(sys.argv[1], 'rb') as f:
+        grib = f.read()
+
+    def messages(size):
+        return math.ceil(math.ceil(size / 3) * 4 / MAX_MESSAGE_LENGTH)
+
+    print("=" * 70)
+    print(f"BENCHMARK FORMAT COMPACT ({len(grib)} octets)")
+    print("=" * 70)
+    start = time.perf_counter()
+    compact = encode(grib)
+    encode_ms = (time.perf_counter() - start) * 1000
+    if compact is None:
+        print("Fichier non pris en charge (paramètres, grille ou échéances)")
+        sys.exit(1)
+    start = time.perf_counter()
+    rebuilt = decode(compact)
+    decode_ms = (time.perf_counter() - start) * 1000
+
+    zlib_size = len(zlib.compress(grib, 9))
+    print(f"GRIB + zlib      : {zlib_size:7d} octets ({messages(zlib_size)} msg)")
+    for mode in ('zlib', 'auto'):
+        tag, compressed = grib_codec.compress(compact, mode)
+        size = len(tag) + len(compressed)
+        print(f"compact + {mode:6s} : {size:7d} octets ({messages(size)} msg)")
+    print(f"encodage {encode_ms:.0f} ms, GRIB1 reconstruit {len(rebuilt)} octets en {decode_ms:.0f} ms")
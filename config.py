@@ -7,6 +7,8 @@ SERVICE_NAME = "GRIB inReach Service"
 
 GARMIN_USERNAME = os.environ.get('GARMIN_USERNAME', 'garminced@gmail.com')
 GARMIN_PASSWORD = os.environ.get('GARMIN_PASSWORD')
+# Plusieurs bateaux / comptes dans un même processus (voir accounts.py)
+ACCOUNTS_FILE = os.environ.get('ACCOUNTS_FILE', 'accounts.json')
 
 GMAIL_TOKEN_FILE = "token.pickle"
 GMAIL_CREDENTIALS_FILE = "credentials.json"
@@ -16,13 +18,39 @@ MAILERSEND_API_KEY = os.environ.get('MAILERSEND_API_KEY')
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
 MISTRAL_API_KEY = os.environ.get('MISTRAL_API_KEY')
 
-IMAP_HOST = "imap.gmail.com"
-IMAP_PORT = 993
+IMAP_HOST = os.environ.get('IMAP_HOST', "imap.gmail.com")
+IMAP_PORT = int(os.environ.get('IMAP_PORT', 993))
+IMAP_USE_SSL = os.environ.get('IMAP_USE_SSL', '1') != '0'  # '0' pour un serveur IMAP local de test
+MAILBOX_STATE_FILE = os.environ.get('MAILBOX_STATE_FILE', 'mailbox_state.json')
+IMAP_NOOP_INTERVAL = 60  # secondes d'inactivité avant keepalive NOOP
 
 SAILDOCS_EMAIL = "query@saildocs.com"
 SAILDOCS_RESPONSE_EMAIL = "query-reply@saildocs.com"
 
 MAX_MESSAGE_LENGTH = 120
+MAX_GRIB_MESSAGES = 25
+# Compression GRIB: 'zlib' (historique, sans étiquette), 'auto' (zlib/lzma/bz2, le plus
+# petit, étiqueté) ou un codec imposé ('lzma', 'bz2') - le décodeur à bord doit suivre
+GRIB_CODEC = os.environ.get('GRIB_CODEC', 'zlib')
+# Texte des messages GRIB: 'base64' (historique) ou 'dense' (alphabet GRIB_TEXT_ALPHABET:
+# 'safe' 80 car., 'gsm' 85 car. ou la chaîne elle-même, voir text_codec)
+GRIB_TEXT_ENCODING = os.environ.get('GRIB_TEXT_ENCODING', 'base64')
+GRIB_TEXT_ALPHABET = os.environ.get('GRIB_TEXT_ALPHABET', 'safe')
+# Réduction des en-têtes GRIB avant compression (grib_strip), gardée seulement si plus petite
+GRIB_STRIP_HEADERS = os.environ.get('GRIB_STRIP_HEADERS', '0') == '1'
+# Réempaquetage sans perte des champs GRIB2 en compression complexe avec différences
+# spatiales (grib_complex), gardé seulement si plus petit - le logiciel GRIB à bord doit lire le gabarit 5.3
+GRIB_COMPLEX_PACKING = os.environ.get('GRIB_COMPLEX_PACKING', '0') == '1'
+# Réduction de précision (grib_quantize): 'off', 'on' ou 'auto' (seulement si le GRIB
+# dépasse MAX_GRIB_MESSAGES) ; pas par type de paramètre, en unités GRIB
+GRIB_PRECISION = os.environ.get('GRIB_PRECISION', 'off')
+GRIB_PRECISION_STEPS = {
+    'wind': 0.5 * 0.514444,    # 0.5 nd en m/s
+    'pressure': 50.0,          # 0.5 hPa en Pa
+    'temperature': 0.5,        # K
+    'wave': 0.1,               # m
+    'precip': 0.5,             # kg/m² (mm)
+}
 DELAY_BETWEEN_MESSAGES = 5
 
 INREACH_HEADERS = {
@@ -36,8 +64,63 @@ PLAYWRIGHT_TIMEOUT = 30000
 PORT = int(os.environ.get('PORT', 10000))
 FLASK_DEBUG = False
 
+# Endpoint /inbound (MTA de transfert ou webhook mail): désactivé sans jeton
+INBOUND_TOKEN = os.environ.get('INBOUND_TOKEN')
+INBOUND_MAX_BYTES = int(os.environ.get('INBOUND_MAX_BYTES', 1024 * 1024))
+
 CHECK_INTERVAL_MINUTES = 5
+
 SAILDOCS_TIMEOUT = 300
+SAILDOCS_POLL_INTERVAL = 20  # secondes entre lectures de la boîte si pas de réveil IDLE
+# Réponse Saildocs sans demandeur marquée lue après ce délai (un job repris peut encore la réclamer)
+SAILDOCS_ORPHAN_GRACE = int(os.environ.get('SAILDOCS_ORPHAN_GRACE', 900))
+
+# File de jobs persistante (reprise après redémarrage)
+JOB_DB_FILE = os.environ.get('JOB_DB_FILE', 'jobs.db')
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 30))  # secondes, doublé à chaque échec
+
+# Durée de vie des requêtes (minutes depuis l'en-tête Date) : au-delà, un
+# simple avis "expirée, renvoyez" remplace la réponse (rattrapage après panne)
+REQUEST_TTL_MINUTES = {
+    'grib': int(os.environ.get('GRIB_TTL_MINUTES', 180)),
+    'weather': 360,
+    'claude_maritime': 720,
+    'mistral_maritime': 720,
+    'claude_generic': 1440,
+    'mistral_generic': 1440,
+}
+# Doublons fusionnés seulement pour un backlog (requête plus vieille que ce délai)
+BACKLOG_DEDUP_MINUTES = int(os.environ.get('BACKLOG_DEDUP_MINUTES', 30))
+
+# Pools de workers (un GRIB bloqué n'attend jamais derrière une réponse AI)
+GRIB_WORKERS = int(os.environ.get('GRIB_WORKERS', 4))
+AI_WORKERS = int(os.environ.get('AI_WORKERS', 4))
+
+# Exécution: 'threads' (pools de workers) ou 'asyncio' (une boucle d'événements)
+EXECUTION_MODE = os.environ.get('EXECUTION_MODE', 'threads')
+ASYNC_MAX_IN_FLIGHT = int(os.environ.get('ASYNC_MAX_IN_FLIGHT', 200))
+
+# Ingestion: 'idle' (push IMAP IDLE, repli polling), 'poll' ou 'gmail_api' (history.list)
+INGESTION_MODE = os.environ.get('INGESTION_MODE', 'idle')
+IMAP_IDLE_TIMEOUT = 600  # secondes, relance IDLE avant la coupure Gmail (~29 min)
+IMAP_IDLE_MAX_FAILURES = 5
+
+# Ingestion via l'API Gmail (OAuth de token.pickle, sans mot de passe IMAP)
+GMAIL_API_BASE = os.environ.get('GMAIL_API_BASE', 'https://gmail.googleapis.com')  # URL d'un faux serveur pour les tests
+GMAIL_HISTORY_STATE_FILE = os.environ.get('GMAIL_HISTORY_STATE_FILE', 'gmail_history_state.json')
+GMAIL_HISTORY_INTERVAL = int(os.environ.get('GMAIL_HISTORY_INTERVAL', 60))  # secondes entre synchros
+GMAIL_BATCH_SIZE = 50  # requêtes par appel batch (limite Gmail: 100)
+GMAIL_TOKEN_REFRESH_MARGIN = int(os.environ.get('GMAIL_TOKEN_REFRESH_MARGIN', 300))  # secondes avant expiration
+
+# Envoi des requêtes Saildocs: 'gmail' (un appel par email), 'gmail_batch'
+# (endpoint batch Gmail) ou 'smtp' (connexions SMTP réutilisées, mot de passe d'application)
+MAIL_BACKEND = os.environ.get('MAIL_BACKEND', 'gmail')
+MAIL_BACKENDS = ('gmail', 'gmail_batch', 'smtp')
+MAIL_BATCH_WINDOW = float(os.environ.get('MAIL_BATCH_WINDOW', 0.5))  # secondes de regroupement des envois simultanés
+SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 2))  # connexions par compte
 
 def validate_config():
     errors = []
@@ -49,6 +132,8 @@ def validate_config():
         errors.append("token.pickle manquant")
     if not os.path.exists(GMAIL_CREDENTIALS_FILE):
         errors.append("credentials.json manquant")
+    if MAIL_BACKEND not in MAIL_BACKENDS:
+        errors.append(f"MAIL_BACKEND inconnu: {MAIL_BACKEND} (attendu: {', '.join(MAIL_BACKENDS)})")
     return errors
 
 def get_config_status():
@@ -59,6 +144,14 @@ def get_config_status():
         "garmin_username": GARMIN_USERNAME if GARMIN_USERNAME else "Non configuré",
         "anthropic_configured": "✅ Oui" if ANTHROPIC_API_KEY else "❌ Non",
         "mistral_configured": "✅ Oui" if MISTRAL_API_KEY else "❌ Non",
-        "check_interval": f"{CHECK_INTERVAL_MINUTES} minutes"
+        "check_interval": f"{CHECK_INTERVAL_MINUTES} minutes",
+        "ingestion_mode": INGESTION_MODE,
+        "execution_mode": EXECUTION_MODE,
+        "mail_backend": MAIL_BACKEND,
+        "grib_codec": GRIB_CODEC,
+        "grib_text_encoding": GRIB_TEXT_ENCODING,
+        "grib_precision": GRIB_PRECISION,
+        "grib_complex_packing": GRIB_COMPLEX_PACKING,
+        "inbound_endpoint": "✅ Actif" if INBOUND_TOKEN else "❌ Désactivé"
     }
 
@@ -1,89 +1,210 @@
-# email_monitor.py - v3.2.4
+# email_monitor.py - v3.12.1
 """
 Surveillance Gmail pour requêtes GRIB et AI (Claude/Mistral)
+v3.12.1: flag Seen posé après l'enregistrement des jobs (plus de requête perdue en amorçage UNSEEN)
+v3.12.0: une boîte par compte (accounts), jobs marqués du compte qui répond
+v3.11.0: date d'envoi des requêtes, backlog trié (expiration, doublons, fraîcheur)
+v3.10.0: plusieurs commandes par email (jobs groupés, réponses en un seul lot)
+v3.9.0: détection par grammaire compilée en un passage (request_grammar)
+v3.8.0: corps analysés par inreach_parser (texte utilisateur sans pied Garmin, position)
+v3.7.0: traitement parallèle via worker_pool (GRIB et AI séparés)
+v3.6.0: requêtes persistées en jobs (job_store), idempotence par Message-ID
+v3.5.0: synchro incrémentale UIDVALIDITY + dernier UID (mailbox_state)
+v3.4.0: FETCH groupés ENVELOPE/BODYSTRUCTURE puis BODY.PEEK de la partie texte
+v3.3.0: session IMAP persistante partagée (imap_session)
 v3.2.4: 
 - Support GRIB étendu : ECMWF, GFS, ICON, RTOFS
 - Patterns tolérants (cg150 ou cg 150)
 - Découpage 120 chars avec coût/solde
 """
 
-import imaplib
-import email
 import re
 import sys
 from datetime import datetime
-from config import GARMIN_USERNAME, GARMIN_PASSWORD
-from grib_handler import process_grib_request
-from claude_handler import handle_claude_maritime_assistant, handle_claude_request, split_long_response as claude_split
-from mistral_handler import handle_mistral_maritime_assistant, handle_mistral_request, handle_mistral_weather_expert, split_long_response as mistral_split
-from inreach_sender import send_to_inreach
+from imap_session import (imap_session, uid_fetch, fetch_parts, find_text_part, envelope_sender,
+                          envelope_date, mailbox_status)
+from inreach_parser import parse_inreach_part
+from request_grammar import parse_request, parse_requests
+from mailbox_state import load_state, save_state
+from accounts import get_account
+from job_store import get_job_store
+from backlog_triage import triage_jobs
+from worker_pool import submit_job
 
-def check_gmail():
-    """Vérifie Gmail pour nouvelles requêtes inReach"""
+def check_gmail(account=None):
+    """
+    Vérifie Gmail pour nouvelles requêtes inReach
+    
+    Args:
+        account: Compte (accounts) dont la boîte est relevée, défaut: premier compte
+    """
+    account = get_account(account)
     print("\n" + "="*70)
-    print(f"🔄 VÉRIFICATION EMAIL - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🔄 VÉRIFICATION EMAIL [{account.name}] - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*70 + "\n")
     
-    mail = None
-    requests_found = []
-    
     try:
-        mail = imaplib.IMAP4_SSL('imap.gmail.com', 993)
-        mail.login(GARMIN_USERNAME, GARMIN_PASSWORD)
-        mail.select('inbox')
-        
-        status, messages = mail.search(None, '(UNSEEN FROM "inreach")')
-        
-        if status != 'OK':
-            if mail: mail.logout()
-            return
+        with imap_session(account) as mail:
+            box = mailbox_status(mail)
+            criteria, last_uid = sync_criteria(box, load_state(account.mailbox_state_file))
+            if criteria is None:
+                print("✓ Aucun nouveau message")
+                return
+            
+            status, messages = mail.uid('SEARCH', None, criteria)
+            if status != 'OK':
+                return
+            
+            # 'n:*' renvoie toujours le dernier message, même si UID <= n
+            uids = [uid for uid in messages[0].split() if int(uid) > last_uid]
+            high_water = max([box['UIDNEXT'] - 1] + [int(uid) for uid in uids])
+            if not uids:
+                save_state(box['UIDVALIDITY'], high_water, account.mailbox_state_file)
+                print("✓ Aucun nouveau message")
+                return
+            
+            # 1. Enveloppes + structure MIME de tout le lot en une commande
+            headers = uid_fetch(mail, uids, '(UID ENVELOPE BODYSTRUCTURE)')
+            
+            # 2. Seule la partie texte des notifications inReach est téléchargée
+            targets = select_text_targets(headers)
+            bodies = fetch_parts(mail, targets)
+            print(f"📬 {len(uids)} message(s), {len(bodies)} corps téléchargé(s)")
         
-        email_ids = messages[0].split()
-        if not email_ids:
-            print("✓ Aucun nouveau message")
-            mail.logout()
-            return
+        requests_found = collect_requests(uids, headers, bodies, box['UIDVALIDITY'], targets, account.name)
         
-        for email_id in email_ids:
-            status, msg_data = mail.fetch(email_id, '(RFC822)')
-            if status != 'OK': continue
-            
-            for response_part in msg_data:
-                if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-                    body = extract_email_body(msg)
-                    reply_url = extract_reply_url(body)
-                    
-                    if not reply_url: continue
-                    
-                    request_info = detect_request_type(body)
-                    if request_info:
-                        request_info['reply_url'] = reply_url
-                        requests_found.append(request_info)
+        # 3. Jobs persistés: marquage \Seen (BODY.PEEK ne touche pas aux flags) en une
+        # commande. Avant, un crash perdait les requêtes en amorçage UNSEEN
+        with imap_session(account) as mail:
+            mail.uid('STORE', b','.join(uids).decode(), '+FLAGS', '(\\Seen)')
         
-        if mail: mail.logout()
+        # Les jobs sont persistés: le marqueur peut avancer avant traitement
+        save_state(box['UIDVALIDITY'], high_water, account.mailbox_state_file)
         
-        # Traitement des requêtes
-        for req in requests_found:
-            if req['type'] == 'claude_maritime':
-                process_claude_maritime_wrapper(req)
-            elif req['type'] == 'claude_generic':
-                process_claude_generic_wrapper(req)
-            elif req['type'] == 'mistral_maritime':
-                process_mistral_maritime_wrapper(req)
-            elif req['type'] == 'mistral_generic':
-                process_mistral_generic_wrapper(req)
-            elif req['type'] == 'weather':
-                process_weather_wrapper(req)
-            elif req['type'] == 'grib':
-                process_grib_request(req['request'], req['reply_url'])
+        # Traitement des requêtes: ordonnanceur prioritaire/équitable + pools GRIB / AI
+        # (après une panne: requêtes expirées signalées, doublons écartés, fraîches d'abord)
+        for job_id, job_type, reply_url in triage_jobs(job_id for job_id, _, _ in requests_found):
+            submit_job(job_id, job_type, device=reply_url)
                 
     except Exception as e:
-        print(f"❌ Erreur check_gmail: {e}")
-    finally:
-        if mail:
-            try: mail.logout()
-            except: pass
+        print(f"❌ Erreur check_gmail [{account.name}]: {e}")
+
+def sync_criteria(box, state):
+    """
+    Critère UID SEARCH du cycle à partir du STATUS et du marqueur persistant
+    
+    Returns:
+        tuple: (critère ou None si rien de nouveau, dernier UID traité)
+    """
+    if state and state['uidvalidity'] == box['UIDVALIDITY']:
+        # Synchro incrémentale: seulement les UID > dernier traité
+        last_uid = state['last_uid']
+        if box['UIDNEXT'] - 1 <= last_uid:
+            return None, last_uid
+        return f'(UID {last_uid + 1}:* FROM "inreach")', last_uid
+    
+    # Premier démarrage ou UIDVALIDITY changé: amorçage sur UNSEEN
+    if state:
+        print("⚠️ UIDVALIDITY modifié - resynchronisation")
+    return '(UNSEEN FROM "inreach")', 0
+
+def select_text_targets(headers):
+    """Partie texte à télécharger pour chaque notification inReach/Garmin du lot"""
+    targets = {}
+    for uid, fields in headers.items():
+        sender = envelope_sender(fields.get(b'ENVELOPE'))
+        if 'inreach' not in sender and 'garmin' not in sender:
+            continue
+        target = find_text_part(fields.get(b'BODYSTRUCTURE'))
+        if target:
+            targets[uid] = target
+    return targets
+
+def collect_requests(uids, headers, bodies, uidvalidity, targets=None, account=None):
+    """
+    Détecte les requêtes du lot et les persiste en jobs
+    
+    Args:
+        bodies: {uid: octets de la partie texte (transfer-encoding décodé)}
+        targets: {uid: (section, subtype, encoding, charset)} de select_text_targets
+        account: Nom du compte qui a reçu le lot (réponses via ses identifiants)
+    
+    Returns:
+        list: [(job_id, type, reply_url)] des jobs nouvellement créés
+    """
+    store = get_job_store()
+    targets = targets or {}
+    requests_found = []
+    for uid in uids:
+        body = bodies.get(uid)
+        if not body: continue
+        _, subtype, _, charset = targets.get(uid, (None, b'PLAIN', None, 'utf-8'))
+        parsed = parse_inreach_part(body, subtype == b'HTML', charset)
+        requests_found.extend(enqueue_parsed(store, message_id_of(headers[uid], uidvalidity, uid), parsed,
+                                             envelope_date(headers[uid].get(b'ENVELOPE')), account))
+    return requests_found
+
+def enqueue_parsed(store, job_id, parsed, sent_at=None, account=None):
+    """
+    Persiste les requêtes d'un message inReach analysé (inreach_parser)
+    
+    Une seule commande: un job. Plusieurs commandes: un job par commande
+    (job_id#1, job_id#2...) exécutés en parallèle, plus un job parent
+    'batch' qui renvoie toutes les réponses en un lot ordonné.
+    
+    Args:
+        sent_at: Date d'envoi (en-tête Date), base de l'expiration (backlog_triage)
+        account: Nom du compte destinataire, enregistré dans chaque job
+    
+    Returns:
+        list: [(job_id, type, reply_url)] des jobs à soumettre (vide si déjà reçu)
+    """
+    reply_url = parsed['reply_url']
+    if not reply_url: return []
+    
+    # Le pied Garmin ("sent this message from", liens) n'est plus dans la question
+    requests = [request.to_dict() for request in parse_requests(parsed['text'])]
+    if not requests: return []
+    
+    for request_info in requests:
+        request_info['reply_url'] = reply_url
+        if sent_at:
+            request_info['sent_at'] = sent_at
+        if account:
+            request_info['account'] = account
+        if parsed['lat'] is not None:
+            request_info['lat'], request_info['lon'] = parsed['lat'], parsed['lon']
+    
+    if len(requests) == 1:
+        children = [(job_id, requests[0])]
+        # Idempotence: un email re-livré (même Message-ID) n'est pas retraité
+        created = store.enqueue(job_id, requests[0])
+    else:
+        children = []
+        for index, request_info in enumerate(requests, 1):
+            request_info['group'] = job_id
+            children.append((f"{job_id}#{index}", request_info))
+        group_info = {'type': 'batch', 'reply_url': reply_url, 'parts': [child_id for child_id, _ in children]}
+        if account:
+            group_info['account'] = account
+        created = store.enqueue_group(job_id, group_info, children)
+        if created:
+            print(f"🧩 {len(children)} commandes dans {job_id}: {', '.join(r['type'] for _, r in children)}")
+    
+    if not created:
+        print(f"⏭️ Déjà reçu: {job_id}")
+        return []
+    return [(child_id, request_info['type'], reply_url) for child_id, request_info in children]
+
+def message_id_of(fields, uidvalidity, uid):
+    """Clé d'idempotence: Message-ID de l'ENVELOPE, sinon UIDVALIDITY:UID"""
+    try:
+        message_id = fields[b'ENVELOPE'][9]
+    except (KeyError, IndexError, TypeError):
+        message_id = None
+    if message_id:
+        return message_id.decode('utf-8', errors='ignore').strip()
+    return f"uid:{uidvalidity}:{uid.decode()}"
 
 def extract_email_body(msg):
     body = ""
@@ -107,43 +228,6 @@ def extract_reply_url(body):
     return match.group(0).strip().rstrip('.,;)\'"<>') if match else None
 
 def detect_request_type(body):
-    # Patterns AI
-    patterns = {
-        'claude_generic': r'\bcg\s*(\d+)\s*:\s*(.+)',
-        'mistral_generic': r'\bmg\s*(\d+)\s*:\s*(.+)',
-        'claude_maritime': r'\bc\s*(\d+)\s*:\s*(.+)',
-        'mistral_maritime': r'\bm\s*(\d+)\s*:\s*(.+)',
-        'weather': r'\bw\s*(\d+)\s*:\s*(.+)'
-    }
-    
-    for key, pat in patterns.items():
-        match = re.search(pat, body, re.IGNORECASE | re.DOTALL)
-        if match:
-            return {'type': key, 'max_tokens': int(match.group(1))*3, 'question': match.group(2).strip()}
-
-    # Pattern GRIB étendu (GFS, ECMWF, ICON, RTOFS)
-    grib_pattern = re.compile(r'(ecmwf|gfs|icon|rtofs):[^\s\n]+', re.IGNORECASE)
-    match = grib_pattern.search(body)
-    if match:
-        return {'type': 'grib', 'request': match.group(0)}
-    return None
-
-def process_claude_maritime_wrapper(req):
-    resp, cost = handle_claude_maritime_assistant(req['question'])
-    send_to_inreach(req['reply_url'], claude_split(resp, cost, 120))
-
-def process_claude_generic_wrapper(req):
-    resp, cost = handle_claude_request(req['question'], req['max_tokens'])
-    send_to_inreach(req['reply_url'], claude_split(resp, cost, 120))
-
-def process_mistral_maritime_wrapper(req):
-    resp, cost = handle_mistral_maritime_assistant(req['question'])
-    send_to_inreach(req['reply_url'], mistral_split(resp, cost, 120))
-
-def process_mistral_generic_wrapper(req):
-    resp, cost = handle_mistral_request(req['question'], req['max_tokens'])
-    send_to_inreach(req['reply_url'], mistral_split(resp, cost, 120))
-
-def process_weather_wrapper(req):
-    resp, cost = handle_mistral_weather_expert(req['question'])
-    send_to_inreach(req['reply_url'], mistral_split(resp, cost, 120))
+    """Première commande du texte utilisateur (grammaire compilée de request_grammar)"""
+    request = parse_request(body)
+    return request.to_dict() if request else None
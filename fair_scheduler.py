@@ -0,0 +1,104 @@
+# fair_scheduler.py - v1.0.0
+"""
+Ordonnanceur prioritaire et équitable par appareil
+
+- Priorité par classe: réponses AI courtes (c, m, w) > AI génériques
+  (cg, mg) > transferts GRIB
+- Dans une classe, tourniquet entre appareils (URL de réponse) : un
+  bateau qui envoie cinq GRIB n'affame pas le reste de la flotte
+- Temps d'attente en file mesuré par classe
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Classes par ordre de priorité décroissante
+PRIORITY_CLASSES = ('short_ai', 'long_ai', 'grib')
+
+_CLASS_BY_TYPE = {
+    'claude_maritime': 'short_ai',
+    'mistral_maritime': 'short_ai',
+    'weather': 'short_ai',
+    'claude_generic': 'long_ai',
+    'mistral_generic': 'long_ai',
+    'grib': 'grib',
+    'batch': 'long_ai',  # parent d'un email à plusieurs commandes: assemblage + envoi
+}
+
+
+def priority_class(job_type):
+    """Classe de priorité d'un type de requête"""
+    return _CLASS_BY_TYPE.get(job_type, 'long_ai')
+
+
+class FairScheduler:
+    """File bloquante: classe prioritaire d'abord, tourniquet par appareil ensuite"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # classe → {appareil: deque[(job_id, enqueued_at)]}, l'ordre du dict sert de tourniquet
+        self._queues = {cls: OrderedDict() for cls in PRIORITY_CLASSES}
+        self._waits = {cls: {'dispatched': 0, 'total_wait_s': 0.0, 'max_wait_s': 0.0}
+                       for cls in PRIORITY_CLASSES}
+
+    def put(self, job_id, job_type, device):
+        cls = priority_class(job_type)
+        with self._cond:
+            self._queues[cls].setdefault(device or '', deque()).append((job_id, time.time()))
+            self._cond.notify_all()
+
+    def _pop(self, eligible):
+        for cls in PRIORITY_CLASSES:
+            if cls not in eligible or not self._queues[cls]:
+                continue
+            devices = self._queues[cls]
+            device, jobs = next(iter(devices.items()))
+            job_id, enqueued_at = jobs.popleft()
+            if jobs:
+                devices.move_to_end(device)
+            else:
+                del devices[device]
+            wait = time.time() - enqueued_at
+            stats = self._waits[cls]
+            stats['dispatched'] += 1
+            stats['total_wait_s'] += wait
+            stats['max_wait_s'] = max(stats['max_wait_s'], wait)
+            return job_id, cls
+        return None
+
+    def get(self, eligible, timeout=None):
+        """
+        Prend le prochain job parmi les classes autorisées pour ce worker
+
+        Returns:
+            tuple: (job_id, classe), ou None si timeout
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                item = self._pop(eligible)
+                if item:
+                    return item
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def get_stats(self):
+        now = time.time()
+        with self._cond:
+            stats = {}
+            for cls in PRIORITY_CLASSES:
+                queued = [t for jobs in self._queues[cls].values() for _, t in jobs]
+                waits = self._waits[cls]
+                stats[cls] = {
+                    'queued': len(queued),
+                    'devices': len(self._queues[cls]),
+                    'oldest_wait_s': round(now - min(queued), 1) if queued else 0,
+                    'dispatched': waits['dispatched'],
+                    'avg_wait_s': round(waits['total_wait_s'] / waits['dispatched'], 1)
+                    if waits['dispatched'] else 0,
+                    'max_wait_s': round(waits['max_wait_s'], 1),
+                }
+            return stats
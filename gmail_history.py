@@ -0,0 +1,299 @@
+# gmail_history.py - v1.3.1
+"""
+Ingestion via l'API Gmail (INGESTION_MODE=gmail_api)
+
+- users.history.list depuis le dernier historyId : seuls les messages
+  ajoutés depuis la synchro précédente sont listés, le coût suit le
+  nombre de nouveaux emails et pas la taille de la boîte
+- messages.get groupés dans l'endpoint batch : format=metadata
+  (From, Subject, Message-ID) pour trier, format=raw seulement pour les
+  notifications inReach
+- Réponse Saildocs repérée: réveil du démultiplexeur (saildocs_router)
+- Même OAuth que gmail_sender (token.pickle), plus de mot de passe IMAP
+
+GMAIL_API_BASE permet de pointer vers un faux serveur Gmail local.
+
+v1.1.0: en-tête Date conservé, backlog trié (backlog_triage)
+v1.2.0: un jeton et un historyId par compte (accounts)
+v1.3.0: jeton fourni par le client Gmail partagé (gmail_sender), plus de
+relecture de token.pickle à chaque appel
+v1.3.1: load_access_token supprimé, le jeton vient toujours de GmailClient
+"""
+
+import base64
+import json
+import uuid
+import requests
+from config import GMAIL_API_BASE, GMAIL_BATCH_SIZE
+from mailbox_state import load_history_id, save_history_id
+from inreach_parser import parse_inreach_email
+from email_monitor import enqueue_parsed
+from job_store import get_job_store
+from saildocs_router import get_saildocs_demux
+from backlog_triage import triage_jobs, parse_date_header
+from accounts import get_account
+from gmail_sender import get_gmail_client
+
+# Amorçage (pas de historyId ou historyId expiré)
+BOOTSTRAP_QUERY = 'is:unread {from:inreach from:garmin}'
+METADATA_HEADERS = ('From', 'Subject', 'Message-ID', 'Date')
+
+
+class GmailApiError(Exception):
+    """Réponse HTTP en erreur de l'API Gmail"""
+
+    def __init__(self, status, message):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+
+class GmailHistoryClient:
+    """Client REST minimal des endpoints Gmail utilisés par la synchro"""
+
+    def __init__(self, base_url=GMAIL_API_BASE, token_provider=None,
+                 user_id='me', batch_size=GMAIL_BATCH_SIZE, timeout=30):
+        """
+        Args:
+            token_provider: token_provider() → jeton d'accès ; par défaut le
+                            GmailClient partagé du premier compte
+        """
+        self.base_url = base_url.rstrip('/')
+        self.token_provider = token_provider or get_gmail_client().access_token
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.http = requests.Session()
+
+    def _headers(self):
+        return {'Authorization': f'Bearer {self.token_provider()}'}
+
+    def _call(self, method, path, params=None, body=None):
+        url = f"{self.base_url}/gmail/v1/users/{self.user_id}/{path}"
+        resp = self.http.request(method, url, params=params, json=body,
+                                 headers=self._headers(), timeout=self.timeout)
+        if resp.status_code >= 400:
+            raise GmailApiError(resp.status_code, resp.text[:200])
+        return resp.json() if resp.content else {}
+
+    def get_profile(self):
+        return self._call('GET', 'profile')
+
+    def list_history(self, start_history_id):
+        """
+        IDs des messages ajoutés à INBOX depuis start_history_id
+
+        Returns:
+            tuple: (liste d'IDs sans doublons, historyId courant)
+
+        Raises:
+            GmailApiError: status 404 si le historyId a expiré (~1 semaine)
+        """
+        ids, page_token = [], None
+        history_id = start_history_id
+        while True:
+            params = {'startHistoryId': start_history_id, 'historyTypes': 'messageAdded',
+                      'labelId': 'INBOX', 'maxResults': 500}
+            if page_token:
+                params['pageToken'] = page_token
+            data = self._call('GET', 'history', params=params)
+            for record in data.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    ids.append(added['message']['id'])
+            history_id = int(data.get('historyId', history_id))
+            page_token = data.get('nextPageToken')
+            if not page_token:
+                return list(dict.fromkeys(ids)), history_id
+
+    def list_messages(self, query):
+        ids, page_token = [], None
+        while True:
+            params = {'q': query, 'maxResults': 500}
+            if page_token:
+                params['pageToken'] = page_token
+            data = self._call('GET', 'messages', params=params)
+            ids.extend(m['id'] for m in data.get('messages', []))
+            page_token = data.get('nextPageToken')
+            if not page_token:
+                return ids
+
+    def batch_get(self, ids, fmt='metadata', metadata_headers=METADATA_HEADERS):
+        """
+        messages.get groupés par l'endpoint batch (batch_size par requête HTTP)
+
+        Returns:
+            tuple: ({id: message}, [IDs en échec temporaire à retenter])
+        """
+        query = f'format={fmt}'
+        if fmt == 'metadata':
+            query += ''.join(f'&metadataHeaders={h}' for h in metadata_headers)
+        messages, failed = {}, []
+        for start in range(0, len(ids), self.batch_size):
+            chunk = ids[start:start + self.batch_size]
+            lines = [f'GET /gmail/v1/users/{self.user_id}/messages/{msg_id}?{query}' for msg_id in chunk]
+            for msg_id, (status, payload) in zip(chunk, self._batch(lines)):
+                if status == 200:
+                    messages[msg_id] = payload
+                elif status != 404:  # 404: message supprimé entre-temps
+                    failed.append(msg_id)
+        return messages, failed
+
+    def _batch(self, request_lines):
+        """Envoie un lot multipart/mixed ; réponses dans l'ordre des requêtes"""
+        boundary = f'batch_{uuid.uuid4().hex}'
+        parts = []
+        for i, line in enumerate(request_lines):
+            parts.append(f'--{boundary}\r\nContent-Type: application/http\r\n'
+                         f'Content-ID: <item{i}>\r\n\r\n{line}\r\n\r\n')
+        body = ''.join(parts) + f'--{boundary}--\r\n'
+        headers = self._headers()
+        headers['Content-Type'] = f'multipart/mixed; boundary={boundary}'
+        resp = self.http.post(f"{self.base_url}/batch/gmail/v1", data=body.encode(),
+                              headers=headers, timeout=self.timeout)
+        if resp.status_code >= 400:
+            raise GmailApiError(resp.status_code, resp.text[:200])
+        results = [(0, None)] * len(request_lines)
+        for index, status, payload in parse_batch_response(resp.headers.get('Content-Type', ''), resp.content):
+            if 0 <= index < len(results):
+                results[index] = (status, payload)
+        return results
+
+    def mark_read(self, ids):
+        if ids:
+            self._call('POST', 'messages/batchModify', body={'ids': ids, 'removeLabelIds': ['UNREAD']})
+
+
+def parse_batch_response(content_type, content):
+    """
+    Découpe une réponse batch Gmail
+
+    Returns:
+        list: [(index de la requête, status HTTP, JSON ou None)]
+    """
+    boundary = None
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.strip().partition('=')
+        if name.lower() == 'boundary':
+            boundary = value.strip('"')
+    if not boundary:
+        return []
+
+    results = []
+    for chunk in content.split(b'--' + boundary.encode())[1:]:
+        if chunk.startswith(b'--'):
+            break
+        outer, _, http_part = chunk.strip(b'\r\n').partition(b'\r\n\r\n')
+        index = -1
+        for line in outer.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-id':
+                # <response-item3>
+                digits = value.strip().strip(b'<>').rsplit(b'item', 1)[-1]
+                index = int(digits) if digits.isdigit() else -1
+        head, _, body = http_part.partition(b'\r\n\r\n')
+        try:
+            status = int(head.split(b'\r\n', 1)[0].split()[1])
+        except (IndexError, ValueError):
+            continue
+        try:
+            payload = json.loads(body) if body.strip() else None
+        except ValueError:
+            payload = None
+        results.append((index, status, payload))
+    return results
+
+
+def header_value(message, name):
+    """Valeur d'un en-tête d'un message format=metadata (nom insensible à la casse)"""
+    wanted = name.lower()
+    for header in message.get('payload', {}).get('headers', []):
+        if header.get('name', '').lower() == wanted:
+            return header.get('value', '')
+    return ''
+
+
+def check_gmail_history(client=None, submit=None, account=None):
+    """
+    Un cycle de synchro incrémentale par l'API Gmail
+
+    Args:
+        client: GmailHistoryClient (faux serveur pour les tests)
+        submit: submit(job_id, type, reply_url), worker_pool.submit_job par défaut
+        account: Compte synchronisé (jeton et historyId propres), défaut: premier compte
+
+    Returns:
+        list: [(job_id, type, reply_url)] des jobs créés
+    """
+    if submit is None:
+        from worker_pool import submit_job as submit
+    account = get_account(account)
+    client = client or GmailHistoryClient(token_provider=get_gmail_client(account).access_token)
+    state_file = account.gmail_history_state_file
+
+    history_id = load_history_id(state_file)
+    ids = None
+    if history_id is not None:
+        try:
+            ids, new_history_id = client.list_history(history_id)
+        except GmailApiError as e:
+            if e.status != 404:
+                raise
+            print("⚠️ historyId Gmail expiré - resynchronisation", flush=True)
+    if ids is None:
+        # Le historyId est lu avant la liste: rien ne tombe entre les deux
+        new_history_id = int(client.get_profile()['historyId'])
+        ids = client.list_messages(BOOTSTRAP_QUERY)
+
+    if not ids:
+        save_history_id(new_history_id, state_file)
+        print("✓ Aucun nouveau message")
+        return []
+
+    metas, failed = client.batch_get(ids, 'metadata')
+    inreach_ids = []
+    saildocs_reply = False
+    for msg_id in ids:
+        meta = metas.get(msg_id)
+        if not meta:
+            continue
+        sender = header_value(meta, 'From').lower()
+        if 'saildocs' in sender:
+            saildocs_reply = True
+        elif 'inreach' in sender or 'garmin' in sender:
+            inreach_ids.append(msg_id)
+    if saildocs_reply:
+        get_saildocs_demux(account).notify_new_mail()
+
+    raws, failed_raw = client.batch_get(inreach_ids, 'raw')
+    failed += failed_raw
+    print(f"📬 [{account.name}] {len(ids)} nouveau(x) message(s), {len(raws)} notification(s) inReach")
+
+    store = get_job_store()
+    requests_found = []
+    for msg_id in inreach_ids:
+        if msg_id not in raws:
+            continue
+        parsed = parse_inreach_email(base64.urlsafe_b64decode(raws[msg_id]['raw']))
+        if not parsed:
+            continue
+        job_id = header_value(metas[msg_id], 'Message-ID').strip() or f"gmail:{msg_id}"
+        sent_at = parse_date_header(header_value(metas[msg_id], 'Date'))
+        requests_found.extend(enqueue_parsed(store, job_id, parsed, sent_at, account.name))
+
+    client.mark_read([msg_id for msg_id in inreach_ids if msg_id in raws])
+
+    # En cas d'échec partiel, le historyId reste en place: le prochain cycle
+    # relit ces messages, l'idempotence par Message-ID évite les doublons
+    if failed:
+        print(f"⚠️ {len(failed)} message(s) non lus via batch - nouvelle tentative au prochain cycle", flush=True)
+    else:
+        save_history_id(new_history_id, state_file)
+
+    for job_id, job_type, reply_url in triage_jobs(job_id for job_id, _, _ in requests_found):
+        submit(job_id, job_type, reply_url)
+    return requests_found
+
+
+# Synchro unique (ex. GMAIL_API_BASE=http://127.0.0.1:8025 python gmail_history.py)
+if __name__ == "__main__":
+    found = check_gmail_history(submit=lambda *job: print(f"   ➕ {job}"))
+    print(f"✅ {len(found)} job(s) créé(s)")
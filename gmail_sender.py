@@ -1,28 +1,194 @@
-# gmail_sender.py - v1.1.1
+# gmail_sender.py - v1.4.2
+# v1.4.2: attente en file, durée d'envoi et lot de chaque email journalisés
+# v1.4.1: utcnow_naive() au lieu de datetime.utcnow() (déprécié)
+# v1.4.0: plusieurs envois en un appel (endpoint batch), backends outbound_mail
+# v1.3.0: client Gmail construit une fois par compte (document de découverte
+#         statique), jeton rafraîchi avant expiration et réécrit atomiquement
+# v1.2.0: envoi depuis le compte du registre (jeton et adresse par compte)
 import base64
+import datetime
+import os
 import pickle
+import tempfile
+import threading
 from email.mime.text import MIMEText
+from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-from config import GMAIL_TOKEN_FILE, GARMIN_USERNAME
+from config import GMAIL_TOKEN_REFRESH_MARGIN, MAIL_BACKEND
+from accounts import get_account
 
-def send_email_gmail(subject, body, to_email):
+
+def utcnow_naive():
+    """
+    Heure UTC courante sans fuseau
+
+    google.auth stocke Credentials.expiry en datetime UTC naïf : la
+    comparaison doit se faire avec un datetime naïf lui aussi.
+    """
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class GmailClient:
+    """
+    Service Gmail d'un compte, partagé par tous les threads
+
+    Le service est construit une seule fois à partir du document de
+    découverte livré avec googleapiclient (pas d'appel réseau), et le
+    jeton est rafraîchi avant son expiration : un envoi = un appel HTTP.
+    """
+
+    def __init__(self, token_file, refresh_margin=GMAIL_TOKEN_REFRESH_MARGIN):
+        self.token_file = token_file
+        self.refresh_margin = refresh_margin
+        # httplib2 n'est pas thread-safe: un appel à la fois par client
+        self._lock = threading.Lock()
+        self._creds = None
+        self._service = None
+        self.stats = {'sent': 0, 'errors': 0, 'refreshes': 0}
+
+    def _load(self):
+        with open(self.token_file, 'rb') as token:
+            self._creds = pickle.load(token)
+        self._service = build('gmail', 'v1', credentials=self._creds,
+                              static_discovery=True, cache_discovery=False)
+
+    def _needs_refresh(self):
+        creds = self._creds
+        if not creds.token or creds.expiry is None:
+            return not creds.valid
+        remaining = creds.expiry - utcnow_naive()
+        return remaining.total_seconds() < self.refresh_margin
+
+    def _ensure_fresh(self):
+        if self._service is None:
+            self._load()
+        if self._needs_refresh() and self._creds.refresh_token:
+            self._creds.refresh(Request())
+            self.stats['refreshes'] += 1
+            _write_pickle_atomic(self._creds, self.token_file)
+            print("🔑 Jeton Gmail rafraîchi", flush=True)
+
+    def access_token(self):
+        """Jeton d'accès valide (rafraîchi si besoin), pour les appels REST directs"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._creds.token
+
+    def send(self, raw):
+        """
+        Envoie un message MIME encodé base64url
+
+        Returns:
+            dict: Réponse messages.send ({'id': ...})
+        """
+        with self._lock:
+            self._ensure_fresh()
+            try:
+                result = self._service.users().messages().send(userId="me", body={'raw': raw}).execute()
+            except Exception:
+                self.stats['errors'] += 1
+                raise
+            self.stats['sent'] += 1
+            return result
+
+    def send_batch(self, raws):
+        """
+        Envoie plusieurs messages en un seul appel HTTP (endpoint batch Gmail)
+
+        Returns:
+            list: [(réponse ou None, exception ou None)] dans l'ordre de raws
+        """
+        results = [(None, None)] * len(raws)
+
+        def collect(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        with self._lock:
+            self._ensure_fresh()
+            batch = self._service.new_batch_http_request(callback=collect)
+            for index, raw in enumerate(raws):
+                batch.add(self._service.users().messages().send(userId="me", body={'raw': raw}),
+                          request_id=str(index))
+            try:
+                batch.execute()
+            except Exception:
+                self.stats['errors'] += len(raws)
+                raise
+            failed = sum(1 for _, error in results if error is not None)
+            self.stats['sent'] += len(raws) - failed
+            self.stats['errors'] += failed
+        return results
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, connected=self._service is not None)
+
+
+def _write_pickle_atomic(obj, path):
+    """Réécrit token.pickle sans fenêtre où le fichier serait tronqué"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.token-')
     try:
-        with open(GMAIL_TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
 
-        service = build('gmail', 'v1', credentials=creds)
+def get_gmail_client(account=None):
+    """Retourne le client Gmail partagé d'un compte (nom ou Account)"""
+    account = get_account(account)
+    with _clients_lock:
+        if account.name not in _clients:
+            _clients[account.name] = GmailClient(account.gmail_token_file)
+        return _clients[account.name]
 
-        message = MIMEText(body)
-        message['to'] = to_email
-        message['from'] = GARMIN_USERNAME
-        message['subject'] = subject
 
-        raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+def get_all_gmail_stats():
+    with _clients_lock:
+        clients = dict(_clients)
+    return {name: client.get_stats() for name, client in clients.items()}
+
+
+def build_message(subject, body, to_email, from_email):
+    """Message MIME texte prêt à envoyer (Gmail API ou SMTP)"""
+    message = MIMEText(body)
+    message['to'] = to_email
+    message['from'] = from_email
+    message['subject'] = subject
+    return message
+
+
+def encode_raw(message):
+    """Champ 'raw' de messages.send (base64url)"""
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+
+def send_email_gmail(subject, body, to_email, account=None):
+    account = get_account(account)
+    if MAIL_BACKEND != 'gmail':
+        # Envois simultanés regroupés (batch Gmail ou SMTP réutilisé)
+        from outbound_mail import get_outbox
+        result = get_outbox(account).send(subject, body, to_email)
+        if result['ok']:
+            print(f"{MAIL_BACKEND} OK ID={result['id']} (lot {result['batch']}, file {result['queued_ms']} ms, "
+                  f"envoi {result['send_ms']} ms)", flush=True)
+        return result['ok']
+    try:
+        raw = encode_raw(build_message(subject, body, to_email, account.username))
 
-        result = service.users().messages().send(
-            userId="me",
-            body={'raw': raw}
-        ).execute()
+        result = get_gmail_client(account).send(raw)
 
         print(f"Gmail OK ID={result['id']}")
         return True
@@ -0,0 +1,120 @@
+# grib_codec.py - v1.0.0
+"""
+Compression des fichiers GRIB avant encodage texte
+
+Chaque octet gagné vaut environ 1/90 de message satellite, et la limite
+MAX_GRIB_MESSAGES refuse les fichiers juste au-dessus. En mode 'auto',
+zlib, lzma (flux brut LZMA2, sans en-tête .xz) et bz2 compressent en
+parallèle et le plus petit résultat l'emporte.
+
+Le texte encodé commence par une lettre qui identifie le compresseur
+(CODECS). Le mode historique 'zlib' n'a pas d'étiquette : son base64
+commence toujours par 'e' (octet d'en-tête zlib 0x78), lettre qui
+n'est pas une étiquette, ce qui permet au décodeur de reconnaître les
+deux formats.
+"""
+
+import bz2
+import lzma
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Flux LZMA2 brut: ni en-tête ni index .xz (~60 octets économisés)
+_LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 9 | lzma.PRESET_EXTREME}]
+
+# Étiquette (1 caractère) → (nom, compression, décompression)
+CODECS = {
+    'Z': ('zlib', lambda data: zlib.compress(data, level=9), zlib.decompress),
+    'X': ('lzma',
+          lambda data: lzma.compress(data, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS),
+          lambda data: lzma.decompress(data, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)),
+    'B': ('bz2', lambda data: bz2.compress(data, compresslevel=9), bz2.decompress),
+}
+TAGS = {name: tag for tag, (name, _, _) in CODECS.items()}
+
+# Mode historique: zlib sans étiquette
+LEGACY = 'zlib'
+MODES = (LEGACY, 'auto') + tuple(TAGS)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {'files': 0, 'wins': {name: 0 for name in TAGS}, 'saved_vs_zlib': 0}
+
+
+def _get_executor():
+    # zlib, lzma et bz2 relâchent le GIL pendant la compression: des
+    # threads suffisent à occuper plusieurs cœurs, sans copie inter-processus
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=len(CODECS), thread_name_prefix='grib-codec')
+        return _executor
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(_stats, wins=dict(_stats['wins']))
+
+
+def compress(data, mode='auto'):
+    """
+    Compresse selon le mode ('zlib' historique, 'auto' ou nom d'un codec)
+
+    Returns:
+        tuple: (étiquette ou '' en mode historique, données compressées)
+    """
+    if mode not in MODES:
+        raise ValueError(f"GRIB_CODEC inconnu: {mode} (attendu: {', '.join(MODES)})")
+    if mode == LEGACY:
+        return '', zlib.compress(data, level=9)
+    if mode != 'auto':
+        tag = TAGS[mode]
+        return tag, CODECS[tag][1](data)
+
+    executor = _get_executor()
+    futures = {}
+    for tag, (_, compressor, _) in CODECS.items():
+        futures[tag] = (time.perf_counter(), executor.submit(compressor, data))
+    results = {}
+    for tag, (start, future) in futures.items():
+        compressed = future.result()
+        results[tag] = (compressed, (time.perf_counter() - start) * 1000)
+
+    # À taille égale, l'ordre de CODECS (zlib d'abord) départage
+    winner = min(results, key=lambda tag: len(results[tag][0]))
+    zlib_size = len(results[TAGS['zlib']][0])
+    summary = ', '.join(f"{CODECS[tag][0]} {len(compressed)} o ({ms:.0f} ms)"
+                        for tag, (compressed, ms) in results.items())
+    print(f"   🗜️ Codecs: {summary} → {CODECS[winner][0]} "
+          f"(-{zlib_size - len(results[winner][0])} o vs zlib)")
+
+    with _stats_lock:
+        _stats['files'] += 1
+        _stats['wins'][CODECS[winner][0]] += 1
+        _stats['saved_vs_zlib'] += zlib_size - len(results[winner][0])
+    return winner, results[winner][0]
+
+
+def decompress(tag, data):
+    """Décompresse des données étiquetées ('' = zlib historique)"""
+    if not tag:
+        return zlib.decompress(data)
+    if tag not in CODECS:
+        raise ValueError(f"Étiquette de codec inconnue: {tag!r}")
+    return CODECS[tag][2](data)
+
+
+def split_tag(text):
+    """
+    Sépare l'étiquette du texte encodé
+
+    Returns:
+        tuple: (étiquette ou '' pour un base64 zlib historique, reste du texte)
+    """
+    if text and text[0] in CODECS:
+        return text[0], text[1:]
+    return '', text
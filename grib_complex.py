@@ -0,0 +1,315 @@
+# grib_complex.py - v1.0.0
+"""
+Réempaquetage GRIB2 : compression simple (5.0) → complexe avec
+différences spatiales (gabarits 5.3 / 7.3), sans perte
+
+Les champs météo sont lisses : les différences d'ordre 1 ou 2 entre
+points voisins sont petites. Elles sont découpées en groupes, chaque
+groupe codé avec sa propre référence et juste les bits nécessaires.
+C'est le format des fichiers GFS de la NOAA, lu par les logiciels de
+navigation qui lisent le GRIB2.
+
+Les entiers codés X restent identiques (mêmes R, E, D) : le champ
+décodé est exactement celui d'origine. Pour chaque champ, ordre
+(1 ou 2) et longueur de groupe sont choisis au plus petit ; le champ
+reste en compression simple si le résultat n'est pas plus petit ou si
+le décodeur de référence (unpack_complex) ne retrouve pas les valeurs.
+Les fichiers GRIB1 passent inchangés.
+
+Benchmark: python grib_complex.py fichier.grb2
+"""
+
+from grib_strip import iter_records, assemble_record
+from grib_quantize import unpack_values
+
+GROUP_LENGTHS = (8, 12, 16, 24, 32, 48, 64, 96, 128)
+
+
+class _BitWriter:
+    def __init__(self):
+        self.parts = []
+
+    def write(self, value, nbits):
+        if nbits:
+            self.parts.append(format(value, f'0{nbits}b'))
+
+    def write_all(self, values, nbits):
+        if nbits:
+            self.parts.extend(format(value, f'0{nbits}b') for value in values)
+
+    def pad(self):
+        """Complète à l'octet (fin de bloc GRIB)"""
+        used = sum(len(part) for part in self.parts) % 8
+        if used:
+            self.parts.append('0' * (8 - used))
+
+    def to_bytes(self):
+        self.pad()
+        bits = ''.join(self.parts)
+        return int(bits, 2).to_bytes(len(bits) // 8, 'big') if bits else b''
+
+
+class _BitReader:
+    def __init__(self, data):
+        self.bits = bin(int.from_bytes(data, 'big'))[2:].zfill(len(data) * 8) if data else ''
+        self.pos = 0
+
+    def read(self, nbits):
+        if not nbits:
+            return 0
+        value = int(self.bits[self.pos:self.pos + nbits], 2)
+        self.pos += nbits
+        return value
+
+    def read_all(self, count, nbits):
+        return [self.read(nbits) for _ in range(count)]
+
+    def pad(self):
+        self.pos += -self.pos % 8
+
+
+def spatial_differences(values, order):
+    """
+    Différences d'ordre 1 ou 2, décalées pour être positives
+
+    Returns:
+        tuple: (premières valeurs, minimum soustrait, différences)
+    """
+    if order == 1:
+        diffs = [0] + [values[i] - values[i - 1] for i in range(1, len(values))]
+    else:
+        diffs = [0, 0] + [values[i] - 2 * values[i - 1] + values[i - 2] for i in range(2, len(values))]
+    minimum = min(diffs[order:])
+    return values[:order], minimum, diffs[:order] + [d - minimum for d in diffs[order:]]
+
+
+def _groups(diffs, length):
+    groups = []
+    for start in range(0, len(diffs), length):
+        group = diffs[start:start + length]
+        low = min(group)
+        groups.append((low, (max(group) - low).bit_length(), group))
+    return groups
+
+
+def _cost_bits(groups):
+    """Taille du bloc de données pour ce découpage (références, largeurs, valeurs)"""
+    count = len(groups)
+    gref_bits = max(low for low, _, _ in groups).bit_length()
+    widths = [width for _, width, _ in groups]
+    width_bits = (max(widths) - min(widths)).bit_length()
+    pad = lambda bits: bits + (-bits % 8)
+    return (pad(count * gref_bits) + pad(count * width_bits)
+            + sum(width * len(group) for _, width, group in groups))
+
+
+def pack_complex(values, order, length):
+    """
+    Section 5 (sans R/E/D/type, remplis par l'appelant) et données 7.3
+
+    Returns:
+        tuple: (dict des champs du gabarit 5.3, octets de données)
+    """
+    firsts, minimum, diffs = spatial_differences(values, order)
+    groups = _groups(diffs, length)
+    grefs = [low for low, _, _ in groups]
+    widths = [width for _, width, _ in groups]
+    width_ref = min(widths)
+
+    extras = firsts + [minimum]
+    extra_octets = max(1, -(-(max(abs(v) for v in extras).bit_length() + 1) // 8))
+    writer = _BitWriter()
+    for value in extras:
+        # Signe + magnitude sur extra_octets octets
+        writer.write(1 if value < 0 else 0, 1)
+        writer.write(abs(value), extra_octets * 8 - 1)
+    gref_bits = max(grefs).bit_length()
+    writer.write_all(grefs, gref_bits)
+    writer.pad()
+    width_bits = (max(widths) - width_ref).bit_length()
+    writer.write_all([width - width_ref for width in widths], width_bits)
+    writer.pad()
+    # Longueurs toutes égales à 'length' (0 bit par longueur), sauf la dernière
+    for low, width, group in groups:
+        writer.write_all([value - low for value in group], width)
+
+    template = {
+        'count': len(values), 'gref_bits': gref_bits, 'groups': len(groups),
+        'width_ref': width_ref, 'width_bits': width_bits, 'length_ref': length,
+        'length_increment': 1, 'last_length': len(groups[-1][2]), 'length_bits': 0,
+        'order': order, 'extra_octets': extra_octets,
+    }
+    return template, writer.to_bytes()
+
+
+def build_section5(template, simple_s5):
+    """Section 5 du gabarit 5.3 (49 octets) ; R, E, D et type repris de la section 5.0"""
+    s5 = bytearray(49)
+    s5[0:4] = (49).to_bytes(4, 'big')
+    s5[4] = 5
+    s5[5:9] = template['count'].to_bytes(4, 'big')
+    s5[9:11] = (3).to_bytes(2, 'big')
+    s5[11:19] = simple_s5[11:19]            # R, E, D
+    s5[19] = template['gref_bits']
+    s5[20] = simple_s5[20]                  # type des valeurs d'origine
+    s5[21] = 1                              # découpage en groupes général
+    s5[22] = 0                              # pas de valeurs manquantes
+    s5[31:35] = template['groups'].to_bytes(4, 'big')
+    s5[35] = template['width_ref']
+    s5[36] = template['width_bits']
+    s5[37:41] = template['length_ref'].to_bytes(4, 'big')
+    s5[41] = template['length_increment']
+    s5[42:46] = template['last_length'].to_bytes(4, 'big')
+    s5[46] = template['length_bits']
+    s5[47] = template['order']
+    s5[48] = template['extra_octets']
+    return bytes(s5)
+
+
+def unpack_complex(s5, data):
+    """
+    Décodeur de référence 5.3 / 7.3 (même logique que g2clib comunpack)
+
+    Returns:
+        list: Entiers codés X
+    """
+    count = int.from_bytes(s5[5:9], 'big')
+    gref_bits, groups = s5[19], int.from_bytes(s5[31:35], 'big')
+    width_ref, width_bits = s5[35], s5[36]
+    length_ref, increment = int.from_bytes(s5[37:41], 'big'), s5[41]
+    last_length, length_bits = int.from_bytes(s5[42:46], 'big'), s5[46]
+    order, extra_octets = s5[47], s5[48]
+
+    reader = _BitReader(data)
+    extras = []
+    for _ in range(order + 1):
+        sign = reader.read(1)
+        magnitude = reader.read(extra_octets * 8 - 1)
+        extras.append(-magnitude if sign else magnitude)
+    grefs = reader.read_all(groups, gref_bits)
+    reader.pad()
+    widths = [width + width_ref for width in reader.read_all(groups, width_bits)]
+    reader.pad()
+    lengths = [length * increment + length_ref for length in reader.read_all(groups, length_bits)]
+    reader.pad()
+    lengths[-1] = last_length
+    if sum(lengths) != count:
+        raise ValueError("Longueurs de groupes incohérentes")
+
+    values = []
+    for gref, width, length in zip(grefs, widths, lengths):
+        values.extend(gref + value for value in reader.read_all(length, width))
+
+    minimum = extras[-1]
+    values[:order] = extras[:order]
+    for i in range(order, count):
+        if order == 1:
+            values[i] = values[i] + minimum + values[i - 1]
+        else:
+            values[i] = values[i] + minimum + 2 * values[i - 1] - values[i - 2]
+    return values
+
+
+def _repack_field(sections):
+    """
+    Sections d'un enregistrement GRIB2 repassé en 5.3, ou None (inchangé)
+
+    Returns:
+        tuple: (sections, statistiques du champ)
+    """
+    kinds = [kind for kind, _, _ in sections]
+    if kinds.count('s5') != 1 or kinds.count('s7') != 1:
+        return None
+    i5, i7 = kinds.index('s5'), kinds.index('s7')
+    s5, payload = sections[i5][1], sections[i7][2]
+    nbits, count = s5[19], int.from_bytes(s5[5:9], 'big')
+    if int.from_bytes(s5[9:11], 'big') != 0 or nbits == 0 or count < 3:
+        return None
+
+    values = unpack_values(payload, count, nbits)
+    best = None
+    for order in (1, 2):
+        _, _, diffs = spatial_differences(values, order)
+        for length in GROUP_LENGTHS:
+            if length > count:
+                break
+            cost = _cost_bits(_groups(diffs, length))
+            if best is None or cost < best[0]:
+                best = (cost, order, length)
+    _, order, length = best
+
+    template, data = pack_complex(values, order, length)
+    new_s5 = build_section5(template, s5)
+    stats = {'simple': len(s5) + len(payload), 'complex': len(new_s5) + len(data),
+             'order': order, 'group': length}
+    if stats['complex'] >= stats['simple'] or unpack_complex(new_s5, data) != values:
+        return None
+    new_sections = list(sections)
+    new_sections[i5] = ('s5', new_s5, b'')
+    new_sections[i7] = ('s7', (5 + len(data)).to_bytes(4, 'big') + b'\x07', data)
+    return new_sections, stats
+
+
+def repack_complex(grib_data):
+    """
+    Repasse les champs GRIB2 en compression simple au gabarit 5.3
+
+    Returns:
+        tuple: (données GRIB, [statistiques par champ: simple, complex, order, group ou None])
+    """
+    out, fields = [], []
+    for edition, discipline, content in iter_records(grib_data):
+        if edition != 2:
+            out.append(assemble_record(edition, discipline, content) if edition else content)
+            continue
+        result = _repack_field(content)
+        if result is None:
+            out.append(assemble_record(edition, discipline, content))
+            fields.append(None)
+            continue
+        sections, stats = result
+        out.append(assemble_record(edition, discipline, sections))
+        fields.append(stats)
+    return b''.join(out), fields
+
+
+def format_report(fields, size_before, size_after):
+    """Résumé d'une ligne pour les logs"""
+    repacked = [field for field in fields if field]
+    return (f"🧮 Compression complexe: {len(repacked)}/{len(fields)} champ(s) GRIB2, "
+            f"{size_before} → {size_after} octets")
+
+
+# Benchmark: chemin actuel (zlib seul) contre réempaquetage + zlib
+if __name__ == "__main__":
+    import math
+    import sys
+    import time
+    import zlib
+    from config import MAX_MESSAGE_LENGTH
+
+    if len(sys.argv) < 2:
+        print("Usage: python grib_complex.py fichier.grb2")
+        sys.exit(1)
+    with open(sys.argv[1], 'rb') as f:
+        grib = f.read()
+
+    def messages(data):
+        return math.ceil(len(zlib.compress(data, 9)) * 4 / 3 / MAX_MESSAGE_LENGTH)
+
+    start = time.perf_counter()
+    repacked, fields = repack_complex(grib)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    print("=" * 70)
+    print(f"BENCHMARK COMPRESSION COMPLEXE GRIB2 ({len(fields)} champ(s), {elapsed:.0f} ms)")
+    print("=" * 70)
+    for index, field in enumerate(fields, 1):
+        if field:
+            print(f"   champ {index:3d}: {field['simple']:6d} → {field['complex']:6d} octets "
+                  f"(ordre {field['order']}, groupes de {field['group']})")
+        else:
+            print(f"   champ {index:3d}: inchangé")
+    print(f"\nbrut      : {len(grib):7d} octets, zlib {len(zlib.compress(grib, 9)):7d} ({messages(grib)} msg)")
+    print(f"complexe  : {len(repacked):7d} octets, zlib {len(zlib.compress(repacked, 9)):7d} "
+          f"({messages(repacked)} msg)")
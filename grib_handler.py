@@ -1,90 +1,130 @@
-﻿# grib_handler.py - v3.6.4
+﻿# grib_handler.py - v3.12.0
+# - Textes de suivi, envoi Saildocs et limite de taille partagés avec async_pipeline
+# - Format de réponse demandé (compact) transmis à l'encodage
+# - Compte du registre transmis à Gmail, au démultiplexeur et aux envois
+# - Étapes découpées (request_grib / encode_grib_for_inreach) pour job_runner
+# - Réponses Saildocs routées vers le bon job (saildocs_router)
+# - Session IMAP partagée (plus de login toutes les 20 s)
 # - Intègre la limite stricte de 25 messages InReach
 # - Notifications de suivi incluses
 
-import time
-import imaplib
-import email
 import sys
 from gmail_sender import send_email_gmail
-from config import (GARMIN_USERNAME, GARMIN_PASSWORD, SAILDOCS_EMAIL, 
-                    SAILDOCS_RESPONSE_EMAIL, IMAP_HOST, IMAP_PORT, SAILDOCS_TIMEOUT)
+from config import SAILDOCS_EMAIL, SAILDOCS_TIMEOUT, MAX_GRIB_MESSAGES
+from saildocs_router import get_saildocs_demux
 from utils import encode_and_split_grib
 from inreach_sender import send_to_inreach
 
 sys.stdout.flush()
 
-def notify_status(inreach_url, message):
+# Notifications de suivi GRIB (mêmes textes en mode threads et asyncio)
+STATUS_MESSAGES = {
+    'accepted': "📥 Recu. Requete {model} en cours...",
+    'requested': "📤 Requete envoyee a Saildocs. Attente...",
+    'gmail_error': "❌ Erreur: Echec envoi Gmail (Token?)",
+    'timeout': "❌ Timeout: Saildocs ne repond pas.",
+    'fetched': "⚙️ GRIB recu. Analyse de la taille...",
+}
+
+def accepted_message(grib_request):
+    """Première notification d'une requête GRIB (modèle en majuscules)"""
+    return STATUS_MESSAGES['accepted'].format(model=grib_request.split(':')[0].upper())
+
+def grib_size_error(messages):
+    """Alerte si l'encodage dépasse MAX_GRIB_MESSAGES, sinon None"""
+    if len(messages) > MAX_GRIB_MESSAGES:
+        return (f"⚠️ ALERTE: GRIB trop volumineux ({len(messages)} msg). Limite: {MAX_GRIB_MESSAGES}. "
+                f"Reduisez la zone ou le nombre de jours.")
+    return None
+
+def send_saildocs_request(grib_request, account=None):
+    """Envoie la requête à Saildocs depuis le compte donné ; True si l'email est parti"""
+    return send_email_gmail(subject="GRIB request", body=f"send {grib_request}",
+                            to_email=SAILDOCS_EMAIL, account=account)
+
+def notify_status(inreach_url, message, account=None):
     """Notification rapide pour suivi à distance"""
     print(f"📡 Suivi: {message}", flush=True)
-    return send_to_inreach(inreach_url, [message])
+    return send_to_inreach(inreach_url, [message], account=account)
 
-def wait_for_saildocs_response(inreach_url, timeout=SAILDOCS_TIMEOUT):
-    """Attend le retour de Saildocs par IMAP"""
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        try:
-            mail = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
-            mail.login(GARMIN_USERNAME, GARMIN_PASSWORD)
-            mail.select('inbox')
-            status, messages = mail.search(None, f'(UNSEEN FROM "{SAILDOCS_RESPONSE_EMAIL}")')
-            
-            if status == 'OK' and messages[0]:
-                for email_id in messages[0].split():
-                    _, msg_data = mail.fetch(email_id, '(RFC822)')
-                    msg = email.message_from_bytes(msg_data[0][1])
-                    for part in msg.walk():
-                        if part.get_content_type() == 'application/octet-stream':
-                            grib_data = part.get_payload(decode=True)
-                            if grib_data:
-                                mail.store(email_id, '+FLAGS', '\\Seen')
-                                mail.logout()
-                                return grib_data
-            mail.logout()
-        except Exception as e:
-            print(f"⚠️ Erreur IMAP: {e}")
-        time.sleep(20)
-    return None
+def wait_for_saildocs_response(inreach_url, timeout=SAILDOCS_TIMEOUT, grib_request="", pending=None, account=None):
+    """
+    Attend le retour de Saildocs via le démultiplexeur partagé
+    
+    Args:
+        pending: Attente déjà enregistrée (sinon enregistrée ici pour grib_request)
+        account: Compte dont la boîte reçoit la réponse Saildocs
+    """
+    demux = get_saildocs_demux(account)
+    if pending is None:
+        pending = demux.register(grib_request)
+    return demux.wait(pending, timeout)
 
-def process_grib_request(grib_request, inreach_url, mail=None):
-    """Workflow complet GRIB avec limite de 25 messages"""
-    print(f"\n🌊 TRAITEMENT GRIB: {grib_request}", flush=True)
+def request_grib(grib_request, inreach_url, account=None):
+    """
+    Étapes 1-2: notification initiale + envoi de la requête à Saildocs
     
+    Returns:
+        PendingGrib: Attente enregistrée auprès du démultiplexeur, ou None si échec
+    """
     # 1. Notification initiale
-    notify_status(inreach_url, f"📥 Recu. Requete {grib_request.split(':')[0].upper()} en cours...")
+    notify_status(inreach_url, accepted_message(grib_request), account)
+
+    # 2. Envoi Saildocs (attente enregistrée avant l'envoi)
+    demux = get_saildocs_demux(account)
+    pending = demux.register(grib_request)
+    if send_saildocs_request(grib_request, account):
+        notify_status(inreach_url, STATUS_MESSAGES['requested'], account)
+        return pending
+    
+    demux.cancel(pending)
+    notify_status(inreach_url, STATUS_MESSAGES['gmail_error'], account)
+    return None
 
-    # 2. Envoi Saildocs
-    body = f"send {grib_request}"
-    success = send_email_gmail(subject="GRIB request", body=body, to_email=SAILDOCS_EMAIL)
+def encode_grib_for_inreach(grib_data, inreach_url, account=None, payload_format=None):
+    """
+    Étape 4: encodage et vérification de la limite de 25 messages
+    
+    Args:
+        payload_format: None (GRIB) ou 'compact' (requête '...|compact')
     
-    if success:
-        notify_status(inreach_url, "📤 Requete envoyee a Saildocs. Attente...")
-    else:
-        notify_status(inreach_url, "❌ Erreur: Echec envoi Gmail (Token?)")
+    Returns:
+        list: Messages prêts à envoyer, ou None si trop volumineux
+    """
+    notify_status(inreach_url, STATUS_MESSAGES['fetched'], account)
+    messages = encode_and_split_grib(grib_data, payload_format=payload_format)
+    
+    # --- LIMITE DE SÉCURITÉ ---
+    error_msg = grib_size_error(messages)
+    if error_msg:
+        print(f"❌ {error_msg}", flush=True)
+        notify_status(inreach_url, error_msg, account)
+        return None
+    # --------------------------
+    return messages
+
+def process_grib_request(grib_request, inreach_url, mail=None, account=None):
+    """Workflow complet GRIB avec limite de 25 messages"""
+    print(f"\n🌊 TRAITEMENT GRIB: {grib_request}", flush=True)
+    
+    pending = request_grib(grib_request, inreach_url, account)
+    if pending is None:
         return False
     
     # 3. Attente du fichier GRIB
-    grib_data = wait_for_saildocs_response(inreach_url)
+    grib_data = wait_for_saildocs_response(inreach_url, pending=pending, account=account)
     if not grib_data:
-        notify_status(inreach_url, "❌ Timeout: Saildocs ne repond pas.")
+        notify_status(inreach_url, STATUS_MESSAGES['timeout'], account)
         return False
 
     # 4. Encodage et vérification de la taille
-    notify_status(inreach_url, "⚙️ GRIB recu. Analyse de la taille...")
-    messages = encode_and_split_grib(grib_data)
-    num_msg = len(messages)
-    
-    # --- LIMITE DE SÉCURITÉ ---
-    if num_msg > 25:
-        error_msg = f"⚠️ ALERTE: GRIB trop volumineux ({num_msg} msg). Limite: 25. Reduisez la zone ou le nombre de jours."
-        print(f"❌ {error_msg}", flush=True)
-        notify_status(inreach_url, error_msg)
+    messages = encode_grib_for_inreach(grib_data, inreach_url, account)
+    if messages is None:
         return False
-    # --------------------------
 
     # 5. Envoi final si la limite est respectée
-    if send_to_inreach(inreach_url, messages):
-        print(f"✅ Workflow terminé: {num_msg} messages envoyés.", flush=True)
+    if send_to_inreach(inreach_url, messages, account=account):
+        print(f"✅ Workflow terminé: {len(messages)} messages envoyés.", flush=True)
         return True
     
     return False
@@ -0,0 +1,194 @@
+# grib_quantize.py - v1.0.1
+"""
+Réduction de précision des champs GRIB (perte contrôlée)
+
+Saildocs transmet la précision complète du modèle (vent au centième de
+m/s, pression au pascal). Chaque champ en compression simple est
+réempaqueté avec moins de bits par valeur, au pas demandé par type de
+paramètre (GRIB_PRECISION_STEPS, unités du GRIB : m/s, Pa, K, m, mm).
+
+Le calcul reste entier : avec Y = (R + X·2^E) / 10^D, augmenter E de k
+revient à X' = arrondi(X / 2^k). La valeur de référence R et le facteur
+décimal D ne changent pas, l'erreur introduite est au plus un demi-pas
+et elle est mesurée exactement pour chaque champ.
+
+Champs laissés tels quels : compression complexe ou sphérique, paramètre
+sans pas défini, ou précision d'origine déjà plus grossière que le pas.
+
+v1.0.1: précipitations totales ECMWF (table 128, paramètre 228) en mètres :
+pas converti depuis les mm de GRIB_PRECISION_STEPS
+"""
+
+import math
+from config import GRIB_PRECISION_STEPS
+from grib_strip import iter_records, assemble_record
+
+# GRIB1: (table de paramètres, paramètre) → type (NCEP table 2 par défaut, ECMWF table 128)
+_GRIB1_PARAMS = {
+    'ncep': {33: 'wind', 34: 'wind', 32: 'wind', 180: 'wind', 2: 'pressure', 1: 'pressure',
+             11: 'temperature', 100: 'wave', 102: 'wave', 105: 'wave', 61: 'precip'},
+    'ecmwf': {165: 'wind', 166: 'wind', 49: 'wind', 151: 'pressure', 134: 'pressure',
+              167: 'temperature', 229: 'wave', 228: 'precip'},
+}
+# GRIB1: unité GRIB différente de celle de GRIB_PRECISION_STEPS → facteur appliqué au pas
+_GRIB1_STEP_SCALE = {
+    ('ecmwf', 228): 1e-3,  # tp ECMWF en m, pas en mm
+}
+# GRIB2: (discipline, catégorie, numéro) → type
+_GRIB2_PARAMS = {
+    (0, 2, 1): 'wind', (0, 2, 2): 'wind', (0, 2, 3): 'wind', (0, 2, 22): 'wind',
+    (0, 3, 0): 'pressure', (0, 3, 1): 'pressure',
+    (0, 0, 0): 'temperature',
+    (10, 0, 3): 'wave', (10, 0, 5): 'wave', (10, 0, 8): 'wave',
+    (0, 1, 8): 'precip',
+}
+
+
+def _signed16(raw):
+    """Entier 16 bits signe + magnitude (GRIB)"""
+    value = int.from_bytes(raw, 'big')
+    return -(value & 0x7fff) if value & 0x8000 else value
+
+
+def _pack_signed16(value):
+    return ((0x8000 | -value) if value < 0 else value).to_bytes(2, 'big')
+
+
+def unpack_values(payload, count, nbits):
+    """Entiers non signés de nbits bits (MSB en premier)"""
+    if nbits == 0 or count == 0:
+        return [0] * count
+    bits = bin(int.from_bytes(payload, 'big'))[2:].zfill(len(payload) * 8)
+    return [int(bits[i:i + nbits], 2) for i in range(0, count * nbits, nbits)]
+
+
+def pack_values(values, nbits):
+    """Inverse de unpack_values, complété à l'octet par des zéros"""
+    if nbits == 0 or not values:
+        return b''
+    bits = ''.join(format(value, f'0{nbits}b') for value in values)
+    bits += '0' * (-len(bits) % 8)
+    return int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+
+def requantize_values(values, binary_scale, decimal_scale, step):
+    """
+    Arrondit des valeurs codées au pas physique step
+
+    Returns:
+        tuple: (valeurs, nouveau facteur binaire, bits par valeur, erreur max) ou None si inutile
+    """
+    # Pas du codage actuel: 2^E / 10^D ; on cherche le plus grand k avec 2^(E+k) / 10^D <= step
+    shift = math.floor(math.log2(step * 10 ** decimal_scale)) - binary_scale
+    if shift <= 0:
+        return None
+    half = 1 << (shift - 1)
+    new_values = [(value + half) >> shift for value in values]
+    max_diff = max((abs((new << shift) - value) for new, value in zip(new_values, values)), default=0)
+    max_error = max_diff * 2.0 ** binary_scale / 10 ** decimal_scale
+    nbits = max(1, max(new_values, default=0).bit_length())
+    return new_values, binary_scale + shift, nbits, max_error
+
+
+def _grib1_field(sections, steps):
+    """Nouvelles sections d'un enregistrement GRIB1, ou None si inchangé"""
+    pds = sections[0][1]
+    table = 'ecmwf' if pds[3] == 128 else 'ncep'
+    kind = _GRIB1_PARAMS[table].get(pds[8])
+    name, bds_header, payload = sections[-1]
+    flags, unused = bds_header[3] >> 4, bds_header[3] & 0x0f
+    nbits = bds_header[10]
+    # Seulement la compression simple en points de grille, sans drapeaux étendus
+    if kind not in steps or flags & 0b1101 or nbits == 0:
+        return None
+    count = (len(payload) * 8 - unused) // nbits
+    result = requantize_values(unpack_values(payload, count, nbits),
+                               _signed16(bds_header[4:6]), _signed16(pds[26:28]),
+                               steps[kind] * _GRIB1_STEP_SCALE.get((table, pds[8]), 1))
+    if result is None:
+        return None
+    values, binary_scale, new_bits, max_error = result
+
+    new_payload = pack_values(values, new_bits)
+    # Sections GRIB1 de longueur paire
+    if (11 + len(new_payload)) % 2:
+        new_payload += b'\x00'
+    unused_bits = len(new_payload) * 8 - count * new_bits
+    header = bytearray(bds_header)
+    header[0:3] = (11 + len(new_payload)).to_bytes(3, 'big')
+    header[3] = (flags << 4) | unused_bits
+    header[4:6] = _pack_signed16(binary_scale)
+    header[10] = new_bits
+    new_sections = sections[:-1] + [(name, bytes(header), new_payload)]
+    return new_sections, {'param': pds[8], 'kind': kind, 'bits': (nbits, new_bits), 'max_error': max_error}
+
+
+def _grib2_field(discipline, sections, steps):
+    """Même traitement pour un enregistrement GRIB2 (gabarit 5.0 uniquement)"""
+    kinds = [kind for kind, _, _ in sections]
+    # Un seul champ par enregistrement (messages multi-champs laissés tels quels)
+    if kinds.count('s4') != 1 or kinds.count('s5') != 1 or kinds.count('s7') != 1:
+        return None
+    s4 = sections[kinds.index('s4')][1]
+    s5 = sections[kinds.index('s5')][1]
+    kind = _GRIB2_PARAMS.get((discipline, s4[9], s4[10]))
+    nbits = s5[19]
+    if kind not in steps or int.from_bytes(s5[9:11], 'big') != 0 or nbits == 0:
+        return None
+    count = int.from_bytes(s5[5:9], 'big')
+    s7_index = kinds.index('s7')
+    result = requantize_values(unpack_values(sections[s7_index][2], count, nbits),
+                               _signed16(s5[15:17]), _signed16(s5[17:19]), steps[kind])
+    if result is None:
+        return None
+    values, binary_scale, new_bits, max_error = result
+
+    new_payload = pack_values(values, new_bits)
+    header5 = bytearray(s5)
+    header5[15:17] = _pack_signed16(binary_scale)
+    header5[19] = new_bits
+    header7 = (5 + len(new_payload)).to_bytes(4, 'big') + b'\x07'
+    new_sections = list(sections)
+    new_sections[kinds.index('s5')] = ('s5', bytes(header5), b'')
+    new_sections[s7_index] = ('s7', header7, new_payload)
+    return new_sections, {'param': f"{discipline}.{s4[9]}.{s4[10]}", 'kind': kind,
+                          'bits': (nbits, new_bits), 'max_error': max_error}
+
+
+def requantize(grib_data, steps=GRIB_PRECISION_STEPS):
+    """
+    Réempaquette chaque champ au pas de son type de paramètre
+
+    Args:
+        steps: {type: pas physique} (wind, pressure, temperature, wave, precip)
+
+    Returns:
+        tuple: (données GRIB, rapport {'fields', 'changed', 'max_error': {type: erreur}})
+    """
+    out = []
+    report = {'fields': 0, 'changed': 0, 'max_error': {}}
+    for edition, discipline, content in iter_records(grib_data):
+        if edition == 0:
+            out.append(content)
+            continue
+        report['fields'] += 1
+        if edition == 1:
+            result = _grib1_field(content, steps)
+        else:
+            result = _grib2_field(discipline, content, steps)
+        if result is None:
+            out.append(assemble_record(edition, discipline, content))
+            continue
+        sections, field = result
+        out.append(assemble_record(edition, discipline, sections))
+        report['changed'] += 1
+        kind = field['kind']
+        report['max_error'][kind] = max(report['max_error'].get(kind, 0.0), field['max_error'])
+    return b''.join(out), report
+
+
+def format_report(report, size_before, size_after):
+    """Résumé d'une ligne pour les logs"""
+    errors = ', '.join(f"{kind} ±{error:.3g}" for kind, error in sorted(report['max_error'].items()))
+    return (f"🎚️ Précision réduite: {report['changed']}/{report['fields']} champ(s), "
+            f"{size_before} → {size_after} octets" + (f", erreur max {errors}" if errors else ""))
@@ -0,0 +1,309 @@
+# grib_strip.py - v1.1.0
+"""
+Suppression des en-têtes GRIB redondants avant compression
+
+Un fichier Saildocs répète dans chaque enregistrement des structures
+presque fixes : section d'indicateur et '7777' (déductibles des
+longueurs), grille identique pour tous les paramètres, définition de
+produit qui ne change que par l'échéance. Sur les petites zones ces
+en-têtes pèsent autant que les données.
+
+Format produit (MAGIC) :
+    MAGIC | varint(n) structure | varint(n) en-têtes | données concaténées
+
+- structure : chaque enregistrement (GRIB1 ou GRIB2) section par
+  section, avec les tailles ; section d'indicateur et '7777' omis
+- en-têtes : les sections de même type et de même taille rangées en
+  colonnes d'octets, chaque octet codé par son écart à l'enregistrement
+  précédent. Une grille répétée n'est plus qu'une suite de zéros, une
+  définition de produit se réduit aux colonnes d'échéance/paramètre
+- données : BDS GRIB1 après son en-tête, bitmaps et section 7 GRIB2,
+  telles quelles
+
+Tout enregistrement dont la reconstruction ne redonne pas exactement
+les octets d'origine, et tout octet hors enregistrement, est transmis
+en littéral : rebuild(strip(data)) == data pour n'importe quel fichier.
+
+v1.1.0: iter_records / assemble_record réutilisés par grib_quantize
+"""
+
+MAGIC = b'GRBS\x01'
+
+# Types d'éléments de la structure
+_RAW, _GRIB1, _GRIB2 = 0, 1, 2
+
+# En-tête de la section données GRIB1 (longueur, drapeaux, facteur, référence, bits)
+_GRIB1_BDS_HEADER = 11
+
+# Types de section (un octet dans le schéma) ; ceux de _DATA_KINDS ont des octets de données
+_KINDS = ('pds', 'gds', 'bms', 'bds', 's1', 's2', 's3', 's4', 's5', 's6', 's7')
+_DATA_KINDS = ('bms', 'bds', 's6', 's7')
+
+
+def _varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+class _Reader:
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos
+
+    def varint(self):
+        value, shift = 0, 0
+        while True:
+            byte = self.data[self.pos]
+            self.pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def take(self, n):
+        chunk = self.data[self.pos:self.pos + n]
+        if len(chunk) != n:
+            raise ValueError("Schéma GRIB tronqué")
+        self.pos += n
+        return bytes(chunk)
+
+
+# ==========================================
+# ANALYSE DES ENREGISTREMENTS
+# ==========================================
+
+def _u24(data, pos):
+    return int.from_bytes(data[pos:pos + 3], 'big')
+
+
+def _parse_grib1(data, start):
+    """
+    Sections d'un enregistrement GRIB1
+
+    Returns:
+        tuple: (fin, [(nom, octets d'en-tête, octets de données)]) ou None
+    """
+    total = _u24(data, start + 4)
+    end = start + total
+    if total < 8 + 28 + 4 or end > len(data) or data[end - 4:end] != b'7777':
+        return None
+    pos = start + 8
+    pds_len = _u24(data, pos)
+    if pds_len < 28:
+        return None
+    flags = data[pos + 7]
+    sections = [('pds', data[pos:pos + pds_len], b'')]
+    pos += pds_len
+    if flags & 0x80:
+        gds_len = _u24(data, pos)
+        sections.append(('gds', data[pos:pos + gds_len], b''))
+        pos += gds_len
+    if flags & 0x40:
+        bms_len = _u24(data, pos)
+        sections.append(('bms', data[pos:pos + 6], data[pos + 6:pos + bms_len]))
+        pos += bms_len
+    bds_len = _u24(data, pos)
+    if bds_len < _GRIB1_BDS_HEADER or pos + bds_len != end - 4:
+        return None
+    sections.append(('bds', data[pos:pos + _GRIB1_BDS_HEADER], data[pos + _GRIB1_BDS_HEADER:pos + bds_len]))
+    return end, sections
+
+
+def _parse_grib2(data, start):
+    """Sections 1 à 7 d'un enregistrement GRIB2 (même forme que _parse_grib1)"""
+    total = int.from_bytes(data[start + 8:start + 16], 'big')
+    end = start + total
+    if total < 16 + 4 or end > len(data) or data[end - 4:end] != b'7777':
+        return None
+    pos = start + 16
+    sections = []
+    while pos < end - 4:
+        length = int.from_bytes(data[pos:pos + 4], 'big')
+        if length < 5 or pos + length > end - 4:
+            return None
+        number = data[pos + 4]
+        if number not in range(1, 8):
+            return None
+        if number in (6, 7):
+            # Bitmap et données: seuls longueur et numéro vont dans le schéma
+            sections.append((f's{number}', data[pos:pos + 5], data[pos + 5:pos + length]))
+        else:
+            sections.append((f's{number}', data[pos:pos + length], b''))
+        pos += length
+    return end, sections
+
+
+def assemble_record(edition, discipline, sections):
+    """Reconstruit un enregistrement à partir de ses sections"""
+    body = b''.join(header + payload for _, header, payload in sections)
+    if edition == 1:
+        total = 8 + len(body) + 4
+        return b'GRIB' + total.to_bytes(3, 'big') + b'\x01' + body + b'7777'
+    total = 16 + len(body) + 4
+    return b'GRIB\x00\x00' + bytes([discipline]) + b'\x02' + total.to_bytes(8, 'big') + body + b'7777'
+
+
+def iter_records(data):
+    """
+    Découpe un fichier en enregistrements GRIB et octets intermédiaires
+
+    Returns:
+        list: [(édition ou 0 pour des octets bruts, discipline, sections ou octets)]
+    """
+    items = []
+    pos = raw_start = 0
+    while True:
+        start = data.find(b'GRIB', pos)
+        if start < 0 or start + 16 > len(data):
+            break
+        edition = data[start + 7]
+        parsed = None
+        if edition == 1:
+            parsed = _parse_grib1(data, start)
+        elif edition == 2:
+            parsed = _parse_grib2(data, start)
+        if parsed is None:
+            pos = start + 1
+            continue
+        end, sections = parsed
+        discipline = data[start + 6] if edition == 2 else 0
+        # Un enregistrement qui ne se reconstruit pas à l'identique reste brut
+        if assemble_record(edition, discipline, sections) != data[start:end]:
+            pos = start + 1
+            continue
+        if start > raw_start:
+            items.append((0, 0, data[raw_start:start]))
+        items.append((edition, discipline, sections))
+        pos = raw_start = end
+    if raw_start < len(data):
+        items.append((0, 0, data[raw_start:]))
+    return items
+
+
+# ==========================================
+# SCHÉMA
+# ==========================================
+
+def _transpose(rows, width):
+    """Colonnes d'octets, chaque octet remplacé par son écart à la ligne précédente"""
+    out = bytearray()
+    for col in range(width):
+        previous = 0
+        for row in rows:
+            out.append((row[col] - previous) & 0xff)
+            previous = row[col]
+    return out
+
+
+def _untranspose(data, count, width):
+    rows = [bytearray(width) for _ in range(count)]
+    pos = 0
+    for col in range(width):
+        previous = 0
+        for row in rows:
+            previous = (previous + data[pos]) & 0xff
+            row[col] = previous
+            pos += 1
+    return [bytes(row) for row in rows]
+
+
+def strip(data):
+    """
+    Sépare structure, en-têtes et données d'un fichier GRIB
+
+    Returns:
+        bytes: Format MAGIC (toujours reconstructible par rebuild)
+    """
+    data = bytes(data)
+    structure = bytearray()
+    groups = {}     # (type, longueur) → en-têtes dans l'ordre du fichier
+    payloads = []
+    items = iter_records(data)
+    _varint(len(items), structure)
+    for edition, discipline, content in items:
+        if edition == 0:
+            structure.append(_RAW)
+            _varint(len(content), structure)
+            payloads.append(content)
+            continue
+        structure.append(_GRIB1 if edition == 1 else _GRIB2)
+        if edition == 2:
+            structure.append(discipline)
+        _varint(len(content), structure)
+        for kind, header, payload in content:
+            structure.append(_KINDS.index(kind))
+            _varint(len(header), structure)
+            groups.setdefault((kind, len(header)), []).append(header)
+            if kind in _DATA_KINDS:
+                _varint(len(payload), structure)
+                payloads.append(payload)
+
+    # En-têtes de même type et même taille en colonnes: les champs constants
+    # deviennent des suites de zéros, l'échéance un écart constant
+    headers = bytearray()
+    for (_, width), rows in groups.items():
+        headers += _transpose(rows, width)
+
+    out = bytearray(MAGIC)
+    _varint(len(structure), out)
+    out += structure
+    _varint(len(headers), out)
+    out += headers
+    return bytes(out) + b''.join(payloads)
+
+
+def rebuild(stripped):
+    """
+    Reconstruit le fichier GRIB d'origine (octet pour octet)
+
+    Raises:
+        ValueError: Données qui ne sont pas au format MAGIC ou structure incohérente
+    """
+    if not is_stripped(stripped):
+        raise ValueError("Données GRIB non réduites (MAGIC absent)")
+    reader = _Reader(stripped, len(MAGIC))
+    structure = _Reader(reader.take(reader.varint()))
+
+    # 1. Structure: ordre des sections, tailles des en-têtes et des données
+    items = []
+    counts = {}
+    for _ in range(structure.varint()):
+        item = structure.take(1)[0]
+        if item == _RAW:
+            items.append((0, 0, structure.varint()))
+            continue
+        if item not in (_GRIB1, _GRIB2):
+            raise ValueError(f"Élément de structure inconnu: {item}")
+        edition = 1 if item == _GRIB1 else 2
+        discipline = structure.take(1)[0] if edition == 2 else 0
+        sections = []
+        for _ in range(structure.varint()):
+            kind = _KINDS[structure.take(1)[0]]
+            width = structure.varint()
+            payload_len = structure.varint() if kind in _DATA_KINDS else 0
+            counts[(kind, width)] = counts.get((kind, width), 0) + 1
+            sections.append((kind, width, payload_len))
+        items.append((edition, discipline, sections))
+
+    # 2. En-têtes, groupe par groupe (ordre de première apparition)
+    headers = _Reader(reader.take(reader.varint()))
+    rows = {}
+    for (kind, width), count in counts.items():
+        rows[(kind, width)] = iter(_untranspose(headers.take(count * width), count, width))
+
+    # 3. Assemblage avec les données
+    out = []
+    for edition, discipline, content in items:
+        if edition == 0:
+            out.append(reader.take(content))
+            continue
+        sections = [(kind, next(rows[(kind, width)]), reader.take(payload_len))
+                    for kind, width, payload_len in content]
+        out.append(assemble_record(edition, discipline, sections))
+    return b''.join(out)
+
+
+def is_stripped(data):
+    return data[:len(MAGIC)] == MAGIC
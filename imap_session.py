@@ -0,0 +1,535 @@
+# imap_session.py - v1.5.1
+"""
+Session IMAP persistante partagée entre check_gmail et l'attente Saildocs
+
+v1.5.1:
+- idle_wait(): lignes déjà lues par imaplib (conn.file) traitées avant
+  select(), un EXISTS arrivé avec le "+ idling" n'attend plus le timeout
+
+v1.5.0:
+- Une session par compte du registre (accounts.py)
+
+v1.4.0:
+- envelope_date(): date d'envoi (en-tête Date) pour l'expiration des requêtes
+
+v1.3.0:
+- mailbox_status(): UIDVALIDITY / UIDNEXT pour la synchro incrémentale
+
+v1.2.0:
+- FETCH groupés: ENVELOPE + BODYSTRUCTURE pour tout un lot d'UID,
+  puis BODY.PEEK[section] de la seule partie texte utile
+
+v1.1.0:
+- idle_wait(): IMAP IDLE (RFC 2177) pour réveil immédiat sur nouveau message
+- Mode non-TLS (IMAP_USE_SSL=0) pour tester contre un serveur IMAP local
+
+v1.0.0:
+- Une seule connexion TLS + login, réutilisée entre les cycles
+- Keepalive NOOP si la session est restée inactive
+- Reconnexion automatique et re-SELECT en cas d'échec
+- Compteurs connexions / logins / réutilisations
+"""
+
+import base64
+import imaplib
+import quopri
+import re
+import select
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from email.header import decode_header, make_header
+from email.utils import parsedate_to_datetime
+from config import (GARMIN_USERNAME, GARMIN_PASSWORD, IMAP_HOST, IMAP_PORT,
+                    IMAP_USE_SSL, IMAP_NOOP_INTERVAL)
+
+
+class ImapSessionManager:
+    """
+    Gestionnaire d'une session IMAP longue durée
+
+    Les appelants empruntent la connexion via session() ; l'accès est
+    sérialisé par un verrou car imaplib n'est pas thread-safe.
+    """
+
+    def __init__(self, host=IMAP_HOST, port=IMAP_PORT, username=GARMIN_USERNAME,
+                 password=GARMIN_PASSWORD, mailbox='inbox', noop_interval=IMAP_NOOP_INTERVAL,
+                 use_ssl=IMAP_USE_SSL):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.mailbox = mailbox
+        self.noop_interval = noop_interval
+
+        self._lock = threading.RLock()
+        self._conn = None
+        self._last_used = 0.0
+        self.stats = {
+            'connects': 0,
+            'logins': 0,
+            'reuses': 0,
+            'reconnects': 0,
+            'noops': 0,
+            'idles': 0,
+            'failures': 0,
+        }
+
+    def _connect(self):
+        """Ouvre la connexion TLS, s'authentifie et sélectionne la boîte"""
+        if self.use_ssl:
+            conn = imaplib.IMAP4_SSL(self.host, self.port)
+        else:
+            conn = imaplib.IMAP4(self.host, self.port)
+        self.stats['connects'] += 1
+        conn.login(self.username, self.password)
+        self.stats['logins'] += 1
+        status, _ = conn.select(self.mailbox)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"SELECT {self.mailbox} refusé")
+        print(f"🔌 IMAP connecté ({self.host}) - connexions: {self.stats['connects']}", flush=True)
+        self._conn = conn
+
+    def _reset(self):
+        """Abandonne la connexion courante sans lever d'exception"""
+        if self._conn is not None:
+            try:
+                self._conn.logout()
+            except Exception:
+                pass
+        self._conn = None
+
+    def _is_healthy(self):
+        """Vérifie la session ; NOOP seulement si inactive depuis noop_interval"""
+        if self._conn is None:
+            return False
+        if time.time() - self._last_used < self.noop_interval:
+            return True
+        try:
+            status, _ = self._conn.noop()
+            self.stats['noops'] += 1
+            return status == 'OK'
+        except Exception as e:
+            print(f"⚠️ IMAP NOOP échoué: {e}", flush=True)
+            return False
+
+    def _ensure(self):
+        if self._is_healthy():
+            self.stats['reuses'] += 1
+            return
+        if self._conn is not None:
+            self.stats['reconnects'] += 1
+            self._reset()
+        self._connect()
+
+    @contextmanager
+    def session(self):
+        """
+        Emprunte la connexion IMAP (boîte déjà sélectionnée)
+
+        Sur erreur réseau la session est abandonnée et sera recréée au
+        prochain emprunt ; sur erreur protocole on tente un re-SELECT.
+        """
+        with self._lock:
+            self._ensure()
+            try:
+                yield self._conn
+            except (imaplib.IMAP4.abort, OSError):
+                self.stats['failures'] += 1
+                self._reset()
+                raise
+            except imaplib.IMAP4.error:
+                self.stats['failures'] += 1
+                try:
+                    status, _ = self._conn.select(self.mailbox)
+                    if status != 'OK':
+                        self._reset()
+                except Exception:
+                    self._reset()
+                raise
+            finally:
+                self._last_used = time.time()
+
+    def supports_idle(self):
+        """True si le serveur annonce la capacité IDLE"""
+        with self.session() as conn:
+            return 'IDLE' in conn.capabilities
+
+    def idle_wait(self, timeout):
+        """
+        Attend en IMAP IDLE qu'un message arrive dans la boîte
+
+        imaplib (Python < 3.14) n'implémente pas IDLE : la commande est
+        envoyée à la main et la socket surveillée par select() pour ne pas
+        mettre le fichier de lecture d'imaplib en état de timeout.
+
+        Args:
+            timeout: Durée max d'attente (secondes) avant DONE
+
+        Returns:
+            bool: True si EXISTS/RECENT reçu (nouveau courrier)
+        """
+        with self.session() as conn:
+            if 'IDLE' not in conn.capabilities:
+                raise imaplib.IMAP4.error("IDLE non supporté par le serveur")
+
+            tag = conn._new_tag()
+            conn.send(tag + b' IDLE\r\n')
+            line = conn.readline()
+            if not line.startswith(b'+'):
+                raise imaplib.IMAP4.error(f"IDLE refusé: {line!r}")
+
+            sock = conn.socket()
+            has_new = False
+            deadline = time.time() + timeout
+            while not has_new:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                if not _has_buffered_input(conn, sock):
+                    readable, _, _ = select.select([sock], [], [], remaining)
+                    if not readable:
+                        break
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connexion fermée pendant IDLE")
+                if line.startswith(b'*') and (b'EXISTS' in line or b'RECENT' in line):
+                    has_new = True
+
+            conn.send(b'DONE\r\n')
+            while True:
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connexion fermée après DONE")
+                if line.startswith(tag):
+                    if b' OK' not in line:
+                        raise imaplib.IMAP4.error(f"IDLE terminé en erreur: {line!r}")
+                    break
+                if b'EXISTS' in line:
+                    has_new = True
+
+            self.stats['idles'] += 1
+            return has_new
+
+    def close(self):
+        """Ferme proprement la session (arrêt du service)"""
+        with self._lock:
+            self._reset()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, connected=self._conn is not None)
+
+
+def _has_buffered_input(conn, sock):
+    """
+    Données lisibles sans bloquer: tampon de lecture d'imaplib (conn.file),
+    tampon TLS ou socket
+    
+    select() ne voit que la socket : une ligne déjà lue dans conn.file
+    (même paquet que la réponse précédente) passerait inaperçue.
+    """
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        return bool(conn.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def manager_for_account(account):
+    """Nouveau gestionnaire avec les identifiants et le serveur d'un compte"""
+    return ImapSessionManager(host=account.imap_host, port=account.imap_port,
+                              username=account.username, password=account.password,
+                              use_ssl=account.imap_use_ssl)
+
+
+def get_imap_manager(account=None):
+    """
+    Retourne le gestionnaire IMAP partagé d'un compte
+
+    Args:
+        account: Nom ou Account (None: premier compte du registre)
+    """
+    from accounts import get_account
+    account = get_account(account)
+    with _managers_lock:
+        if account.name not in _managers:
+            _managers[account.name] = manager_for_account(account)
+        return _managers[account.name]
+
+
+def get_all_imap_stats():
+    """Compteurs de chaque session ouverte, par compte"""
+    with _managers_lock:
+        managers = dict(_managers)
+    return {name: manager.get_stats() for name, manager in managers.items()}
+
+
+def imap_session(account=None):
+    """Raccourci: with imap_session(account) as mail: ..."""
+    return get_imap_manager(account).session()
+
+
+# ==========================================
+# FETCH GROUPÉS (ENVELOPE / BODYSTRUCTURE / BODY.PEEK)
+# ==========================================
+
+_TOKEN_RE = re.compile(
+    rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\x00(\d+)\x00|'
+    rb'([^\s()"\x00\[]+(?:\[[^\]]*\](?:<\d+>)?)?))'
+)
+_LITERAL_RE = re.compile(rb'\{\d+\}$')
+
+
+def _split_fetch_responses(data):
+    """
+    Regroupe la sortie FETCH d'imaplib en réponses (texte, littéraux)
+
+    imaplib renvoie pour chaque message des tuples (préfixe, littéral)
+    suivis d'un bytes final ; les littéraux sont remplacés par un
+    marqueur \\x00<index>\\x00 pour le tokenizer.
+    """
+    responses = []
+    current, literals = b'', []
+    for item in data:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            prefix, literal = item
+            current += _LITERAL_RE.sub(b'', prefix) + b'\x00%d\x00' % len(literals)
+            literals.append(literal)
+        else:
+            current += item
+            responses.append((current, literals))
+            current, literals = b'', []
+    if current:
+        responses.append((current, literals))
+    return responses
+
+
+def parse_imap_list(data, literals=()):
+    """Parse une réponse IMAP parenthésée en listes Python imbriquées (NIL → None)"""
+    stack = [[]]
+    pos = 0
+    while pos < len(data):
+        m = _TOKEN_RE.match(data, pos)
+        if not m:
+            break
+        pos = m.end()
+        if m.group(1):
+            child = []
+            stack[-1].append(child)
+            stack.append(child)
+        elif m.group(2):
+            if len(stack) > 1:
+                stack.pop()
+        elif m.group(3) is not None:
+            stack[-1].append(re.sub(rb'\\(.)', rb'\1', m.group(3)))
+        elif m.group(4):
+            stack[-1].append(literals[int(m.group(4))])
+        else:
+            atom = m.group(5)
+            stack[-1].append(None if atom.upper() == b'NIL' else atom)
+    return stack[0]
+
+
+def parse_fetch_data(data):
+    """
+    Parse la sortie d'un FETCH (format imaplib)
+
+    Returns:
+        dict: {uid (bytes): {ITEM (bytes, majuscules): valeur}}
+    """
+    results = {}
+    for text, literals in _split_fetch_responses(data):
+        parsed = parse_imap_list(text, literals)
+        if len(parsed) < 2 or not isinstance(parsed[1], list):
+            continue
+        pairs = parsed[1]
+        fields = {pairs[i].upper(): pairs[i + 1] for i in range(0, len(pairs) - 1, 2)
+                  if isinstance(pairs[i], bytes)}
+        if b'UID' in fields:
+            results[fields[b'UID']] = fields
+    return results
+
+
+def uid_fetch(conn, uids, items):
+    """
+    UID FETCH groupé
+
+    Returns:
+        dict: {uid (bytes): {ITEM (bytes, majuscules): valeur}}
+    """
+    if not uids:
+        return {}
+    status, data = conn.uid('FETCH', b','.join(uids).decode(), items)
+    if status != 'OK':
+        raise imaplib.IMAP4.error(f"UID FETCH {items} refusé")
+    return parse_fetch_data(data)
+
+
+def group_by_section(targets):
+    """{uid: (section, ...)} → {section: [uid, ...]} pour un FETCH par section"""
+    by_section = {}
+    for uid, target in targets.items():
+        by_section.setdefault(target[0], []).append(uid)
+    return by_section
+
+
+def _walk_parts(structure, section=''):
+    """Itère (section, champs) sur les parties feuilles d'un BODYSTRUCTURE"""
+    if structure and isinstance(structure[0], list):
+        n = 0
+        for part in structure:
+            if not isinstance(part, list):
+                break
+            n += 1
+            yield from _walk_parts(part, f"{section}.{n}" if section else str(n))
+    else:
+        yield section or '1', structure
+
+
+def find_part(structure, maintype, subtypes):
+    """
+    Cherche une partie feuille du type voulu, par ordre de préférence des sous-types
+
+    Returns:
+        tuple: (section, subtype, encoding, charset) ou None
+    """
+    parts = list(_walk_parts(structure))
+    for wanted in subtypes:
+        for section, fields in parts:
+            if len(fields) < 6 or not isinstance(fields[0], bytes):
+                continue
+            if fields[0].upper() != maintype or (fields[1] or b'').upper() != wanted:
+                continue
+            params = fields[2] or []
+            charset = 'utf-8'
+            for i in range(0, len(params) - 1, 2):
+                if params[i].upper() == b'CHARSET' and params[i + 1]:
+                    charset = params[i + 1].decode('ascii', errors='ignore')
+            encoding = (fields[5] or b'7BIT').upper()
+            return section, wanted, encoding, charset
+    return None
+
+
+def find_text_part(structure, subtypes=(b'PLAIN', b'HTML')):
+    """Cherche la partie texte à télécharger (text/plain puis text/html)"""
+    return find_part(structure, b'TEXT', subtypes)
+
+
+def decode_part_bytes(payload, encoding):
+    """Décode une partie selon son Content-Transfer-Encoding"""
+    if payload is None:
+        return b""
+    if encoding == b'BASE64':
+        return base64.b64decode(payload)
+    if encoding == b'QUOTED-PRINTABLE':
+        return quopri.decodestring(payload)
+    return payload
+
+
+def decode_part(payload, encoding, charset):
+    """Décode une partie texte (transfer-encoding puis charset)"""
+    payload = decode_part_bytes(payload, encoding)
+    try:
+        return payload.decode(charset, errors='ignore')
+    except LookupError:
+        return payload.decode('utf-8', errors='ignore')
+
+
+def fetch_parts(conn, targets):
+    """
+    Télécharge des parties MIME sans modifier les flags (BODY.PEEK)
+
+    Les UID sont groupés par numéro de section : en pratique tous les
+    emails d'un même expéditeur ont la même structure, donc un seul
+    aller-retour.
+
+    Args:
+        targets: {uid: (section, subtype, encoding, charset)}
+
+    Returns:
+        dict: {uid: bytes décodés (transfer-encoding)}
+    """
+    payloads = {}
+    for section, uids in group_by_section(targets).items():
+        fetched = uid_fetch(conn, uids, f'(UID BODY.PEEK[{section}])')
+        key = f'BODY[{section}]'.encode()
+        for uid, fields in fetched.items():
+            if uid in targets:
+                payloads[uid] = decode_part_bytes(fields.get(key), targets[uid][2])
+    return payloads
+
+
+def fetch_text_parts(conn, targets):
+    """Comme fetch_parts, avec décodage du charset de chaque partie"""
+    texts = {}
+    for uid, payload in fetch_parts(conn, targets).items():
+        charset = targets[uid][3]
+        try:
+            texts[uid] = payload.decode(charset, errors='ignore')
+        except LookupError:
+            texts[uid] = payload.decode('utf-8', errors='ignore')
+    return texts
+
+
+def envelope_subject(envelope):
+    """Sujet décodé (RFC 2047) d'un ENVELOPE"""
+    try:
+        raw = envelope[1]
+    except (IndexError, TypeError):
+        return ""
+    if not raw:
+        return ""
+    try:
+        return str(make_header(decode_header(raw.decode('utf-8', errors='ignore'))))
+    except Exception:
+        return raw.decode('utf-8', errors='ignore')
+
+
+def envelope_sender(envelope):
+    """Adresse 'mailbox@host' du premier expéditeur d'un ENVELOPE"""
+    try:
+        address = envelope[2][0]
+        return f"{address[2].decode()}@{address[3].decode()}".lower()
+    except (IndexError, TypeError, AttributeError):
+        return ""
+
+
+def envelope_date(envelope):
+    """Date d'envoi (timestamp) d'un ENVELOPE, None si absente ou illisible"""
+    try:
+        raw = envelope[0]
+        return parsedate_to_datetime(raw.decode('ascii', errors='ignore')).timestamp() if raw else None
+    except (IndexError, TypeError, ValueError):
+        return None
+
+
+def mailbox_status(conn, mailbox='inbox'):
+    """
+    STATUS de la boîte (UIDVALIDITY, UIDNEXT)
+
+    Returns:
+        dict: {'UIDVALIDITY': int, 'UIDNEXT': int}
+    """
+    status, data = conn.status(mailbox, '(UIDVALIDITY UIDNEXT)')
+    if status != 'OK' or not data or not data[0]:
+        raise imaplib.IMAP4.error(f"STATUS {mailbox} refusé")
+    return parse_status_line(data[0])
+
+
+def parse_status_line(line):
+    """b'"INBOX" (UIDVALIDITY 1 UIDNEXT 42)' → {'UIDVALIDITY': 1, 'UIDNEXT': 42}"""
+    parsed = parse_imap_list(line)
+    items = next((x for x in parsed if isinstance(x, list)), [])
+    return {items[i].decode().upper(): int(items[i + 1]) for i in range(0, len(items) - 1, 2)}
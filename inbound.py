@@ -0,0 +1,130 @@
+# inbound.py - v1.1.1
+"""
+Réception d'emails bruts poussés en HTTP (POST /inbound)
+
+Un MTA de transfert ou un webhook mail envoie le message RFC 822 dès
+sa réception : la requête est détectée, persistée (job_store) et mise
+en file par le même chemin que check_gmail, puis la réponse HTTP part
+immédiatement. Le traitement (LLM, Saildocs, envoi) reste dans les
+workers ; le thread Flask ne fait qu'analyser et insérer en base.
+
+v1.1.0: compte destinataire déduit de Delivered-To / To (accounts)
+v1.1.1: en mode asyncio, réveil du lecteur Saildocs du compte destinataire
+"""
+
+import hashlib
+import hmac
+import threading
+from config import INBOUND_TOKEN, EXECUTION_MODE
+from inreach_parser import parse_inreach_email, read_headers
+from email_monitor import enqueue_parsed
+from job_store import get_job_store
+from saildocs_router import get_saildocs_demux
+from backlog_triage import triage_jobs, parse_date_header
+from accounts import get_account, account_for_address
+
+_stats_lock = threading.Lock()
+_stats = {'received': 0, 'queued': 0, 'duplicates': 0, 'ignored': 0, 'rejected': 0}
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def check_token(supplied, expected=INBOUND_TOKEN):
+    """Comparaison à temps constant du jeton partagé"""
+    if not expected or not supplied:
+        return False
+    return hmac.compare_digest(supplied.encode(), expected.encode())
+
+
+def record_rejected():
+    """Requête refusée avant analyse (jeton, taille)"""
+    _count('rejected')
+
+
+def _submit(job_id, job_type, reply_url):
+    if EXECUTION_MODE == 'asyncio':
+        from async_pipeline import get_active_pipeline
+        pipeline = get_active_pipeline()
+        # Pipeline pas encore démarré: le job persisté sera repris à son lancement
+        if pipeline:
+            pipeline.submit_threadsafe(job_id)
+        return
+    from worker_pool import submit_job
+    submit_job(job_id, job_type, device=reply_url)
+
+
+def _wake_saildocs(account):
+    if EXECUTION_MODE == 'asyncio':
+        from async_pipeline import get_active_pipeline
+        pipeline = get_active_pipeline()
+        if pipeline:
+            pipeline.notify_new_mail_threadsafe(account)
+        return
+    get_saildocs_demux(account).notify_new_mail()
+
+
+def recipient_account(headers):
+    """Compte auquel l'email était adressé (Delivered-To, puis To), sinon premier compte"""
+    for name in ('delivered-to', 'x-original-to', 'to'):
+        account = account_for_address(headers.get(name))
+        if account:
+            return account
+    return get_account()
+
+
+def ingest_raw_message(raw):
+    """
+    Détecte, persiste et met en file la requête d'un email brut
+
+    Args:
+        raw: Octets RFC 822
+
+    Returns:
+        dict: {'status': 'queued'|'duplicate'|'ignored'|'saildocs', ...}
+    """
+    _count('received')
+    headers = read_headers(raw)
+    sender = headers.get('from', '').lower()
+    account = recipient_account(headers)
+
+    if 'saildocs' in sender:
+        # Le fichier GRIB est lu par le démultiplexeur (IMAP) du compte : simple réveil
+        _wake_saildocs(account)
+        _count('ignored')
+        return {'status': 'saildocs'}
+    if 'inreach' not in sender and 'garmin' not in sender:
+        _count('ignored')
+        return {'status': 'ignored', 'reason': 'expéditeur non inReach'}
+
+    parsed = parse_inreach_email(raw)
+    if not parsed or not parsed['reply_url']:
+        _count('ignored')
+        return {'status': 'ignored', 'reason': 'pas de partie texte ou URL de réponse'}
+
+    # Sans Message-ID, l'empreinte du message brut rend les re-livraisons du webhook idempotentes
+    job_id = headers.get('message-id', '').strip() or f"sha256:{hashlib.sha256(raw).hexdigest()}"
+
+    store = get_job_store()
+    found = enqueue_parsed(store, job_id, parsed, parse_date_header(headers.get('date')), account.name)
+    if not found:
+        if store.get(job_id):
+            _count('duplicates')
+            return {'status': 'duplicate', 'job_id': job_id}
+        _count('ignored')
+        return {'status': 'ignored', 'reason': 'aucune commande reconnue'}
+
+    # Un MTA qui relivre une file en retard: même tri qu'au rattrapage IMAP
+    for child_id, job_type, reply_url in triage_jobs(child_id for child_id, _, _ in found):
+        _submit(child_id, job_type, reply_url)
+    _count('queued')
+    types = [job_type for _, job_type, _ in found]
+    print(f"📨 /inbound [{account.name}]: job {job_id} ({', '.join(types)}) en file", flush=True)
+    return {'status': 'queued', 'job_id': job_id, 'types': types, 'account': account.name}
@@ -0,0 +1,241 @@
+# inreach_parser.py - v1.1.0
+"""
+Extracteur rapide des notifications Garmin inReach
+
+- Partie text/plain d'abord, HTML nettoyé seulement en repli
+  (les regex ne balaient plus le doublon HTML ni le balisage)
+- Un seul passage sur les octets pour le texte de la requête,
+  l'URL de réponse et la position Lat/Lon
+- Découpage MIME direct sur les octets, sans construire d'arbre
+  email.message complet
+
+v1.1.0: read_headers() pour les emails bruts reçus hors IMAP (/inbound)
+"""
+
+import binascii
+import html
+import re
+import time
+
+_HEADER_END_RE = re.compile(rb'\r?\n\r?\n')
+_FOLD_RE = re.compile(rb'\r?\n[ \t]+')
+_PARAM_RE = re.compile(rb';\s*([\w-]+)\s*=\s*(?:"([^"]*)"|([^\s;]+))')
+
+_HTML_DROP_RE = re.compile(rb'<(script|style|head)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_HTML_HREF_RE = re.compile(rb'<a\s[^>]*?href\s*=\s*["\']([^"\']+)["\'][^>]*>', re.IGNORECASE)
+_HTML_BREAK_RE = re.compile(rb'<(?:br|/p|/div|/tr|/li|/h\d)\b[^>]*>', re.IGNORECASE)
+_HTML_TAG_RE = re.compile(rb'<[^>]+>')
+
+# Un seul balayage: URL de réponse, position, début du pied de page Garmin
+_SCAN_RE = re.compile(
+    rb'(?P<inreach>https://inreachlink\.com/[A-Za-z0-9_-]+)'
+    rb'|(?P<garmin>https://[^\s<>"]*garmin\.com/[^\s<>"]+)'
+    rb'|Lat\s*(?P<lat>[-+]?\d{1,2}(?:\.\d+)?)\s*,?\s*Lon\s*(?P<lon>[-+]?\d{1,3}(?:\.\d+)?)'
+    rb'|(?P<footer>View the location or send a reply to|sent this message from:'
+    rb'|Do not reply directly to this message|This message was sent to you using)',
+    re.IGNORECASE
+)
+_WS_RE = re.compile(rb'\s+')
+
+
+def _split_headers(raw):
+    """Sépare en-têtes et corps ; en-têtes en dict {nom minuscule: valeur dépliée}"""
+    if raw.startswith((b'\r\n', b'\n')):
+        return {}, raw.lstrip(b'\r\n')
+    m = _HEADER_END_RE.search(raw)
+    block, body = (raw[:m.start()], raw[m.end():]) if m else (raw, b'')
+    headers = {}
+    for line in _FOLD_RE.sub(b' ', block).splitlines():
+        name, sep, value = line.partition(b':')
+        if sep:
+            headers.setdefault(name.strip().lower(), value.strip())
+    return headers, body
+
+
+def read_headers(raw):
+    """
+    En-têtes de premier niveau d'un email brut
+
+    Returns:
+        dict: {nom en minuscules: valeur dépliée (str)}
+    """
+    headers, _ = _split_headers(raw)
+    return {name.decode('ascii', errors='ignore'): value.decode('utf-8', errors='ignore')
+            for name, value in headers.items()}
+
+
+def _content_type(headers):
+    value = headers.get(b'content-type', b'text/plain')
+    ctype = value.split(b';', 1)[0].strip().lower()
+    params = {m.group(1).lower(): m.group(2) if m.group(2) is not None else m.group(3)
+              for m in _PARAM_RE.finditer(value)}
+    return ctype, params
+
+
+def _iter_leaf_parts(raw, depth=0):
+    """Itère (content-type, params, transfer-encoding, corps brut) des parties feuilles"""
+    headers, body = _split_headers(raw)
+    ctype, params = _content_type(headers)
+    boundary = params.get(b'boundary')
+    if ctype.startswith(b'multipart/') and boundary and depth < 5:
+        chunks = body.split(b'--' + boundary)
+        for chunk in chunks[1:]:
+            if chunk.startswith(b'--'):
+                break
+            if chunk.startswith(b'\r\n'):
+                chunk = chunk[2:]
+            elif chunk.startswith(b'\n'):
+                chunk = chunk[1:]
+            if chunk.endswith(b'\r\n'):
+                chunk = chunk[:-2]
+            elif chunk.endswith(b'\n'):
+                chunk = chunk[:-1]
+            yield from _iter_leaf_parts(chunk, depth + 1)
+    else:
+        encoding = headers.get(b'content-transfer-encoding', b'7bit').strip().lower()
+        yield ctype, params, encoding, body
+
+
+def _decode_transfer(body, encoding):
+    if encoding == b'base64':
+        try:
+            return binascii.a2b_base64(body)
+        except binascii.Error:
+            return b''
+    if encoding == b'quoted-printable':
+        return binascii.a2b_qp(body)
+    return body
+
+
+def strip_html(payload):
+    """HTML → texte ; les href des liens sont conservés à côté de leur libellé"""
+    payload = _HTML_DROP_RE.sub(b' ', payload)
+    payload = _HTML_HREF_RE.sub(lambda m: b' ' + m.group(1) + b' ', payload)
+    payload = _HTML_BREAK_RE.sub(b'\n', payload)
+    payload = _HTML_TAG_RE.sub(b' ', payload)
+    return html.unescape(payload.decode('utf-8', errors='ignore')).encode('utf-8')
+
+
+def parse_inreach_part(payload, is_html=False, charset='utf-8'):
+    """
+    Analyse la partie texte d'une notification inReach (déjà décodée du transfer-encoding)
+
+    Args:
+        payload: Octets de la partie
+        is_html: True si la partie est du text/html (repli)
+        charset: Charset déclaré de la partie
+
+    Returns:
+        dict: {'text', 'reply_url', 'lat', 'lon', 'source'}
+    """
+    if is_html:
+        payload = strip_html(payload)
+        charset = 'utf-8'
+
+    inreach_url = garmin_url = lat = lon = None
+    footer_at = len(payload)
+    for m in _SCAN_RE.finditer(payload):
+        kind = m.lastgroup
+        if kind == 'inreach':
+            inreach_url = inreach_url or m.group('inreach')
+        elif kind == 'garmin':
+            garmin_url = garmin_url or m.group('garmin')
+        elif kind == 'lon' and lat is None:
+            lat, lon = float(m.group('lat')), float(m.group('lon'))
+        elif kind == 'footer' and footer_at == len(payload):
+            # Le pied commence en début de ligne ("<Nom> sent this message from:")
+            footer_at = payload.rfind(b'\n', 0, m.start()) + 1
+
+    url = inreach_url or (garmin_url.rstrip(b'.,;)\'"<>') if garmin_url else None)
+    text = _WS_RE.sub(b' ', payload[:footer_at]).strip()
+    try:
+        text = text.decode(charset, errors='ignore')
+    except LookupError:
+        text = text.decode('utf-8', errors='ignore')
+
+    return {
+        'text': text,
+        'reply_url': url.decode('ascii', errors='ignore') if url else None,
+        'lat': lat,
+        'lon': lon,
+        'source': 'html' if is_html else 'plain',
+    }
+
+
+def parse_inreach_email(raw):
+    """
+    Analyse un email inReach complet (RFC 822, octets)
+
+    Returns:
+        dict comme parse_inreach_part, ou None sans partie texte
+    """
+    html_part = None
+    for ctype, params, encoding, body in _iter_leaf_parts(raw):
+        charset = (params.get(b'charset') or b'utf-8').decode('ascii', errors='ignore')
+        if ctype == b'text/plain':
+            return parse_inreach_part(_decode_transfer(body, encoding), False, charset)
+        if ctype == b'text/html' and html_part is None:
+            html_part = (body, encoding, charset)
+    if html_part:
+        body, encoding, charset = html_part
+        return parse_inreach_part(_decode_transfer(body, encoding), True, charset)
+    return None
+
+
+# Benchmark sur le corpus de fixtures
+if __name__ == "__main__":
+    import email
+    import glob
+    import os
+    import sys
+
+    fixture_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'inreach')
+    iterations = 2000
+
+    def legacy_parse(raw):
+        """Chemin historique: email.message + concaténation plain+html + regex"""
+        msg = email.message_from_bytes(raw)
+        body = ""
+        for part in msg.walk():
+            if part.get_content_type() in ["text/plain", "text/html"]:
+                payload = part.get_payload(decode=True)
+                if payload:
+                    body += payload.decode('utf-8', errors='ignore')
+        match = re.search(r'https://inreachlink\.com/[A-Za-z0-9_-]+', body, re.IGNORECASE)
+        if not match:
+            match = re.search(r'https://[^\s]+garmin\.com/[^\s]+', body, re.IGNORECASE)
+        return body, match.group(0) if match else None
+
+    print("=" * 70)
+    print("BENCHMARK EXTRACTION INREACH")
+    print("=" * 70)
+    total_new = total_old = 0.0
+    files = sorted(glob.glob(os.path.join(fixture_dir, '*.eml')))
+    for path in files:
+        with open(path, 'rb') as f:
+            raw = f.read()
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parsed = parse_inreach_email(raw)
+        new_us = (time.perf_counter() - start) / iterations * 1e6
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            legacy_parse(raw)
+        old_us = (time.perf_counter() - start) / iterations * 1e6
+
+        total_new += new_us
+        total_old += old_us
+        print(f"\n📧 {os.path.basename(path)} ({len(raw)} octets)")
+        print(f"   ⏱️  {new_us:7.1f} µs/msg (historique: {old_us:7.1f} µs/msg)")
+        print(f"   📝 [{parsed['source']}] {parsed['text'][:70]}")
+        print(f"   🔗 {parsed['reply_url']}")
+        print(f"   📍 {parsed['lat']}, {parsed['lon']}")
+
+    if files:
+        print("\n" + "=" * 70)
+        print(f"Moyenne: {total_new / len(files):.1f} µs/msg "
+              f"(historique: {total_old / len(files):.1f} µs/msg, x{total_old / total_new:.1f})")
+        print("=" * 70)
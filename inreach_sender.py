@@ -1,20 +1,28 @@
-# inreach_sender.py - v3.5.0
-"""Module envoi inReach - Version stable avec MAILERSEND"""
+# inreach_sender.py - v3.8.0
+"""Module envoi inReach - Version stable avec MAILERSEND
 
+v3.8.0: identifiants Garmin du compte du job (accounts.py)
+v3.7.0: variantes asyncio (playwright.async_api, httpx) pour EXECUTION_MODE=asyncio
+v3.6.0: callback on_sent(i) après chaque message confirmé (reprise des jobs)
+"""
+
+import asyncio
 import time
 import requests
 from urllib.parse import urlparse, parse_qs
 from playwright.sync_api import sync_playwright
-from config import (GARMIN_USERNAME, GARMIN_PASSWORD, MAILERSEND_API_KEY,
+from accounts import get_account
+from config import (MAILERSEND_API_KEY,
                     DELAY_BETWEEN_MESSAGES, INREACH_HEADERS, 
                     PLAYWRIGHT_BROWSER_PATH, PLAYWRIGHT_TIMEOUT)
 
 
-def send_via_playwright_inreachlink(url, messages):
+def send_via_playwright_inreachlink(url, messages, on_sent=None, account=None):
     """
     Envoie via Playwright pour URLs inreachlink.com
     Gestion dynamique des boutons Send Reply / Send Message
     """
+    account = get_account(account)
     print(f"🎭 PLAYWRIGHT inReachLink: {len(messages)} messages", flush=True)
     print(f"   URL: {url}", flush=True)
     
@@ -39,7 +47,7 @@ def send_via_playwright_inreachlink(url, messages):
                 
                 email_input = page.locator('input[type="email"]')
                 if email_input.count() > 0:
-                    email_input.fill(GARMIN_USERNAME)
+                    email_input.fill(account.username)
                     time.sleep(1)
                     page.keyboard.press('Enter')
                     page.wait_for_load_state('networkidle', timeout=15000)
@@ -47,7 +55,7 @@ def send_via_playwright_inreachlink(url, messages):
                 
                 password_input = page.locator('input[type="password"]')
                 if password_input.count() > 0:
-                    password_input.fill(GARMIN_PASSWORD)
+                    password_input.fill(account.garmin_password)
                     time.sleep(1)
                     page.keyboard.press('Enter')
                     page.wait_for_load_state('networkidle', timeout=15000)
@@ -130,6 +138,8 @@ def send_via_playwright_inreachlink(url, messages):
                     time.sleep(3)
                     
                     print(f"   ✅ Message {i} envoyé", flush=True)
+                    if on_sent:
+                        on_sent(i)
                     
                 except Exception as e:
                     print(f"   ❌ Erreur message {i}: {e}", flush=True)
@@ -153,8 +163,9 @@ def send_via_playwright_inreachlink(url, messages):
             return False
 
 
-def send_via_post_garmin(url, messages):
+def send_via_post_garmin(url, messages, on_sent=None, account=None):
     """Envoie via POST pour URLs explore.garmin.com"""
+    account = get_account(account)
     print(f"📮 POST Garmin: {len(messages)} messages", flush=True)
     
     try:
@@ -170,7 +181,7 @@ def send_via_post_garmin(url, messages):
             data = {
                 'ReplyMessage': message,
                 'Guid': guid,
-                'ReplyAddress': GARMIN_USERNAME
+                'ReplyAddress': account.username
             }
             
             response = requests.post(url, headers=INREACH_HEADERS, data=data, timeout=30)
@@ -178,6 +189,8 @@ def send_via_post_garmin(url, messages):
             if response.status_code == 200:
                 success_count += 1
                 print(f"   ✅ Message {i}/{len(messages)}", flush=True)
+                if on_sent:
+                    on_sent(i)
             else:
                 print(f"   ❌ Message {i} - HTTP {response.status_code}", flush=True)
             
@@ -191,45 +204,51 @@ def send_via_post_garmin(url, messages):
         return False
 
 
-def send_via_email(reply_email, messages):
+def _mailersend_request(reply_email, messages):
+    """URL, headers et payload MailerSend (tous les messages combinés)"""
+    combined = "\n\n---\n\n".join([
+        f"Message {i}/{len(messages)}:\n{msg}" 
+        for i, msg in enumerate(messages, 1)
+    ])
+    
+    url = "https://api.mailersend.com/v1/email"
+    
+    headers = {
+        "Authorization": f"Bearer {MAILERSEND_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    
+    payload = {
+        "from": {
+            "email": "inreach@trial-0r83ql3zw7mgzw1j.mlsender.net",
+            "name": "Garmin inReach"
+        },
+        "to": [
+            {
+                "email": reply_email
+            }
+        ],
+        "subject": "GRIB Weather Data Response",
+        "text": combined
+    }
+    return url, headers, payload
+
+
+def send_via_email(reply_email, messages, on_sent=None):
     """Envoie via email MailerSend"""
     if not MAILERSEND_API_KEY:
         print("❌ MAILERSEND_API_KEY non configurée", flush=True)
         return False
     
     try:
-        # Combiner tous les messages
-        combined = "\n\n---\n\n".join([
-            f"Message {i}/{len(messages)}:\n{msg}" 
-            for i, msg in enumerate(messages, 1)
-        ])
-        
-        # API MailerSend
-        url = "https://api.mailersend.com/v1/email"
-        
-        headers = {
-            "Authorization": f"Bearer {MAILERSEND_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "from": {
-                "email": "inreach@trial-0r83ql3zw7mgzw1j.mlsender.net",
-                "name": "Garmin inReach"
-            },
-            "to": [
-                {
-                    "email": reply_email
-                }
-            ],
-            "subject": "GRIB Weather Data Response",
-            "text": combined
-        }
+        url, headers, payload = _mailersend_request(reply_email, messages)
         
         response = requests.post(url, headers=headers, json=payload, timeout=30)
         
         if response.status_code == 202:
             print(f"✅ Email envoyé ({len(messages)} messages)", flush=True)
+            if on_sent:
+                on_sent(len(messages))
             return True
         else:
             print(f"❌ Email erreur HTTP {response.status_code}", flush=True)
@@ -240,10 +259,15 @@ def send_via_email(reply_email, messages):
         return False
 
 
-def send_to_inreach(url, messages, reply_email=None):
+def send_to_inreach(url, messages, reply_email=None, on_sent=None, account=None):
     """
     Routeur intelligent pour envoi inReach
     Détecte automatiquement la méthode selon l'URL
+    
+    Args:
+        on_sent: Callback optionnel on_sent(i) appelé après chaque message
+                 confirmé (i = index 1-based dans messages)
+        account: Compte (nom ou Account) dont les identifiants Garmin servent à répondre
     """
     print(f"\n{'='*70}", flush=True)
     print(f"📤 ENVOI INREACH: {len(messages)} messages", flush=True)
@@ -252,16 +276,189 @@ def send_to_inreach(url, messages, reply_email=None):
     # Choix de la méthode selon l'URL
     if 'inreachlink.com' in url:
         print("🎯 Mode: PLAYWRIGHT (inreachlink.com)", flush=True)
-        return send_via_playwright_inreachlink(url, messages)
+        return send_via_playwright_inreachlink(url, messages, on_sent, account)
         
     elif 'garmin.com' in url and 'textmessage' in url and 'extId' in url:
         print("🎯 Mode: POST (explore.garmin.com)", flush=True)
-        return send_via_post_garmin(url, messages)
+        return send_via_post_garmin(url, messages, on_sent, account)
         
     elif reply_email:
         print("🎯 Mode: EMAIL (MailerSend)", flush=True)
-        return send_via_email(reply_email, messages)
+        return send_via_email(reply_email, messages, on_sent)
         
     else:
         print(f"❌ URL non supportée: {url}", flush=True)
         return False
+
+
+# ==========================================
+# VARIANTES ASYNCIO (EXECUTION_MODE=asyncio)
+# ==========================================
+
+async def send_via_playwright_inreachlink_async(browser, url, messages, on_sent=None, account=None):
+    """
+    Variante playwright.async_api de send_via_playwright_inreachlink
+    
+    Le navigateur est partagé par le pipeline asyncio : chaque envoi ouvre
+    seulement un contexte (cookies isolés par compte), et les délais entre
+    messages sont des asyncio.sleep (aucun thread bloqué).
+    """
+    account = get_account(account)
+    print(f"🎭 PLAYWRIGHT async: {len(messages)} messages → {url}", flush=True)
+    context = await browser.new_context()
+    try:
+        page = await context.new_page()
+        await page.goto(url, wait_until='networkidle', timeout=PLAYWRIGHT_TIMEOUT)
+        await asyncio.sleep(2)
+        
+        # Login Garmin si nécessaire
+        if 'sso.garmin.com' in page.url or await page.locator('input[type="email"]').count() > 0:
+            email_input = page.locator('input[type="email"]')
+            if await email_input.count() > 0:
+                await email_input.fill(account.username)
+                await asyncio.sleep(1)
+                await page.keyboard.press('Enter')
+                await page.wait_for_load_state('networkidle', timeout=15000)
+                await asyncio.sleep(2)
+            
+            password_input = page.locator('input[type="password"]')
+            if await password_input.count() > 0:
+                await password_input.fill(account.garmin_password)
+                await asyncio.sleep(1)
+                await page.keyboard.press('Enter')
+                await page.wait_for_load_state('networkidle', timeout=15000)
+                await asyncio.sleep(3)
+        
+        await asyncio.sleep(2)
+        
+        for i, message in enumerate(messages, 1):
+            try:
+                if i > 1:
+                    await asyncio.sleep(DELAY_BETWEEN_MESSAGES)
+                    try:
+                        await page.wait_for_load_state('networkidle', timeout=10000)
+                    except Exception:
+                        pass
+                    await asyncio.sleep(2)
+                
+                await asyncio.sleep(1)
+                send_reply = page.locator('button:has-text("Send Reply")')
+                send_msg = page.locator('button:has-text("Send Message")')
+                if await send_reply.count() > 0:
+                    await send_reply.first.wait_for(state="visible", timeout=10000)
+                    await send_reply.first.click()
+                    await asyncio.sleep(2)
+                elif await send_msg.count() > 0:
+                    await send_msg.first.wait_for(state="visible", timeout=10000)
+                    await send_msg.first.click()
+                    await asyncio.sleep(2)
+                
+                textarea = page.locator("textarea").first
+                try:
+                    await textarea.wait_for(state="visible", timeout=15000)
+                except Exception:
+                    await asyncio.sleep(3)
+                    await textarea.wait_for(state="visible", timeout=10000)
+                
+                await textarea.fill("")
+                await asyncio.sleep(0.3)
+                await textarea.fill(message)
+                await asyncio.sleep(0.5)
+                
+                send_final = page.locator('button:has-text("Send")').last
+                await send_final.wait_for(state="visible", timeout=10000)
+                await send_final.click()
+                await asyncio.sleep(3)
+                
+                print(f"   ✅ Message {i}/{len(messages)} envoyé (async)", flush=True)
+                if on_sent:
+                    on_sent(i)
+            except Exception as e:
+                print(f"   ❌ Erreur message {i}: {e}", flush=True)
+                continue
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Erreur globale Playwright async: {e}", flush=True)
+        return False
+    finally:
+        await context.close()
+
+
+async def send_via_post_garmin_async(client, url, messages, on_sent=None, account=None):
+    """Variante httpx.AsyncClient de send_via_post_garmin"""
+    try:
+        guid = parse_qs(urlparse(url).query).get('extId', [None])[0]
+        if not guid:
+            print("❌ GUID non trouvé dans l'URL", flush=True)
+            return False
+        
+        success_count = 0
+        for i, message in enumerate(messages, 1):
+            data = {
+                'ReplyMessage': message,
+                'Guid': guid,
+                'ReplyAddress': get_account(account).username
+            }
+            response = await client.post(url, headers=INREACH_HEADERS, data=data, timeout=30)
+            
+            if response.status_code == 200:
+                success_count += 1
+                print(f"   ✅ Message {i}/{len(messages)} (async)", flush=True)
+                if on_sent:
+                    on_sent(i)
+            else:
+                print(f"   ❌ Message {i} - HTTP {response.status_code}", flush=True)
+            
+            if i < len(messages):
+                await asyncio.sleep(DELAY_BETWEEN_MESSAGES)
+        
+        return success_count == len(messages)
+        
+    except Exception as e:
+        print(f"❌ Erreur POST async: {e}", flush=True)
+        return False
+
+
+async def send_via_email_async(client, reply_email, messages, on_sent=None):
+    """Variante httpx.AsyncClient de send_via_email"""
+    if not MAILERSEND_API_KEY:
+        print("❌ MAILERSEND_API_KEY non configurée", flush=True)
+        return False
+    
+    try:
+        url, headers, payload = _mailersend_request(reply_email, messages)
+        response = await client.post(url, headers=headers, json=payload, timeout=30)
+        if response.status_code == 202:
+            if on_sent:
+                on_sent(len(messages))
+            return True
+        print(f"❌ Email erreur HTTP {response.status_code}", flush=True)
+        return False
+    except Exception as e:
+        print(f"❌ Erreur email async: {e}", flush=True)
+        return False
+
+
+async def send_to_inreach_async(client, url, messages, reply_email=None, on_sent=None, get_browser=None,
+                                account=None):
+    """
+    Routeur asyncio, même choix de méthode que send_to_inreach
+    
+    Args:
+        client: httpx.AsyncClient partagé
+        get_browser: Coroutine retournant le navigateur Playwright partagé
+                     (lancé seulement si une URL inreachlink.com se présente)
+    """
+    print(f"📤 ENVOI INREACH (async): {len(messages)} messages", flush=True)
+    
+    if 'inreachlink.com' in url:
+        return await send_via_playwright_inreachlink_async(await get_browser(), url, messages, on_sent, account)
+    elif 'garmin.com' in url and 'textmessage' in url and 'extId' in url:
+        return await send_via_post_garmin_async(client, url, messages, on_sent, account)
+    elif reply_email:
+        return await send_via_email_async(client, reply_email, messages, on_sent)
+    
+    print(f"❌ URL non supportée: {url}", flush=True)
+    return False
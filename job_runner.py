@@ -0,0 +1,354 @@
+# job_runner.py - v1.7.1
+"""
+Exécution des jobs persistants (job_store) étape par étape
+
+Chaque étape enregistre son résultat avant de passer à la suivante ;
+run_job() peut donc être relancé sur un job interrompu (redémarrage
+Render, crash) et reprend à la dernière étape terminée.
+
+v1.1.0: jobs groupés (plusieurs commandes dans un email) : chaque enfant
+s'arrête à 'encoded', le parent 'batch' envoie ensuite toutes les
+réponses en un seul lot, dans l'ordre des commandes
+v1.2.0: reprise triée par backlog_triage (expiration, doublons, fraîcheur)
+v1.3.0: Saildocs et réponses via le compte du job (request['account'])
+v1.4.0: format de réponse GRIB du job (request['format'], compact_grid)
+v1.5.0: job en erreur relancé après JOB_RETRY_DELAY (doublé à chaque
+tentative) tant que record_failure ne le passe pas en failed ; le lot
+d'un groupe n'est déclenché que par un enfant arrivé au bout de sa part
+v1.6.0: transitions d'état partagées avec async_pipeline (save_*, begin_send,
+finish_send, prepare_group) ; seules les E/S diffèrent entre les exécuteurs
+v1.7.0: notifications de suivi GRIB envoyées une seule fois par job
+(job_store.claim_notice), même si le job reprend à la même étape
+v1.7.1: attente Saildocs annulée si l'envoi ou la notification lève une
+exception (sinon la nouvelle tentative laissait une attente orpheline)
+"""
+
+import threading
+from config import JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY, SAILDOCS_TIMEOUT, MAX_MESSAGE_LENGTH
+from job_store import get_job_store, FINAL_STATES
+from grib_handler import (wait_for_saildocs_response, notify_status, send_saildocs_request, grib_size_error,
+                          accepted_message, STATUS_MESSAGES)
+from utils import encode_and_split_grib
+from saildocs_router import get_saildocs_demux
+from claude_handler import handle_claude_maritime_assistant, handle_claude_request, split_long_response as claude_split
+from mistral_handler import handle_mistral_maritime_assistant, handle_mistral_request, handle_mistral_weather_expert, split_long_response as mistral_split
+from inreach_sender import send_to_inreach
+from backlog_triage import triage_jobs, request_label
+
+# États d'un enfant de groupe dont la part est terminée (réponse encodée ou échec)
+CHILD_READY_STATES = ('encoded', 'sending', 'done', 'failed')
+
+# type → (appel LLM, découpage)
+AI_HANDLERS = {
+    'claude_maritime': (lambda req: handle_claude_maritime_assistant(req['question']), claude_split),
+    'claude_generic': (lambda req: handle_claude_request(req['question'], req['max_tokens']), claude_split),
+    'mistral_maritime': (lambda req: handle_mistral_maritime_assistant(req['question']), mistral_split),
+    'mistral_generic': (lambda req: handle_mistral_request(req['question'], req['max_tokens']), mistral_split),
+    'weather': (lambda req: handle_mistral_weather_expert(req['question']), mistral_split),
+}
+
+
+# ---------- Transitions partagées (job_runner et async_pipeline) ----------
+# Chaque exécuteur fait ses propres E/S (threads ou asyncio) puis enregistre
+# le résultat ici : mêmes états, mêmes erreurs, même reprise.
+
+def save_ai_response(store, job, response, cost):
+    """received → fetched: réponse du LLM enregistrée"""
+    store.advance(job['job_id'], 'fetched', result={'response': response, 'cost': cost})
+    return store.get(job['job_id'])
+
+
+def split_ai_response(store, job):
+    """fetched → encoded: réponse découpée en messages inReach"""
+    _, split = AI_HANDLERS[job['type']]
+    result = job['result']
+    store.advance(job['job_id'], 'encoded', messages=split(result['response'], result['cost'], 120))
+    return store.get(job['job_id'])
+
+
+def save_saildocs_sent(store, job, sent):
+    """
+    received → requested une fois la requête Saildocs envoyée
+
+    Returns:
+        dict: job mis à jour, ou None s'il passe en failed
+    """
+    if not sent:
+        store.advance(job['job_id'], 'failed', error="Echec envoi Saildocs")
+        return None
+    store.advance(job['job_id'], 'requested')
+    return store.get(job['job_id'])
+
+
+def save_grib_data(store, job, grib_data):
+    """
+    requested → fetched avec le fichier Saildocs
+
+    Returns:
+        dict: job mis à jour, ou None s'il passe en failed (timeout)
+    """
+    if not grib_data:
+        store.advance(job['job_id'], 'failed', error="Timeout Saildocs")
+        return None
+    store.advance(job['job_id'], 'fetched', grib_data=grib_data)
+    return store.get(job['job_id'])
+
+
+def save_grib_messages(store, job, messages):
+    """
+    fetched → encoded avec les messages prêts à envoyer
+
+    Returns:
+        dict: job mis à jour, ou None s'il passe en failed (GRIB trop volumineux)
+    """
+    if messages is None:
+        store.advance(job['job_id'], 'failed', error="GRIB trop volumineux")
+        return None
+    store.advance(job['job_id'], 'encoded', messages=messages)
+    return store.get(job['job_id'])
+
+
+def begin_send(store, job):
+    """
+    Passe le job en 'sending'
+
+    Returns:
+        tuple: (messages restant à envoyer, on_sent(i) qui enregistre la progression)
+    """
+    job_id = job['job_id']
+    start = job['sent_count']
+    if start:
+        print(f"↩️ Reprise envoi job {job_id}: {start}/{len(job['messages'])} déjà envoyés", flush=True)
+    store.advance(job_id, 'sending')
+    return job['messages'][start:], lambda i: store.record_sent(job_id, start + i)
+
+
+def finish_send(store, job, ok):
+    """sending → done, ou failed si l'envoi inReach a échoué"""
+    job_id = job['job_id']
+    if not ok:
+        store.advance(job_id, 'failed', error="Echec envoi inReach")
+        return False
+    store.advance(job_id, 'done')
+    print(f"✅ Job {job_id} terminé: {len(job['messages'])} messages envoyés.", flush=True)
+    return True
+
+
+def group_ready(store, job):
+    """
+    Enfants d'un job 'batch' si tous ont fini leur part (encoded/failed)
+
+    Returns:
+        list: jobs enfants dans l'ordre du message, ou None s'il faut attendre
+    """
+    children = store.get_many(job['request']['parts'])
+    if any(child is None or child['state'] not in CHILD_READY_STATES for child in children):
+        return None
+    return children
+
+
+def encode_group(store, job, children):
+    """Concatène les réponses des enfants dans l'ordre ; un échec devient une ligne d'erreur"""
+    messages = []
+    for child in children:
+        if child['state'] == 'failed':
+            messages.append(f"❌ {request_label(child)}: {child['error'] or 'echec'}"[:MAX_MESSAGE_LENGTH])
+        else:
+            messages.extend(child['messages'] or [])
+    store.advance(job['job_id'], 'encoded', messages=messages)
+    for child in children:
+        if child['state'] != 'failed':
+            store.advance(child['job_id'], 'done')
+
+
+def prepare_group(store, job):
+    """
+    Assemble le lot d'un job 'batch' (received → fetched → encoded)
+
+    Returns:
+        dict: job prêt à envoyer, ou None s'il faut attendre un enfant
+              (ou qu'un autre worker a déjà réclamé le lot)
+    """
+    job_id = job['job_id']
+    if job['state'] == 'received':
+        children = group_ready(store, job)
+        # Plusieurs enfants peuvent finir en même temps: un seul réclame le lot
+        if children is None or not store.transition(job_id, 'received', 'fetched'):
+            return None
+        job = store.get(job_id)
+
+    if job['state'] == 'fetched':
+        encode_group(store, job, group_ready(store, job))
+        job = store.get(job_id)
+    return job
+
+
+# ---------- Exécution synchrone (worker_pool) ----------
+
+def notify_once(store, job, notice, message):
+    """
+    Notification de suivi envoyée au plus une fois par job
+
+    La notification est réservée avant l'envoi : après un crash, une
+    notification perdue coûte moins qu'un message satellite en double.
+    """
+    if store.claim_notice(job['job_id'], notice):
+        notify_status(job['reply_url'], message, job['request'].get('account'))
+
+
+def _run_ai_stages(store, job):
+    ask, _ = AI_HANDLERS[job['type']]
+    if job['state'] == 'received':
+        job = save_ai_response(store, job, *ask(job['request']))
+    if job['state'] == 'fetched':
+        job = split_ai_response(store, job)
+
+    if job['request'].get('group'):
+        return True
+    return _run_send_stage(store, job)
+
+
+def _run_grib_stages(store, job):
+    grib_request = job['request']['request']
+    inreach_url = job['reply_url']
+    account = job['request'].get('account')
+    print(f"\n🌊 TRAITEMENT GRIB: {grib_request} (job {job['job_id']}, étape {job['state']})", flush=True)
+
+    pending = None
+    if job['state'] == 'received':
+        notify_once(store, job, 'accepted', accepted_message(grib_request))
+        # Attente enregistrée avant l'envoi: la réponse ne peut pas arriver avant
+        demux = get_saildocs_demux(account)
+        pending = demux.register(grib_request)
+        try:
+            sent = send_saildocs_request(grib_request, account)
+            if not sent:
+                demux.cancel(pending)
+            notify_once(store, job, 'requested' if sent else 'gmail_error',
+                        STATUS_MESSAGES['requested' if sent else 'gmail_error'])
+            job = save_saildocs_sent(store, job, sent)
+        except BaseException:
+            # La nouvelle tentative repart de 'received' avec sa propre attente
+            demux.cancel(pending)
+            raise
+        if job is None:
+            return False
+
+    if job['state'] == 'requested':
+        # Reprise: la réponse Saildocs reste non lue dans la boîte, on se réabonne
+        if pending is None:
+            pending = get_saildocs_demux(account).register(grib_request)
+        grib_data = wait_for_saildocs_response(inreach_url, timeout=SAILDOCS_TIMEOUT, pending=pending,
+                                               account=account)
+        # Dans un groupe, l'erreur part avec le lot combiné
+        if not grib_data and not job['request'].get('group'):
+            notify_once(store, job, 'timeout', STATUS_MESSAGES['timeout'])
+        job = save_grib_data(store, job, grib_data)
+        if job is None:
+            return False
+
+    if job['state'] == 'fetched':
+        notify_once(store, job, 'fetched', STATUS_MESSAGES['fetched'])
+        messages = encode_and_split_grib(job['grib_data'], payload_format=job['request'].get('format'))
+        error = grib_size_error(messages)
+        if error:
+            print(f"❌ {error}", flush=True)
+            notify_once(store, job, 'too_big', error)
+            messages = None
+        job = save_grib_messages(store, job, messages)
+        if job is None:
+            return False
+
+    if job['request'].get('group'):
+        return True
+    return _run_send_stage(store, job)
+
+
+def _run_send_stage(store, job):
+    """Envoie les messages restants ; la progression est enregistrée message par message"""
+    remaining, on_sent = begin_send(store, job)
+    ok = not remaining or send_to_inreach(job['reply_url'], remaining, on_sent=on_sent,
+                                          account=job['request'].get('account'))
+    return finish_send(store, job, ok)
+
+
+def _run_batch_stages(store, job):
+    job = prepare_group(store, job)
+    if job is None:
+        return False
+    return _run_send_stage(store, job)
+
+
+def record_job_error(store, job_id, error):
+    """
+    Compte une exception levée par un job
+
+    Returns:
+        float: délai avant la nouvelle tentative, ou None si le job passe en failed
+    """
+    if store.record_failure(job_id, error, JOB_MAX_ATTEMPTS):
+        print(f"❌ Job {job_id} abandonné après {JOB_MAX_ATTEMPTS} tentatives", flush=True)
+        return None
+    attempts = store.get(job_id)['attempts']
+    delay = JOB_RETRY_DELAY * 2 ** (attempts - 1)
+    print(f"🔁 Job {job_id}: tentative {attempts + 1}/{JOB_MAX_ATTEMPTS} dans {delay}s", flush=True)
+    return delay
+
+
+def run_job(job_id, resubmit=None):
+    """
+    Exécute (ou reprend) un job jusqu'à done/failed
+
+    Args:
+        job_id: Job à exécuter
+        resubmit: resubmit(job_id, job_type, device) pour remettre en file après
+                  une erreur (par défaut run_job dans un thread Timer)
+    """
+    store = get_job_store()
+    job = store.get(job_id)
+    if job is None or job['state'] in FINAL_STATES:
+        return False
+
+    try:
+        if job['type'] == 'batch':
+            ok = _run_batch_stages(store, job)
+        elif job['type'] == 'grib':
+            ok = _run_grib_stages(store, job)
+        else:
+            ok = _run_ai_stages(store, job)
+    except Exception as e:
+        print(f"❌ Erreur job {job_id} ({job['type']}): {e}", flush=True)
+        delay = record_job_error(store, job_id, e)
+        if delay is not None:
+            if resubmit:
+                retry = threading.Timer(delay, resubmit, args=(job_id, job['type'], job['reply_url']))
+            else:
+                retry = threading.Timer(delay, run_job, args=(job_id,))
+            retry.daemon = True
+            retry.start()
+        ok = False
+
+    # Dernier enfant terminé: le lot combiné part depuis ce worker ; un enfant
+    # en attente de nouvelle tentative ne le déclenche pas
+    group_id = job['request'].get('group')
+    if group_id and store.get(job_id)['state'] in CHILD_READY_STATES:
+        run_job(group_id, resubmit)
+    return ok
+
+
+def resume_incomplete_jobs(submit=None):
+    """
+    Reprend au démarrage les jobs interrompus
+    
+    Args:
+        submit: submit(job_id, job_type, device) pour déléguer aux pools de workers
+                (par défaut exécution séquentielle dans le thread appelant)
+    """
+    jobs = get_job_store().incomplete()
+    if jobs:
+        print(f"↩️ Reprise de {len(jobs)} job(s) interrompu(s)", flush=True)
+    for job_id, job_type, reply_url in triage_jobs(job['job_id'] for job in jobs):
+        if submit:
+            submit(job_id, job_type, reply_url)
+        else:
+            run_job(job_id)
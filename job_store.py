@@ -0,0 +1,229 @@
+# job_store.py - v1.2.0
+"""
+File de jobs persistante (SQLite) avec clé d'idempotence Message-ID
+
+Chaque requête inReach devient un job qui avance par étapes :
+    received → (requested) → fetched → encoded → sending → done | failed
+
+Les résultats coûteux (réponse LLM, fichier GRIB, messages encodés,
+nombre de messages satellite déjà envoyés) sont enregistrés à chaque
+étape : après un redémarrage, le job reprend là où il s'était arrêté
+sans refaire d'appel LLM ni renvoyer de message déjà payé.
+
+v1.1.0: groupes (plusieurs commandes par email) : un job parent 'batch'
+et un job enfant par commande, créés dans la même transaction
+v1.2.0: notifications de suivi enregistrées par job (claim_notice) : une
+reprise ne renvoie pas celles déjà parties
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from config import JOB_DB_FILE
+
+STATES = ('received', 'requested', 'fetched', 'encoded', 'sending', 'done', 'failed')
+FINAL_STATES = ('done', 'failed')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    type        TEXT NOT NULL,
+    request     TEXT NOT NULL,
+    reply_url   TEXT NOT NULL,
+    state       TEXT NOT NULL DEFAULT 'received',
+    result      TEXT,
+    grib_data   BLOB,
+    messages    TEXT,
+    sent_count  INTEGER NOT NULL DEFAULT 0,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state);
+CREATE TABLE IF NOT EXISTS notices (
+    job_id      TEXT NOT NULL,
+    notice      TEXT NOT NULL,
+    sent_at     REAL NOT NULL,
+    PRIMARY KEY (job_id, notice)
+);
+"""
+
+_JSON_FIELDS = ('request', 'result', 'messages')
+
+
+class JobStore:
+    """Accès thread-safe à la base de jobs"""
+
+    def __init__(self, path=JOB_DB_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript(_SCHEMA)
+
+    def _row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        for field in _JSON_FIELDS:
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def enqueue(self, job_id, request_info):
+        """
+        Crée le job s'il n'existe pas encore
+
+        Returns:
+            bool: False si ce Message-ID est déjà connu (email re-livré)
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO jobs (job_id, type, request, reply_url, state, created_at, updated_at) '
+                "VALUES (?, ?, ?, ?, 'received', ?, ?)",
+                (job_id, request_info['type'], json.dumps(request_info),
+                 request_info['reply_url'], now, now))
+            return cursor.rowcount == 1
+
+    def enqueue_group(self, group_id, group_info, children):
+        """
+        Crée le job parent et ses enfants de façon atomique
+
+        Args:
+            group_id: Clé d'idempotence (Message-ID)
+            group_info: request_info du parent (type 'batch')
+            children: [(job_id, request_info)] dans l'ordre du message
+
+        Returns:
+            bool: False si ce Message-ID est déjà connu
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO jobs (job_id, type, request, reply_url, state, created_at, updated_at) '
+                    "VALUES (?, ?, ?, ?, 'received', ?, ?)",
+                    (group_id, group_info['type'], json.dumps(group_info), group_info['reply_url'], now, now))
+                if cursor.rowcount != 1:
+                    self._conn.execute('ROLLBACK')
+                    return False
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO jobs (job_id, type, request, reply_url, state, created_at, updated_at) '
+                    "VALUES (?, ?, ?, ?, 'received', ?, ?)",
+                    [(job_id, info['type'], json.dumps(info), info['reply_url'], now, now)
+                     for job_id, info in children])
+                self._conn.execute('COMMIT')
+                return True
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def transition(self, job_id, expected, state):
+        """
+        Passe de expected à state seulement si le job y est encore (compare-and-set)
+
+        Returns:
+            bool: True pour le seul appelant qui a effectué la transition
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET state = ?, updated_at = ? WHERE job_id = ? AND state = ?',
+                (state, time.time(), job_id, expected))
+            return cursor.rowcount == 1
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def advance(self, job_id, state, **fields):
+        """Passe le job à l'étape state en enregistrant les résultats associés"""
+        if state not in STATES:
+            raise ValueError(f"État inconnu: {state}")
+        columns = {'state': state, 'updated_at': time.time()}
+        for key, value in fields.items():
+            columns[key] = json.dumps(value) if key in _JSON_FIELDS else value
+        assignments = ', '.join(f'{key} = ?' for key in columns)
+        with self._lock:
+            self._conn.execute(f'UPDATE jobs SET {assignments} WHERE job_id = ?',
+                               (*columns.values(), job_id))
+
+    def get_many(self, job_ids):
+        """Jobs dans l'ordre de job_ids (None pour un job absent)"""
+        if not job_ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE job_id IN ({','.join('?' * len(job_ids))})",
+                list(job_ids)).fetchall()
+        jobs = {row['job_id']: self._row_to_job(row) for row in rows}
+        return [jobs.get(job_id) for job_id in job_ids]
+
+    def record_sent(self, job_id, sent_count):
+        """Enregistre la progression d'envoi (messages satellite déjà partis)"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET sent_count = MAX(sent_count, ?), updated_at = ? WHERE job_id = ?',
+                (sent_count, time.time(), job_id))
+
+    def record_failure(self, job_id, error, max_attempts):
+        """
+        Compte un échec ; le job passe en failed après max_attempts
+
+        Returns:
+            bool: True si le job est définitivement en échec
+        """
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET attempts = attempts + 1, error = ?, updated_at = ? WHERE job_id = ?',
+                (str(error)[:500], time.time(), job_id))
+            row = self._conn.execute('SELECT attempts FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            if row and row['attempts'] >= max_attempts:
+                self._conn.execute("UPDATE jobs SET state = 'failed' WHERE job_id = ?", (job_id,))
+                return True
+        return False
+
+    def claim_notice(self, job_id, notice):
+        """
+        Réserve une notification de suivi du job (avant son envoi)
+
+        Returns:
+            bool: False si elle a déjà été envoyée (reprise après redémarrage)
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO notices (job_id, notice, sent_at) VALUES (?, ?, ?)',
+                (job_id, notice, time.time()))
+            return cursor.rowcount == 1
+
+    def incomplete(self):
+        """Jobs à reprendre (ni done ni failed), du plus ancien au plus récent"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM jobs WHERE state NOT IN (?, ?) ORDER BY created_at',
+                FINAL_STATES).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def get_stats(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT state, COUNT(*) AS n FROM jobs GROUP BY state').fetchall()
+        return {row['state']: row['n'] for row in rows}
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_job_store():
+    """Retourne la base de jobs partagée du processus"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = JobStore()
+        return _default_store
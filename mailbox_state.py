@@ -0,0 +1,77 @@
+# mailbox_state.py - v1.1.0
+"""
+Marqueur de synchronisation IMAP persistant (UIDVALIDITY + dernier UID traité)
+
+Chaque cycle ne demande que les UID > last_uid : le coût est proportionnel
+au nombre de nouveaux messages, pas à la taille de la boîte, et ne dépend
+plus du flag \\Seen (lecture dans un navigateur, crash après FETCH).
+
+v1.1.0: historyId de l'API Gmail (ingestion gmail_history), même écriture atomique
+"""
+
+import json
+import os
+import tempfile
+from config import MAILBOX_STATE_FILE, GMAIL_HISTORY_STATE_FILE
+
+
+def load_state(path=MAILBOX_STATE_FILE):
+    """
+    Charge l'état de synchronisation
+
+    Returns:
+        dict: {'uidvalidity': int, 'last_uid': int} ou None si absent/illisible
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return {'uidvalidity': int(state['uidvalidity']), 'last_uid': int(state['last_uid'])}
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"⚠️ État boîte mail illisible ({e}) - resynchronisation", flush=True)
+        return None
+
+
+def save_state(uidvalidity, last_uid, path=MAILBOX_STATE_FILE):
+    """Écrit l'état de façon atomique (fichier temporaire + os.replace)"""
+    _write_json_atomic({'uidvalidity': uidvalidity, 'last_uid': last_uid}, path)
+
+
+def load_history_id(path=GMAIL_HISTORY_STATE_FILE):
+    """
+    Charge le dernier historyId Gmail traité
+
+    Returns:
+        int: historyId, ou None si absent/illisible (amorçage complet)
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return int(json.load(f)['history_id'])
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"⚠️ historyId Gmail illisible ({e}) - resynchronisation", flush=True)
+        return None
+
+
+def save_history_id(history_id, path=GMAIL_HISTORY_STATE_FILE):
+    """Écrit le historyId de façon atomique"""
+    _write_json_atomic({'history_id': int(history_id)}, path)
+
+
+def _write_json_atomic(state, path):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.mailbox_state-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -1,15 +1,38 @@
-# main.py - v3.0.0
-"""Point d'entrée principal - Flask + Scheduler"""
+# main.py - v3.4.2
+"""Point d'entrée principal - Flask + Scheduler (IMAP IDLE, polling ou historique API Gmail)
 
+v3.4.0: tous les comptes du registre (accounts) relevés en parallèle,
+une connexion IDLE par compte, pools de workers communs
+v3.4.1: /inbound n'accepte le jeton que dans les en-têtes (plus de ?token=,
+qui finit dans les logs d'accès et de proxy)
+v3.4.2: MAIL_BACKEND inconnu refusé au démarrage (et non au premier envoi)
+"""
+
+import asyncio
 import sys
+import time
 import schedule
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from threading import Thread
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 
 from config import (PORT, VERSION, VERSION_DATE, SERVICE_NAME, 
-                   CHECK_INTERVAL_MINUTES, validate_config, get_config_status)
+                   CHECK_INTERVAL_MINUTES, INGESTION_MODE, EXECUTION_MODE, IMAP_IDLE_TIMEOUT,
+                   IMAP_IDLE_MAX_FAILURES, GMAIL_HISTORY_INTERVAL, INBOUND_TOKEN, INBOUND_MAX_BYTES,
+                   MAIL_BACKEND, MAIL_BACKENDS, validate_config, get_config_status)
 from email_monitor import check_gmail
+from imap_session import manager_for_account, get_all_imap_stats
+from saildocs_router import get_saildocs_demux, get_all_demux_stats
+from accounts import get_accounts
+from gmail_sender import get_all_gmail_stats
+from outbound_mail import get_all_outbox_stats
+from job_store import get_job_store
+from job_runner import resume_incomplete_jobs
+from worker_pool import submit_job, get_worker_pools
+import inbound
+import backlog_triage
+import grib_codec
 
 # ==========================================
 # APPLICATION FLASK
@@ -55,44 +78,196 @@ def status():
         "current_status": last_status,
         "last_check_time": str(last_check_time) if last_check_time else "Aucune vérification encore",
         "config": config_status,
+        "accounts": [account.to_public() for account in get_accounts()],
+        "imap": get_all_imap_stats(),
+        "gmail": get_all_gmail_stats(),
+        "outbox": get_all_outbox_stats(),
+        "saildocs": get_all_demux_stats(),
+        "jobs": get_job_store().get_stats(),
+        "workers": get_worker_pools().get_stats(),
+        "inbound": inbound.get_stats(),
+        "triage": backlog_triage.get_stats(),
+        "grib_codecs": grib_codec.get_stats(),
         "features": {
             "grib": "Format: gfs:8N,9N,80W,79W|1,1|0,3,6|WIND,GUST,PRMSL",
             "dual_url_support": "inreachlink.com + explore.garmin.com"
         }
     })
 
+@app.route('/inbound', methods=['POST'])
+def inbound_message():
+    """
+    Email brut (RFC 822) poussé par un MTA de transfert ou un webhook
+    
+    Corps: message brut, ou champ de formulaire 'email' / 'body-mime'
+    Jeton: Authorization: Bearer <INBOUND_TOKEN> ou X-Inbound-Token
+    Réponse 202 dès que le job est persisté et en file
+    """
+    if not INBOUND_TOKEN:
+        return jsonify({"error": "Endpoint /inbound désactivé (INBOUND_TOKEN absent)"}), 503
+    
+    auth = request.headers.get('Authorization', '')
+    supplied = (auth[7:] if auth.startswith('Bearer ') else None) or request.headers.get('X-Inbound-Token')
+    if not inbound.check_token(supplied):
+        inbound.record_rejected()
+        return jsonify({"error": "Jeton invalide"}), 401
+    
+    if request.content_length and request.content_length > INBOUND_MAX_BYTES:
+        inbound.record_rejected()
+        return jsonify({"error": "Message trop volumineux"}), 413
+    
+    if request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        # Webhooks SendGrid (email) / Mailgun (body-mime) en mode MIME brut
+        upload = request.files.get('email') or request.files.get('body-mime')
+        raw = upload.read() if upload else \
+            (request.form.get('email') or request.form.get('body-mime') or '').encode('utf-8')
+    else:
+        raw = request.get_data(cache=False)
+    
+    if not raw:
+        return jsonify({"error": "Corps vide"}), 400
+    if len(raw) > INBOUND_MAX_BYTES:
+        inbound.record_rejected()
+        return jsonify({"error": "Message trop volumineux"}), 413
+    
+    try:
+        result = inbound.ingest_raw_message(raw)
+    except Exception as e:
+        print(f"❌ Erreur /inbound: {e}")
+        return jsonify({"error": "Erreur interne"}), 500
+    return jsonify(result), 202
+
 # ==========================================
 # SCHEDULER
 # ==========================================
 
-def run_scheduler():
-    """Thread pour vérifications périodiques"""
+# Comptes relevés par leur propre connexion IDLE (exclus du polling)
+idle_accounts = set()
+
+def check_account(account):
+    """Un cycle d'ingestion pour un compte (IMAP ou historique API Gmail)"""
+    if INGESTION_MODE == 'gmail_api':
+        from gmail_history import check_gmail_history
+        check_gmail_history(account=account)
+    else:
+        check_gmail(account)
+
+def run_check(accounts=None):
+    """
+    Relève les boîtes des comptes en parallèle et met à jour le statut global
+    
+    Args:
+        accounts: Comptes à relever (défaut: tous sauf ceux suivis en IDLE)
+    """
     global last_check_time, last_status
+    if accounts is None:
+        accounts = [account for account in get_accounts() if account.name not in idle_accounts]
+    if not accounts:
+        return
+    
+    # Une boîte lente (IMAP, API Gmail) ne retarde pas les autres bateaux ;
+    # les jobs créés partent dans les pools de workers communs
+    errors = []
+    with ThreadPoolExecutor(max_workers=len(accounts), thread_name_prefix='check') as pool:
+        futures = {account.name: pool.submit(check_account, account) for account in accounts}
+    for name, future in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+            print(f"❌ Erreur vérification [{name}]: {e}")
+    
+    last_check_time = datetime.now()
+    last_status = f"❌ Erreur: {'; '.join(errors)}" if errors else "✅ Vérification terminée"
+
+def run_idle_ingestion(account):
+    """
+    Ingestion push via IMAP IDLE pour un compte (connexion dédiée,
+    distincte de la session partagée utilisée par check_gmail et
+    l'attente Saildocs)
+    
+    Retourne seulement si IDLE est indisponible ou échoue trop souvent :
+    le compte repasse alors dans le polling de run_scheduler.
+    """
+    watcher = manager_for_account(account)
+    failures = 0
+    
+    try:
+        if not watcher.supports_idle():
+            print(f"⚠️ [{account.name}] IDLE non supporté par le serveur - repli polling")
+            return
+    except Exception as e:
+        print(f"⚠️ [{account.name}] IDLE indisponible ({e}) - repli polling")
+        return
+    
+    idle_accounts.add(account.name)
+    print(f"📬 [{account.name}] Mode IDLE actif (relance toutes les {IMAP_IDLE_TIMEOUT}s)")
+    try:
+        while failures < IMAP_IDLE_MAX_FAILURES:
+            try:
+                has_new = watcher.idle_wait(IMAP_IDLE_TIMEOUT)
+                failures = 0
+                if has_new:
+                    print(f"📨 [{account.name}] IDLE: nouveau message")
+                    get_saildocs_demux(account).notify_new_mail()
+                # Vérification aussi à l'expiration: filet de sécurité
+                run_check([account])
+            except Exception as e:
+                failures += 1
+                print(f"⚠️ [{account.name}] Erreur IDLE ({failures}/{IMAP_IDLE_MAX_FAILURES}): {e}")
+                time.sleep(min(60, 5 * failures))
+    finally:
+        idle_accounts.discard(account.name)
+        watcher.close()
+    print(f"⚠️ [{account.name}] Trop d'échecs IDLE - repli polling")
+
+def run_scheduler():
+    """Thread pour vérifications (IDLE push ou périodiques)"""
+    global last_status
     
     print("\n" + "="*60)
     print("⏰ PLANIFICATION")
     print("="*60)
-    print(f"📅 Vérification toutes les {CHECK_INTERVAL_MINUTES} MINUTES")
+    print(f"📬 Mode ingestion: {INGESTION_MODE}")
+    print(f"👥 Comptes: {', '.join(account.name for account in get_accounts())}")
+    print(f"📅 Polling de secours toutes les {CHECK_INTERVAL_MINUTES} MINUTES")
     print("="*60 + "\n")
     
-    # Planifier les vérifications
-    schedule.every(CHECK_INTERVAL_MINUTES).minutes.do(check_gmail)
+    if EXECUTION_MODE == 'asyncio':
+        # Ingestion, jobs et envois dans une seule boucle d'événements
+        from async_pipeline import run_async_pipeline
+        last_status = "✅ Mode asyncio actif"
+        print("⚡ Mode d'exécution: asyncio\n")
+        asyncio.run(run_async_pipeline())
+        return
     
-    # Première vérification immédiate
-    print("🚀 Première vérification immédiate...\n")
+    # Reprise des jobs interrompus par un redémarrage
     try:
-        check_gmail()
-        last_check_time = datetime.now()
-        last_status = "✅ Vérification terminée"
+        resume_incomplete_jobs(submit=submit_job)
     except Exception as e:
-        last_status = f"❌ Erreur: {str(e)}"
-        print(f"❌ Erreur première vérification: {e}")
+        print(f"❌ Erreur reprise des jobs: {e}")
+    
+    # Première vérification immédiate
+    print("🚀 Première vérification immédiate...\n")
+    run_check()
+    
+    if INGESTION_MODE == 'idle':
+        # Un thread IDLE par compte ; les comptes sans IDLE restent au polling
+        for account in get_accounts():
+            Thread(target=run_idle_ingestion, args=(account,), name=f'idle-{account.name}',
+                   daemon=True).start()
+    
+    # Planifier les vérifications (mode poll ou repli)
+    if INGESTION_MODE == 'gmail_api':
+        # history.list ne coûte presque rien sans nouveau message: synchro rapprochée
+        schedule.every(GMAIL_HISTORY_INTERVAL).seconds.do(run_check)
+    else:
+        schedule.every(CHECK_INTERVAL_MINUTES).minutes.do(run_check)
     
     # Boucle du scheduler
     while True:
         schedule.run_pending()
-        import time
-        time.sleep(60)
+        time.sleep(1)
 
 # ==========================================
 # MAIN
@@ -114,6 +289,10 @@ if __name__ == "__main__":
         print("❌ ERREURS DE CONFIGURATION:")
         for error in config_errors:
             print(f"   - {error}")
+        # Sans backend d'envoi valide, chaque requête GRIB échouerait dans les workers
+        if MAIL_BACKEND not in MAIL_BACKENDS:
+            print("\n❌ Démarrage annulé: MAIL_BACKEND invalide\n", flush=True)
+            sys.exit(1)
         print("\n⚠️  Le service démarre quand même mais certaines fonctionnalités seront limitées\n")
     else:
         print("✅ Configuration validée\n")
@@ -1,8 +1,12 @@
-# mistral_handler.py - v1.4
+# mistral_handler.py - v1.5
 """
 Handler pour API Mistral AI
 Compatible avec architecture modulaire email_monitor v3.2.3
 
+v1.5:
+- Prompts système en constantes
+- handle_mistral_async() pour le mode asyncio
+
 v1.4:
 - ALGORITHME ROBUSTE découpage équilibré
 - Messages 110 chars minimum (sauf exceptions)
@@ -21,6 +25,64 @@ from typing import Optional, Tuple
 MISTRAL_BALANCE = float(os.getenv('MISTRAL_BALANCE', '5.00'))
 
 
+# Prompts système (partagés avec les variantes async)
+MARITIME_SYSTEM_PROMPT = """Tu es un assistant maritime expert pour navigateurs en mer.
+
+Contexte:
+- Utilisateur en mer sur voilier
+- Communication satellite limitée et coûteuse
+- Besoin réponses ULTRA-CONCISES
+
+Expertise:
+- Météorologie marine
+- Navigation hauturière
+- Sécurité maritime
+- Mécanique marine
+- Protocoles d'urgence
+- Interprétation fichiers GRIB
+
+RÈGLES STRICTES:
+- MAX 120 caractères par réponse
+- Info essentielle UNIQUEMENT
+- Vocabulaire maritime précis
+- Conseils pratiques directs
+- Pas de fioriture
+- TEXTE BRUT (pas de LaTeX, pas de formules mathématiques)
+
+Questions hors maritime: décliner poliment."""
+
+GENERIC_SYSTEM_PROMPT = """Tu es un assistant intelligent et concis.
+
+RÈGLES STRICTES DE FORMATAGE:
+- TEXTE BRUT UNIQUEMENT
+- PAS de LaTeX (\\text{}, \\rightarrow, etc.)
+- PAS de notation mathématique complexe (^, _, subscript, superscript)
+- Formules chimiques: écris "Fe2+" au lieu de "Fe^{2+}"
+- Flèches: utilise "->" au lieu de "\\rightarrow"
+- Équations: écris "H2O" au lieu de "H_2O"
+- Exposants: écris "m2" au lieu de "m^2"
+
+Reste précis et informatif, mais en texte simple lisible sur tout appareil."""
+
+WEATHER_SYSTEM_PROMPT = """Expert météorologie marine pour navigation hauturière.
+
+Spécialités:
+- Interprétation GRIB (vent, vagues, pression)
+- Prévisions route océanique
+- Fenêtres météo favorables
+- Systèmes dépressionnaires
+- Stratégie routage
+
+Format réponse:
+- Synthèse conditions (2-3 lignes max)
+- Recommandation cap/timing
+- Alertes si danger
+- CONCIS et ACTIONNABLE
+- TEXTE BRUT (pas de LaTeX)
+
+Unités: nœuds, mbar, degrés vrais."""
+
+
 def handle_mistral_maritime_assistant(user_message: str) -> Tuple[str, float]:
     """
     Assistant maritime spécialisé avec Mistral
@@ -49,30 +111,7 @@ def handle_mistral_maritime_assistant(user_message: str) -> Tuple[str, float]:
             "Content-Type": "application/json"
         }
         
-        system_prompt = """Tu es un assistant maritime expert pour navigateurs en mer.
-
-Contexte:
-- Utilisateur en mer sur voilier
-- Communication satellite limitée et coûteuse
-- Besoin réponses ULTRA-CONCISES
-
-Expertise:
-- Météorologie marine
-- Navigation hauturière
-- Sécurité maritime
-- Mécanique marine
-- Protocoles d'urgence
-- Interprétation fichiers GRIB
-
-RÈGLES STRICTES:
-- MAX 120 caractères par réponse
-- Info essentielle UNIQUEMENT
-- Vocabulaire maritime précis
-- Conseils pratiques directs
-- Pas de fioriture
-- TEXTE BRUT (pas de LaTeX, pas de formules mathématiques)
-
-Questions hors maritime: décliner poliment."""
+        system_prompt = MARITIME_SYSTEM_PROMPT
         
         data = {
             "model": "mistral-large-latest",
@@ -161,18 +200,7 @@ def handle_mistral_request(user_message: str, max_tokens: int = 1024) -> Tuple[s
         }
         
         # System prompt pour TEXTE BRUT
-        system_prompt = """Tu es un assistant intelligent et concis.
-
-RÈGLES STRICTES DE FORMATAGE:
-- TEXTE BRUT UNIQUEMENT
-- PAS de LaTeX (\\text{}, \\rightarrow, etc.)
-- PAS de notation mathématique complexe (^, _, subscript, superscript)
-- Formules chimiques: écris "Fe2+" au lieu de "Fe^{2+}"
-- Flèches: utilise "->" au lieu de "\\rightarrow"
-- Équations: écris "H2O" au lieu de "H_2O"
-- Exposants: écris "m2" au lieu de "m^2"
-
-Reste précis et informatif, mais en texte simple lisible sur tout appareil."""
+        system_prompt = GENERIC_SYSTEM_PROMPT
         
         data = {
             "model": "mistral-large-latest",
@@ -254,23 +282,7 @@ def handle_mistral_weather_expert(user_message: str) -> Tuple[str, float]:
             "Content-Type": "application/json"
         }
         
-        system_prompt = """Expert météorologie marine pour navigation hauturière.
-
-Spécialités:
-- Interprétation GRIB (vent, vagues, pression)
-- Prévisions route océanique
-- Fenêtres météo favorables
-- Systèmes dépressionnaires
-- Stratégie routage
-
-Format réponse:
-- Synthèse conditions (2-3 lignes max)
-- Recommandation cap/timing
-- Alertes si danger
-- CONCIS et ACTIONNABLE
-- TEXTE BRUT (pas de LaTeX)
-
-Unités: nœuds, mbar, degrés vrais."""
+        system_prompt = WEATHER_SYSTEM_PROMPT
         
         data = {
             "model": "mistral-large-latest",
@@ -325,6 +337,71 @@ Unités: nœuds, mbar, degrés vrais."""
         return (f"Erreur: {str(e)[:100]}", 0.0)
 
 
+async def handle_mistral_async(client, user_message: str, system_prompt: str = MARITIME_SYSTEM_PROMPT,
+                               max_tokens: int = 512) -> Tuple[str, float]:
+    """
+    Variante asyncio des handlers Mistral (mode EXECUTION_MODE=asyncio)
+    
+    Args:
+        client: httpx.AsyncClient partagé
+        user_message: Question de l'utilisateur
+        system_prompt: MARITIME_, GENERIC_ ou WEATHER_SYSTEM_PROMPT
+        max_tokens: Limite de tokens
+        
+    Returns:
+        Tuple (réponse, coût)
+    """
+    api_key = os.getenv('MISTRAL_API_KEY')
+    
+    if not api_key:
+        return ("❌ MISTRAL_API_KEY non configurée", 0.0)
+    
+    try:
+        print(f"🧠 MISTRAL (async): {user_message[:100]}...")
+        
+        url = "https://api.mistral.ai/v1/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": "mistral-large-latest",
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": user_message
+                }
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.7
+        }
+        
+        response = await client.post(url, headers=headers, json=data, timeout=30)
+        
+        if response.status_code == 200:
+            result = response.json()
+            answer = clean_latex(result['choices'][0]['message']['content'].strip())
+            
+            usage = result.get('usage', {})
+            input_tokens = usage.get('prompt_tokens', 0)
+            output_tokens = usage.get('completion_tokens', 0)
+            total_cost = (input_tokens / 1_000_000) * 2.0 + (output_tokens / 1_000_000) * 6.0
+            
+            print(f"✅ Réponse Mistral (async): {len(answer)} chars, ${total_cost:.6f}")
+            return (answer, total_cost)
+        
+        print(f"❌ Erreur API Mistral: {response.status_code}")
+        return (f"Erreur Mistral: {response.status_code}", 0.0)
+            
+    except Exception as e:
+        print(f"❌ Erreur Mistral (async): {e}")
+        return (f"Erreur: {str(e)[:100]}", 0.0)
+
+
 def clean_latex(text: str) -> str:
     """
     Nettoie le texte des notations LaTeX et formules mathématiques
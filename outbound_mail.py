@@ -0,0 +1,331 @@
+# outbound_mail.py - v1.0.2
+"""
+Envoi groupé des emails sortants (requêtes Saildocs)
+
+Aux changements de run des modèles, toute la flotte demande son GRIB en
+même temps : au lieu d'un appel Gmail par requête, les envois d'un
+compte arrivés dans la même fenêtre (MAIL_BATCH_WINDOW) partent ensemble.
+
+MAIL_BACKEND :
+- 'gmail'       : un messages.send par email (historique, sans file)
+- 'gmail_batch' : jusqu'à GMAIL_BATCH_SIZE envois en un appel batch Gmail
+- 'smtp'        : connexions SMTP authentifiées gardées ouvertes et
+                  partagées (SMTP_POOL_SIZE par compte, mot de passe
+                  d'application du compte)
+
+Chaque email garde son propre résultat : statut, erreur, attente en file
+et durée d'envoi (pour gmail_batch, la durée de l'appel commun).
+
+v1.0.1: délai dépassé en file → email retiré de la file (jamais envoyé) ;
+délai dépassé pendant l'envoi → on attend le vrai résultat au lieu de
+signaler un échec pour un email qui part quand même
+v1.0.2: derniers résultats par email (attente, durée, lot) dans get_stats ;
+liste des backends dans config (MAIL_BACKENDS, vérifiée au démarrage)
+"""
+
+import itertools
+from collections import deque
+import smtplib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from config import (MAIL_BACKEND, MAIL_BACKENDS, MAIL_BATCH_WINDOW, GMAIL_BATCH_SIZE,
+                    SMTP_HOST, SMTP_PORT, SMTP_POOL_SIZE)
+from accounts import get_account
+from gmail_sender import get_gmail_client, build_message, encode_raw
+
+BACKENDS = MAIL_BACKENDS
+# Résultats par email gardés pour /status
+RECENT_RESULTS = 20
+
+
+def _failed(error):
+    """Résultat d'un email qui n'a pas été envoyé"""
+    return {'ok': False, 'id': None, 'error': error, 'queued_ms': None, 'send_ms': None, 'batch': None}
+
+
+class OutboundMail:
+    """Email en attente d'envoi"""
+
+    def __init__(self, subject, body, to_email):
+        self.subject = subject
+        self.body = body
+        self.to_email = to_email
+        self.queued = time.time()
+        self.future = Future()
+
+
+class SmtpPool:
+    """Connexions SMTP ouvertes et réutilisées pour un compte"""
+
+    def __init__(self, username, password, host=SMTP_HOST, port=SMTP_PORT, size=SMTP_POOL_SIZE):
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.size = max(1, size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.size)
+        self.stats = {'connects': 0, 'reconnects': 0}
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=30)
+        conn.starttls()
+        conn.login(self.username, self.password)
+        with self._lock:
+            self.stats['connects'] += 1
+        return conn
+
+    def _acquire(self):
+        self._slots.acquire()
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        try:
+            return conn or self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn):
+        with self._lock:
+            if conn is not None:
+                self._idle.append(conn)
+        self._slots.release()
+
+    def _send_on(self, conn, message):
+        """Envoi sur une connexion, une reconnexion si le serveur l'a fermée"""
+        try:
+            conn.send_message(message)
+            return conn
+        except smtplib.SMTPServerDisconnected:
+            with self._lock:
+                self.stats['reconnects'] += 1
+            conn = self._connect()
+            conn.send_message(message)
+            return conn
+
+    def send_chunk(self, messages):
+        """
+        Envoie une suite de messages sur une seule connexion
+
+        Returns:
+            list: [(exception ou None, durée ms)] dans l'ordre
+        """
+        try:
+            conn = self._acquire()
+        except Exception as e:
+            return [(e, 0.0)] * len(messages)
+
+        results = []
+        try:
+            for message in messages:
+                start = time.perf_counter()
+                try:
+                    conn = self._send_on(conn, message)
+                    results.append((None, (time.perf_counter() - start) * 1000))
+                except smtplib.SMTPRecipientsRefused as e:
+                    # Refus propre à ce destinataire: la connexion reste utilisable
+                    results.append((e, (time.perf_counter() - start) * 1000))
+        except Exception as e:
+            # Connexion perdue: les messages restants de ce lot échouent
+            results.extend((e, 0.0) for _ in messages[len(results):])
+            conn = None
+        finally:
+            self._release(conn)
+        return results
+
+    def send_many(self, messages):
+        """Répartit les messages sur les connexions du pool, en parallèle"""
+        chunks = [messages[i::self.size] for i in range(self.size) if messages[i::self.size]]
+        if len(chunks) == 1:
+            return self.send_chunk(chunks[0])
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            chunk_results = list(pool.map(self.send_chunk, chunks))
+        # Retour à l'ordre d'origine (répartition i::size)
+        results = [None] * len(messages)
+        for offset, chunk in enumerate(chunk_results):
+            for position, result in enumerate(chunk):
+                results[offset + position * self.size] = result
+        return results
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.quit()
+            except Exception:
+                pass
+
+
+class Outbox:
+    """File d'envoi d'un compte : regroupe les emails arrivés ensemble"""
+
+    def __init__(self, account, backend=MAIL_BACKEND, window=MAIL_BATCH_WINDOW, max_batch=GMAIL_BATCH_SIZE):
+        if backend not in BACKENDS:
+            raise ValueError(f"MAIL_BACKEND inconnu: {backend} (attendu: {', '.join(BACKENDS)})")
+        self.account = get_account(account)
+        self.backend = backend
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._smtp = None
+        self._batches = itertools.count(1)
+        self._recent = deque(maxlen=RECENT_RESULTS)
+        self.stats = {'sent': 0, 'failed': 0, 'cancelled': 0, 'batches': 0, 'largest_batch': 0,
+                      'last_batch_ms': 0}
+
+    # ---------- API ----------
+
+    def submit(self, subject, body, to_email):
+        """
+        Met un email en file
+
+        Returns:
+            Future: résultat de l'envoi (voir send)
+        """
+        item = OutboundMail(subject, body, to_email)
+        with self._lock:
+            self._queue.append(item)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f'outbox-{self.account.name}',
+                                                daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return item.future
+
+    def send(self, subject, body, to_email, timeout=120):
+        """
+        Envoie un email via la file et attend son résultat
+
+        Passé timeout, l'email encore en file est annulé (ok False: il ne
+        partira pas). S'il est déjà en cours d'envoi, on attend le résultat
+        réel : un échec annoncé ici ferait renvoyer un email déjà parti.
+
+        Returns:
+            dict: {'ok', 'id', 'error', 'queued_ms', 'send_ms', 'batch'}
+        """
+        future = self.submit(subject, body, to_email)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                with self._lock:
+                    self.stats['cancelled'] += 1
+                return _failed(f"Délai de {timeout} s dépassé en file, email non envoyé")
+            print(f"⏳ Envoi vers {to_email} plus long que {timeout} s, attente du résultat", flush=True)
+            return future.result()
+        except Exception as e:
+            return _failed(str(e))
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats, backend=self.backend, queued=len(self._queue), recent=list(self._recent))
+        if self._smtp:
+            stats['smtp'] = dict(self._smtp.stats)
+        return stats
+
+    # ---------- Envoi ----------
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # Fenêtre de regroupement: les requêtes simultanées partent ensemble
+            time.sleep(self.window)
+            with self._lock:
+                items, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+                if not self._queue:
+                    self._wakeup.clear()
+            # Les emails annulés par send() (délai dépassé) ne partent pas
+            items = [item for item in items if item.future.set_running_or_notify_cancel()]
+            if items:
+                self._flush(items)
+
+    def _send_items(self, items):
+        """
+        Returns:
+            list: [(id ou None, exception ou None, durée ms)] dans l'ordre de items
+        """
+        messages = [build_message(item.subject, item.body, item.to_email, self.account.username)
+                    for item in items]
+        if self.backend == 'smtp':
+            if self._smtp is None:
+                self._smtp = SmtpPool(self.account.username, self.account.password)
+            return [(None, error, ms) for error, ms in self._smtp.send_many(messages)]
+
+        client = get_gmail_client(self.account)
+        start = time.perf_counter()
+        if self.backend == 'gmail_batch' and len(items) > 1:
+            responses = client.send_batch([encode_raw(message) for message in messages])
+            elapsed = (time.perf_counter() - start) * 1000
+            return [((response or {}).get('id'), error, elapsed) for response, error in responses]
+
+        results = []
+        for message in messages:
+            start = time.perf_counter()
+            try:
+                response = client.send(encode_raw(message))
+                results.append((response.get('id'), None, (time.perf_counter() - start) * 1000))
+            except Exception as e:
+                results.append((None, e, (time.perf_counter() - start) * 1000))
+        return results
+
+    def _flush(self, items):
+        batch = next(self._batches)
+        flushed = time.time()
+        start = time.perf_counter()
+        try:
+            results = self._send_items(items)
+        except Exception as e:
+            results = [(None, e, (time.perf_counter() - start) * 1000)] * len(items)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        failed = 0
+        outcomes = []
+        for item, (message_id, error, send_ms) in zip(items, results):
+            if error is not None:
+                failed += 1
+                print(f"❌ Envoi {self.backend} vers {item.to_email} ({item.subject}): {error}", flush=True)
+            outcome = {
+                'ok': error is None,
+                'id': message_id,
+                'error': str(error) if error is not None else None,
+                'queued_ms': round((flushed - item.queued) * 1000, 1),
+                'send_ms': round(send_ms, 1),
+                'batch': batch,
+            }
+            outcomes.append(dict(outcome, to=item.to_email, subject=item.subject))
+            item.future.set_result(outcome)
+
+        with self._lock:
+            self._recent.extend(outcomes)
+            self.stats['sent'] += len(items) - failed
+            self.stats['failed'] += failed
+            self.stats['batches'] += 1
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(items))
+            self.stats['last_batch_ms'] = round(elapsed, 1)
+        print(f"📤 [{self.account.name}] Lot {batch} ({self.backend}): {len(items) - failed}/{len(items)} "
+              f"email(s) envoyé(s) en {elapsed:.0f} ms", flush=True)
+
+
+_outboxes = {}
+_outboxes_lock = threading.Lock()
+
+
+def get_outbox(account=None):
+    """Retourne la file d'envoi partagée d'un compte (nom ou Account)"""
+    account = get_account(account)
+    with _outboxes_lock:
+        if account.name not in _outboxes:
+            _outboxes[account.name] = Outbox(account)
+        return _outboxes[account.name]
+
+
+def get_all_outbox_stats():
+    with _outboxes_lock:
+        outboxes = dict(_outboxes)
+    return {name: outbox.get_stats() for name, outbox in outboxes.items()}
@@ -0,0 +1,189 @@
+# request_grammar.py - v1.2.0
+"""
+Grammaire des commandes inReach, compilée une seule fois
+
+- Registre déclaratif des commandes (préfixe → type de requête) et des
+  modèles GRIB : ajouter une commande ne rajoute pas de balayage
+- Une seule expression compilée à l'import, un seul passage sur le texte
+  utilisateur (déjà débarrassé du pied Garmin par inreach_parser)
+- À position égale, le préfixe le plus long l'emporte (cg avant c, mg avant m)
+
+v1.1.0: plusieurs commandes par message (parse_requests) ; la question
+d'une commande s'arrête au début de la commande suivante
+v1.2.0: format de réponse GRIB en dernier segment ('...|WIND,GUST,PRMSL|compact'),
+retiré de la requête envoyée à Saildocs
+"""
+
+import re
+import time
+
+# Commandes AI: préfixe → type de requête (job_runner.AI_HANDLERS)
+AI_COMMANDS = {
+    'cg': 'claude_generic',
+    'mg': 'mistral_generic',
+    'c': 'claude_maritime',
+    'm': 'mistral_maritime',
+    'w': 'weather',
+}
+
+# Modèles acceptés par Saildocs
+GRIB_MODELS = ('ecmwf', 'gfs', 'icon', 'rtofs')
+
+# Formats de réponse GRIB (dernier segment de la requête) ; sans segment: GRIB encodé
+GRIB_FORMATS = ('compact',)
+
+# Budget de tokens demandé = nombre de caractères x facteur
+TOKENS_PER_CHAR = 3
+
+
+def build_grammar(commands=AI_COMMANDS, models=GRIB_MODELS):
+    """
+    Compile la grammaire à partir des tables
+
+    Returns:
+        re.Pattern: têtes de commande, groupes 'cmd'/'chars' (AI) ou 'grib'
+    """
+    prefixes = '|'.join(re.escape(p) for p in sorted(commands, key=len, reverse=True))
+    grib = '|'.join(re.escape(m) for m in models)
+    return re.compile(
+        rf'\b(?:(?P<cmd>{prefixes})\s*(?P<chars>\d+)\s*:'
+        rf'|(?P<grib>(?:{grib}):\S+))',
+        re.IGNORECASE
+    )
+
+
+_GRAMMAR = build_grammar()
+
+
+class InreachRequest:
+    """Requête typée issue du texte utilisateur"""
+
+    __slots__ = ('type', 'max_tokens', 'question', 'request', 'format')
+
+    def __init__(self, type, max_tokens=None, question=None, request=None, format=None):
+        self.type = type
+        self.max_tokens = max_tokens
+        self.question = question
+        self.request = request
+        self.format = format
+
+    @property
+    def is_grib(self):
+        return self.type == 'grib'
+
+    def to_dict(self):
+        """Forme persistée dans job_store (request_info)"""
+        if self.is_grib:
+            if self.format:
+                return {'type': 'grib', 'request': self.request, 'format': self.format}
+            return {'type': 'grib', 'request': self.request}
+        return {'type': self.type, 'max_tokens': self.max_tokens, 'question': self.question}
+
+    def __repr__(self):
+        return f"InreachRequest({self.to_dict()!r})"
+
+
+def split_grib_format(grib):
+    """
+    Sépare le format de réponse éventuel de la requête Saildocs
+
+    Returns:
+        InreachRequest: requête GRIB (sans le segment de format) et son format ou None
+    """
+    request, _, flag = grib.rpartition('|')
+    if request and flag.lower() in GRIB_FORMATS:
+        return InreachRequest('grib', request=request, format=flag.lower())
+    return InreachRequest('grib', request=grib)
+
+
+def parse_requests(text, grammar=_GRAMMAR, commands=AI_COMMANDS):
+    """
+    Toutes les commandes du texte utilisateur, dans l'ordre du message
+
+    Args:
+        text: Texte utilisateur (sans pied Garmin)
+
+    Returns:
+        list: [InreachRequest] (vide si aucune commande)
+    """
+    if not text:
+        return []
+    heads = list(grammar.finditer(text))
+    requests = []
+    for i, match in enumerate(heads):
+        if match.lastgroup == 'grib':
+            requests.append(split_grib_format(match.group('grib')))
+            continue
+        end = heads[i + 1].start() if i + 1 < len(heads) else len(text)
+        question = text[match.end():end].strip()
+        if not question:
+            continue
+        requests.append(InreachRequest(commands[match.group('cmd').lower()],
+                                       max_tokens=int(match.group('chars')) * TOKENS_PER_CHAR,
+                                       question=question))
+    return requests
+
+
+def parse_request(text, grammar=_GRAMMAR, commands=AI_COMMANDS):
+    """
+    Première commande du texte utilisateur
+
+    Returns:
+        InreachRequest ou None si aucune commande
+    """
+    requests = parse_requests(text, grammar, commands)
+    return requests[0] if requests else None
+
+
+# Benchmark sur un corpus de corps réalistes
+if __name__ == "__main__":
+    import glob
+    import os
+    import sys
+    from inreach_parser import parse_inreach_email
+
+    fixture_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'inreach')
+    iterations = 20000
+
+    def legacy_detect(body):
+        """detect_request_type historique (dict reconstruit, jusqu'à 6 balayages)"""
+        patterns = {
+            'claude_generic': r'\bcg\s*(\d+)\s*:\s*(.+)',
+            'mistral_generic': r'\bmg\s*(\d+)\s*:\s*(.+)',
+            'claude_maritime': r'\bc\s*(\d+)\s*:\s*(.+)',
+            'mistral_maritime': r'\bm\s*(\d+)\s*:\s*(.+)',
+            'weather': r'\bw\s*(\d+)\s*:\s*(.+)'
+        }
+        for key, pat in patterns.items():
+            match = re.search(pat, body, re.IGNORECASE | re.DOTALL)
+            if match:
+                return {'type': key, 'max_tokens': int(match.group(1))*3, 'question': match.group(2).strip()}
+        match = re.compile(r'(ecmwf|gfs|icon|rtofs):[^\s\n]+', re.IGNORECASE).search(body)
+        return {'type': 'grib', 'request': match.group(0)} if match else None
+
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(fixture_dir, '*.eml'))):
+        with open(path, 'rb') as f:
+            parsed = parse_inreach_email(f.read())
+        if parsed:
+            corpus.append((os.path.basename(path), parsed['text']))
+
+    print("=" * 70)
+    print("BENCHMARK GRAMMAIRE DES COMMANDES")
+    print("=" * 70)
+    for name, text in corpus:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            req = parse_request(text)
+        new_us = (time.perf_counter() - start) / iterations * 1e6
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            legacy_detect(text)
+        old_us = (time.perf_counter() - start) / iterations * 1e6
+
+        print(f"\n📧 {name}")
+        print(f"   ⏱️  {new_us:6.2f} µs (historique: {old_us:6.2f} µs)")
+        print(f"   📝 {req.to_dict() if req else None}")
+    print("\n" + "=" * 70)
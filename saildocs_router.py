@@ -0,0 +1,252 @@
+# saildocs_router.py - v1.2.0
+"""
+Démultiplexeur des réponses Saildocs
+
+Un seul lecteur IMAP surveille query-reply@saildocs.com pour toutes les
+requêtes GRIB en attente et remet chaque fichier au job qui l'a demandé
+(correspondance sur le sujet ou le texte de requête renvoyé par Saildocs).
+Plusieurs bateaux peuvent attendre en même temps sans s'échanger leurs
+fichiers ni ouvrir chacun leur propre boucle de polling.
+
+v1.1.0: un démultiplexeur par compte (la réponse Saildocs arrive dans la
+boîte qui a envoyé la requête)
+v1.2.0: UID ignorés limités aux réponses encore non lues (vidés si
+UIDVALIDITY change) ; réponse sans demandeur marquée lue après
+SAILDOCS_ORPHAN_GRACE au lieu d'être relue à chaque cycle
+"""
+
+import itertools
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from config import SAILDOCS_RESPONSE_EMAIL, SAILDOCS_POLL_INTERVAL, SAILDOCS_ORPHAN_GRACE
+from imap_session import (imap_session, uid_fetch, fetch_parts, fetch_text_parts,
+                          find_part, find_text_part, envelope_subject, mailbox_status)
+
+
+def normalize_request(text):
+    """Forme canonique pour la comparaison (minuscules, sans blancs)"""
+    return re.sub(r'\s+', '', text or '').lower()
+
+
+def match_reply(haystack, waiting, total_pending, already_matched=False):
+    """
+    Choisit l'attente correspondant à une réponse Saildocs
+
+    Args:
+        haystack: Sujet + texte normalisés (normalize_request)
+        waiting: Attentes encore libres (objets avec .key et .created)
+        total_pending: Nombre total d'attentes
+        already_matched: Une autre réponse du même lot a déjà été attribuée
+
+    Returns:
+        L'attente la plus ancienne dont la requête apparaît dans haystack ;
+        à défaut, l'unique attente (comportement historique), sinon None
+    """
+    for pending in sorted(waiting, key=lambda p: p.created):
+        if pending.key and pending.key in haystack:
+            return pending
+    if len(waiting) == 1 and total_pending == 1 and not already_matched:
+        return waiting[0]
+    return None
+
+
+class PendingGrib:
+    """Requête GRIB en attente de la réponse Saildocs"""
+
+    def __init__(self, job_id, grib_request):
+        self.job_id = job_id
+        self.grib_request = grib_request
+        self.key = normalize_request(grib_request)
+        self.created = time.time()
+        self.future = Future()
+
+
+class SaildocsDemux:
+    """Lecteur unique de la boîte pour toutes les attentes Saildocs"""
+
+    def __init__(self, poll_interval=SAILDOCS_POLL_INTERVAL, account=None, orphan_grace=SAILDOCS_ORPHAN_GRACE):
+        self.poll_interval = poll_interval
+        self.account = account
+        self.orphan_grace = orphan_grace
+        self._pending = {}
+        # UID non lus sans pièce GRIB (jamais relus) et date de première vue des
+        # réponses sans demandeur ; valables pour une seule UIDVALIDITY
+        self._ignored = set()
+        self._orphans = {}
+        self._uidvalidity = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    # ---------- API des jobs GRIB ----------
+
+    def register(self, grib_request):
+        """Enregistre une attente ; à appeler avant ou juste après l'envoi"""
+        with self._lock:
+            pending = PendingGrib(next(self._ids), grib_request)
+            self._pending[pending.job_id] = pending
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f'saildocs-demux-{self.account}',
+                                                daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return pending
+
+    def wait(self, pending, timeout):
+        """
+        Bloque jusqu'à la livraison du fichier ou le timeout
+
+        Returns:
+            bytes: Données GRIB, ou None si timeout
+        """
+        try:
+            return pending.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
+        finally:
+            self.cancel(pending)
+
+    def cancel(self, pending):
+        with self._lock:
+            self._pending.pop(pending.job_id, None)
+
+    def notify_new_mail(self):
+        """Réveil immédiat du lecteur (ex. EXISTS reçu en IDLE)"""
+        self._wakeup.set()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'oldest_wait_s': round(time.time() - min(p.created for p in self._pending.values()), 1)
+                if self._pending else 0,
+            }
+
+    # ---------- Lecteur ----------
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._lock:
+                if not self._pending:
+                    continue
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"⚠️ Erreur lecteur Saildocs: {e}", flush=True)
+
+    def _match(self, haystack, taken):
+        """Job le plus ancien dont la requête apparaît dans le sujet/texte"""
+        with self._lock:
+            waiting = [p for p in self._pending.values() if p.job_id not in taken]
+            total = len(self._pending)
+        return match_reply(haystack, waiting, total, bool(taken))
+
+    def _expire_orphans(self, mail):
+        """
+        Marque lues les réponses restées sans demandeur au-delà du délai de grâce
+
+        Returns:
+            set: UID marqués lus
+        """
+        limit = time.time() - self.orphan_grace
+        expired = {uid for uid, seen in self._orphans.items() if seen < limit}
+        if not expired:
+            return expired
+        mail.uid('STORE', b','.join(expired).decode(), '+FLAGS', '(\\Seen)')
+        for uid in expired:
+            self._orphans.pop(uid, None)
+            self._ignored.discard(uid)
+        print(f"🗑️ {len(expired)} réponse(s) Saildocs sans demandeur marquée(s) lue(s)", flush=True)
+        return expired
+
+    def poll_once(self):
+        """Un cycle: lit les réponses Saildocs non lues et livre les fichiers"""
+        with imap_session(self.account) as mail:
+            uidvalidity = mailbox_status(mail)['UIDVALIDITY']
+            if uidvalidity != self._uidvalidity:
+                self._ignored.clear()
+                self._orphans.clear()
+                self._uidvalidity = uidvalidity
+            status, data = mail.uid('SEARCH', None, f'(UNSEEN FROM "{SAILDOCS_RESPONSE_EMAIL}")')
+            if status != 'OK':
+                return 0
+            unseen = set(data[0].split()) if data[0] else set()
+            # Seuls les UID encore non lus comptent: les deux ensembles restent bornés
+            self._ignored &= unseen
+            self._orphans = {uid: seen for uid, seen in self._orphans.items() if uid in unseen}
+            unseen -= self._expire_orphans(mail)
+            # Les réponses sans demandeur restent candidates pendant le délai de grâce
+            uids = [uid for uid in unseen if uid not in self._ignored]
+            if not uids:
+                return 0
+
+            headers = uid_fetch(mail, uids, '(UID ENVELOPE BODYSTRUCTURE)')
+            candidates = {}
+            for uid, fields in headers.items():
+                structure = fields.get(b'BODYSTRUCTURE')
+                grib_part = find_part(structure, b'APPLICATION', (b'OCTET-STREAM',))
+                if not grib_part:
+                    self._ignored.add(uid)
+                    self._orphans[uid] = time.time()
+                    continue
+                candidates[uid] = (envelope_subject(fields.get(b'ENVELOPE')), grib_part,
+                                   find_text_part(structure, (b'PLAIN',)))
+
+            texts = fetch_text_parts(mail, {uid: c[2] for uid, c in candidates.items() if c[2]})
+
+            deliveries = {}
+            for uid in sorted(candidates, key=int):
+                subject = candidates[uid][0]
+                haystack = normalize_request(subject + ' ' + texts.get(uid, ''))
+                pending = self._match(haystack, {p.job_id for p in deliveries.values()})
+                if pending:
+                    deliveries[uid] = pending
+                    self._orphans.pop(uid, None)
+                elif uid not in self._orphans:
+                    self._orphans[uid] = time.time()
+                    print(f"⚠️ Réponse Saildocs sans demandeur: {subject[:60]}", flush=True)
+
+            if not deliveries:
+                return 0
+
+            files = fetch_parts(mail, {uid: candidates[uid][1] for uid in deliveries})
+            mail.uid('STORE', b','.join(deliveries).decode(), '+FLAGS', '(\\Seen)')
+
+        delivered = 0
+        for uid, pending in deliveries.items():
+            grib_data = files.get(uid)
+            if grib_data and not pending.future.done():
+                print(f"📦 GRIB livré au job #{pending.job_id} ({len(grib_data)} octets)", flush=True)
+                pending.future.set_result(grib_data)
+                delivered += 1
+        return delivered
+
+
+_demuxes = {}
+_demuxes_lock = threading.Lock()
+
+
+def get_saildocs_demux(account=None):
+    """
+    Retourne le démultiplexeur partagé d'un compte
+
+    Args:
+        account: Nom ou Account (None: premier compte du registre)
+    """
+    from accounts import get_account
+    name = get_account(account).name
+    with _demuxes_lock:
+        if name not in _demuxes:
+            _demuxes[name] = SaildocsDemux(account=name)
+        return _demuxes[name]
+
+
+def get_all_demux_stats():
+    with _demuxes_lock:
+        demuxes = dict(_demuxes)
+    return {name: demux.get_stats() for name, demux in demuxes.items()}
@@ -0,0 +1,185 @@
+# text_codec.py - v1.0.1
+"""
+Encodage texte dense des données GRIB compressées (alternative au base64)
+
+Le base64 ne porte que 6 bits par caractère. Avec un alphabet de N
+caractères, chaque bloc de k octets devient m caractères (le plus petit
+m tel que N^m >= 256^k, k <= 16 choisi pour minimiser m/k) : 85
+caractères → 4 octets en 5 (base85), 91 → 13 en 16 (basE91).
+
+Gain réel modeste : environ 5 % de messages en moins (28 → 27 sur le
+fichier de test). Un caractère dense porte log2(N) bits contre 6 en
+base64, et les caractères sûrs dans un message inReach (ASCII
+imprimable sans blanc, guillemets ni échappements HTML) plafonnent
+vers 91 : au mieux 1 - 6/6.5 ≈ 7-8 % de texte en moins ('safe' 80 car.:
+5 %, 'gsm' 85 car.: 6 %).
+
+L'alphabet est configurable (GRIB_TEXT_ALPHABET) : un nom de ALPHABETS
+ou la chaîne elle-même. Il est vérifié au premier usage : caractères
+ASCII imprimables, sans blanc ni doublon, et aller-retour exact sur un
+corpus (blocs limites, zéros, 0xFF, longueurs 0 à 64 octets).
+
+Le texte encodé commence par HEADER, absent de l'alphabet base64 : le
+décodeur distingue ainsi ce format du base64 (étiqueté ou historique).
+
+v1.0.1: gain réel documenté (~5 %, plafond ~7-8 % pour ~91 caractères)
+"""
+
+import math
+import random
+import threading
+
+# Marqueur de format (hors alphabet base64)
+HEADER = '!'
+
+_ALNUM = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+ALPHABETS = {
+    # Jeu GSM 03.38 de base, sans " ' & < > (échappés par les pages et emails HTML)
+    'safe': _ALNUM + '!#$%()*+,-./:;=?@_',
+    # Tous les caractères ASCII imprimables du jeu GSM de base
+    'gsm': _ALNUM + '!"#$%&\'()*+,-./:;<=>?@_',
+}
+
+DEFAULT_ALPHABET = 'safe'
+MAX_BLOCK_BYTES = 16
+
+
+class TextCodec:
+    """Codeur par blocs pour un alphabet donné"""
+
+    def __init__(self, alphabet):
+        self.alphabet = alphabet
+        self.base = len(alphabet)
+        self.index = {char: value for value, char in enumerate(alphabet)}
+        # Caractères nécessaires pour r octets (r = 0..k)
+        self.block_bytes, self.block_chars = min(
+            ((k, self.chars_for(k)) for k in range(1, MAX_BLOCK_BYTES + 1)),
+            key=lambda km: (km[1] / km[0], km[0]))
+        self.tail_bytes = {self.chars_for(r): r for r in range(1, self.block_bytes)}
+
+    def chars_for(self, nbytes):
+        chars = math.ceil(nbytes * 8 / math.log2(self.base))
+        # Correction d'un arrondi flottant à la frontière
+        while self.base ** chars < 256 ** nbytes:
+            chars += 1
+        return chars
+
+    @property
+    def chars_per_byte(self):
+        return self.block_chars / self.block_bytes
+
+    def _encode_block(self, block, nchars):
+        value = int.from_bytes(block, 'big')
+        digits = []
+        for _ in range(nchars):
+            value, digit = divmod(value, self.base)
+            digits.append(self.alphabet[digit])
+        return ''.join(reversed(digits))
+
+    def _decode_block(self, text, nbytes):
+        value = 0
+        for char in text:
+            value = value * self.base + self.index[char]
+        if value >= 256 ** nbytes:
+            raise ValueError("Bloc encodé hors limites")
+        return value.to_bytes(nbytes, 'big')
+
+    def encode(self, data):
+        k, m = self.block_bytes, self.block_chars
+        parts = [self._encode_block(data[i:i + k], m) for i in range(0, len(data) - len(data) % k, k)]
+        tail = len(data) % k
+        if tail:
+            parts.append(self._encode_block(data[-tail:], self.chars_for(tail)))
+        return ''.join(parts)
+
+    def decode(self, text):
+        k, m = self.block_bytes, self.block_chars
+        full, tail = divmod(len(text), m)
+        if tail and tail not in self.tail_bytes:
+            raise ValueError(f"Longueur encodée invalide ({len(text)} caractères)")
+        try:
+            blocks = [self._decode_block(text[i * m:(i + 1) * m], k) for i in range(full)]
+            if tail:
+                blocks.append(self._decode_block(text[full * m:], self.tail_bytes[tail]))
+        except KeyError as e:
+            raise ValueError(f"Caractère hors alphabet: {e.args[0]!r}") from None
+        return b''.join(blocks)
+
+
+def round_trip_corpus(block_bytes):
+    """Corpus de vérification: bords de blocs, valeurs extrêmes, aléatoire reproductible"""
+    rng = random.Random(91)
+    corpus = [b'', b'\x00', b'\xff']
+    for length in range(1, 4 * block_bytes + 2):
+        corpus += [b'\x00' * length, b'\xff' * length, bytes(rng.randrange(256) for _ in range(length))]
+    corpus += [bytes(rng.randrange(256) for _ in range(n)) for n in (255, 256, 1000)]
+    return corpus
+
+
+def check_alphabet(alphabet):
+    """
+    Vérifie un alphabet et l'aller-retour du corpus
+
+    Raises:
+        ValueError: Alphabet inutilisable (taille, caractère, doublon, aller-retour)
+    """
+    if not 65 <= len(alphabet) <= 255:
+        raise ValueError(f"Alphabet de {len(alphabet)} caractères (attendu: 65 à 255)")
+    bad = [char for char in alphabet if not (char.isascii() and char.isprintable()) or char.isspace()]
+    if bad:
+        raise ValueError(f"Caractères non imprimables ou blancs dans l'alphabet: {bad!r}")
+    if len(set(alphabet)) != len(alphabet):
+        raise ValueError("Caractères en double dans l'alphabet")
+    codec = TextCodec(alphabet)
+    for data in round_trip_corpus(codec.block_bytes):
+        if codec.decode(codec.encode(data)) != data:
+            raise ValueError(f"Aller-retour incorrect ({len(data)} octets)")
+    return codec
+
+
+_codecs = {}
+_codecs_lock = threading.Lock()
+
+
+def get_codec(alphabet=DEFAULT_ALPHABET):
+    """Codeur vérifié pour un alphabet (nom de ALPHABETS ou chaîne), mis en cache"""
+    alphabet = ALPHABETS.get(alphabet, alphabet)
+    with _codecs_lock:
+        if alphabet not in _codecs:
+            _codecs[alphabet] = check_alphabet(alphabet)
+        return _codecs[alphabet]
+
+
+def encode(data, alphabet=DEFAULT_ALPHABET):
+    return get_codec(alphabet).encode(data)
+
+
+def decode(text, alphabet=DEFAULT_ALPHABET):
+    return get_codec(alphabet).decode(text)
+
+
+# Densité des alphabets et messages satellite pour un fichier (python text_codec.py [fichier])
+if __name__ == "__main__":
+    import base64
+    import os
+    import sys
+    import time
+
+    data = open(sys.argv[1], 'rb').read() if len(sys.argv) > 1 else os.urandom(2500)
+    print("=" * 70)
+    print(f"ENCODAGE TEXTE ({len(data)} octets, messages de 120 caractères)")
+    print("=" * 70)
+    b64 = base64.b64encode(data).decode()
+    print(f"base64      : {len(b64):6d} car. {math.ceil(len(b64) / 120):3d} msg")
+    for name in ALPHABETS:
+        codec = get_codec(name)
+        start = time.perf_counter()
+        text = codec.encode(data)
+        encode_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        assert codec.decode(text) == data
+        decode_ms = (time.perf_counter() - start) * 1000
+        print(f"{name:5s} ({codec.base:3d}): {len(text):6d} car. {math.ceil((len(text) + 2) / 120):3d} msg "
+              f"({codec.block_bytes} octets → {codec.block_chars} car., "
+              f"{encode_ms:.1f} ms / {decode_ms:.1f} ms)")
@@ -1,33 +1,167 @@
-# utils.py - v3.0.0
-"""Fonctions utilitaires pour encodage/décodage GRIB"""
+# utils.py - v3.6.0
+"""Fonctions utilitaires pour encodage/décodage GRIB
+
+v3.1.0: compresseur choisi par grib_codec (GRIB_CODEC), étiquette d'un
+caractère en tête du texte, décodeur decode_grib_messages
+v3.2.0: encodage texte dense optionnel (text_codec, GRIB_TEXT_ENCODING)
+v3.3.0: réduction optionnelle des en-têtes GRIB (grib_strip, GRIB_STRIP_HEADERS)
+v3.4.0: réduction de précision optionnelle (grib_quantize, GRIB_PRECISION)
+v3.5.0: compression complexe GRIB2 optionnelle (grib_complex, GRIB_COMPLEX_PACKING)
+v3.6.0: format compact vent/pression à la demande (compact_grid, requête '|compact')
+"""
 
 import base64
-import zlib
-from config import MAX_MESSAGE_LENGTH
+import re
+import grib_codec
+import grib_complex
+import grib_quantize
+import grib_strip
+import text_codec
+from config import (MAX_MESSAGE_LENGTH, MAX_GRIB_MESSAGES, GRIB_CODEC, GRIB_TEXT_ENCODING,
+                    GRIB_TEXT_ALPHABET, GRIB_STRIP_HEADERS, GRIB_PRECISION, GRIB_COMPLEX_PACKING)
+
+TEXT_ENCODINGS = ('base64', 'dense')
+PRECISION_MODES = ('off', 'on', 'auto')
+PAYLOAD_FORMATS = (None, 'compact')
 
 
-def encode_and_split_grib(grib_data):
+def compress_grib(grib_data, codec=GRIB_CODEC, strip_headers=GRIB_STRIP_HEADERS,
+                  complex_packing=GRIB_COMPLEX_PACKING):
+    """
+    Compression, précédée si demandé de la compression complexe GRIB2
+    et de la réduction des en-têtes
+    
+    Chaque forme n'est gardée que si elle compresse mieux (peu
+    d'enregistrements, grosses grilles, champs bruités: le gain peut
+    être nul).
+    
+    Returns:
+        tuple: (étiquette du codec, données compressées)
+    """
+    tag, compressed = _compress_stripped(grib_data, codec, strip_headers)
+    if not complex_packing:
+        return tag, compressed
+    
+    repacked = repack_grib2(grib_data)
+    if repacked == grib_data:
+        return tag, compressed
+    repacked_tag, repacked_compressed = _compress_stripped(repacked, codec, strip_headers)
+    print(f"   🧮 Compression complexe: {len(compressed)} → {len(repacked_compressed)} octets compressés")
+    if len(repacked_compressed) < len(compressed):
+        return repacked_tag, repacked_compressed
+    return tag, compressed
+
+
+def repack_grib2(grib_data):
+    """Repasse les champs GRIB2 en compression complexe (sans perte) et journalise le gain"""
+    repacked, fields = grib_complex.repack_complex(grib_data)
+    print(f"   {grib_complex.format_report(fields, len(grib_data), len(repacked))}")
+    return repacked
+
+
+def _compress_stripped(grib_data, codec, strip_headers):
+    tag, compressed = grib_codec.compress(grib_data, codec)
+    if not strip_headers:
+        return tag, compressed
+    
+    stripped = grib_strip.strip(grib_data)
+    if grib_strip.rebuild(stripped) != grib_data:
+        print("   ⚠️ Réduction des en-têtes non réversible - fichier envoyé tel quel")
+        return tag, compressed
+    stripped_tag, stripped_compressed = grib_codec.compress(stripped, codec)
+    print(f"   ✂️ En-têtes réduits: {len(compressed)} → {len(stripped_compressed)} octets compressés")
+    if len(stripped_compressed) < len(compressed):
+        return stripped_tag, stripped_compressed
+    return tag, compressed
+
+
+def encode_and_split_grib(grib_data, codec=GRIB_CODEC, text_encoding=GRIB_TEXT_ENCODING,
+                          alphabet=GRIB_TEXT_ALPHABET, strip_headers=GRIB_STRIP_HEADERS,
+                          precision=GRIB_PRECISION, complex_packing=GRIB_COMPLEX_PACKING,
+                          payload_format=None):
     """
     Compresse et découpe fichier GRIB en messages
     
     Args:
         grib_data: Données GRIB brutes (bytes)
+        codec: Mode de grib_codec ('zlib' historique, 'auto', 'lzma', 'bz2')
+        text_encoding: 'base64' (historique) ou 'dense' (text_codec, alphabet)
+        strip_headers: Réduction des en-têtes GRIB avant compression (grib_strip)
+        precision: 'off', 'on' ou 'auto' (précision réduite seulement au-delà
+                   de MAX_GRIB_MESSAGES messages)
+        complex_packing: Compression complexe GRIB2 sans perte avant compression (grib_complex)
+        payload_format: None (GRIB) ou 'compact' (compact_grid, GRIB si non applicable)
         
     Returns:
         list: Liste de messages formatés
     """
+    if payload_format not in PAYLOAD_FORMATS:
+        raise ValueError(f"Format de réponse GRIB inconnu: {payload_format}")
+    if payload_format == 'compact':
+        messages = encode_compact_grid(grib_data, codec, text_encoding, alphabet)
+        if messages is not None:
+            return messages
+    if precision not in PRECISION_MODES:
+        raise ValueError(f"GRIB_PRECISION inconnu: {precision} (attendu: {', '.join(PRECISION_MODES)})")
+    if precision == 'on':
+        grib_data = reduce_precision(grib_data)
+    messages = _encode_and_split(grib_data, codec, text_encoding, alphabet, strip_headers, complex_packing)
+    if precision == 'auto' and len(messages) > MAX_GRIB_MESSAGES:
+        print(f"   {len(messages)} messages > {MAX_GRIB_MESSAGES}: nouvel essai en précision réduite")
+        messages = _encode_and_split(reduce_precision(grib_data), codec, text_encoding, alphabet,
+                                     strip_headers, complex_packing)
+    return messages
+
+
+def encode_compact_grid(grib_data, codec=GRIB_CODEC, text_encoding=GRIB_TEXT_ENCODING,
+                        alphabet=GRIB_TEXT_ALPHABET):
+    """
+    Messages au format compact vent/pression (même compression et même texte qu'un GRIB)
+    
+    Returns:
+        list: Messages formatés, ou None si le fichier ne s'y prête pas
+    """
+    try:
+        import compact_grid
+    except ImportError:
+        print("   ⚠️ NumPy absent: format compact indisponible, GRIB envoyé tel quel")
+        return None
+    payload = compact_grid.encode(grib_data)
+    if payload is None:
+        print("   ⚠️ Format compact non applicable (paramètres, grille ou échéances): GRIB envoyé tel quel")
+        return None
+    return _encode_and_split(payload, codec, text_encoding, alphabet, False, False)
+
+
+def reduce_precision(grib_data):
+    """Réempaquette les champs au pas de GRIB_PRECISION_STEPS et journalise l'erreur introduite"""
+    reduced, report = grib_quantize.requantize(grib_data)
+    print(f"   {grib_quantize.format_report(report, len(grib_data), len(reduced))}")
+    return reduced
+
+
+def _encode_and_split(grib_data, codec, text_encoding, alphabet, strip_headers, complex_packing):
     print(f"\n{'='*60}")
     print("ENCODAGE GRIB")
     print(f"{'='*60}")
     
     # 1. Compression
-    compressed = zlib.compress(grib_data, level=9)
+    tag, compressed = compress_grib(grib_data, codec, strip_headers, complex_packing)
     ratio = (1 - len(compressed)/len(grib_data)) * 100
-    print(f"1. Compression: {len(grib_data)} → {len(compressed)} octets ({ratio:.1f}%)")
+    print(f"1. Compression{' (' + tag + ')' if tag else ''}: "
+          f"{len(grib_data)} → {len(compressed)} octets ({ratio:.1f}%)")
     
-    # 2. Base64
-    encoded = base64.b64encode(compressed).decode('utf-8')
-    print(f"2. Base64: {len(encoded)} caractères")
+    if text_encoding not in TEXT_ENCODINGS:
+        raise ValueError(f"GRIB_TEXT_ENCODING inconnu: {text_encoding} (attendu: {', '.join(TEXT_ENCODINGS)})")
+    if text_encoding == 'dense':
+        # 2. Texte dense: marqueur + étiquette du codec (toujours présente) + blocs
+        encoded = text_codec.HEADER + (tag or grib_codec.TAGS['zlib']) + text_codec.encode(compressed, alphabet)
+        print(f"2. Texte dense ({len(text_codec.ALPHABETS.get(alphabet, alphabet))} car.): "
+              f"{len(encoded)} caractères (base64: {len(tag) + (len(compressed) + 2) // 3 * 4})")
+    else:
+        # 2. Base64 (précédé de l'étiquette du codec, sauf zlib historique)
+        encoded = tag + base64.b64encode(compressed).decode('utf-8')
+        print(f"2. Base64: {len(encoded)} caractères")
     
     # 3. Découpage
     chunks = [encoded[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(encoded), MAX_MESSAGE_LENGTH)]
@@ -46,6 +180,50 @@ def encode_and_split_grib(grib_data):
     return messages
 
 
+# Le bloc encodé ne contient aucun blanc (et peut contenir "end")
+_MESSAGE_RE = re.compile(r'msg\s*(\d+)/(\d+):\s*(\S+)\s+end')
+
+
+def decode_grib_messages(messages, alphabet=GRIB_TEXT_ALPHABET):
+    """
+    Reconstitue le fichier GRIB à partir des messages reçus
+    
+    Args:
+        messages: Textes "msg i/n:...end" (ordre quelconque) ou un seul texte les contenant tous
+        alphabet: Alphabet du texte dense (le même qu'à l'encodage)
+        
+    Returns:
+        bytes: Données GRIB (GRIB1 reconstruit par compact_grid pour le format compact)
+        
+    Raises:
+        ValueError: Message manquant ou étiquette de codec inconnue
+    """
+    text = messages if isinstance(messages, str) else '\n'.join(messages)
+    chunks = {}
+    total = None
+    for match in _MESSAGE_RE.finditer(text):
+        chunks[int(match.group(1))] = match.group(3)
+        total = int(match.group(2))
+    missing = [i for i in range(1, (total or 0) + 1) if i not in chunks]
+    if not chunks or missing:
+        raise ValueError(f"Messages GRIB manquants: {missing or 'aucun message'}")
+    
+    encoded = ''.join(chunks[i] for i in range(1, total + 1))
+    if encoded.startswith(text_codec.HEADER):
+        data = grib_codec.decompress(encoded[1:2], text_codec.decode(encoded[2:], alphabet))
+    else:
+        tag, payload = grib_codec.split_tag(encoded)
+        data = grib_codec.decompress(tag, base64.b64decode(payload))
+    # Un fichier GRIB commence par 'GRIB', jamais par MAGIC
+    if grib_strip.is_stripped(data):
+        return grib_strip.rebuild(data)
+    if not data.startswith(b'GRIB'):
+        import compact_grid
+        if compact_grid.is_compact(data):
+            return compact_grid.decode(data)
+    return data
+
+
 def extract_grib_request(body):
     """
     Extrait la requête GRIB pure du corps de l'email
@@ -0,0 +1,96 @@
+# worker_pool.py - v1.2.0
+"""
+Pools de workers bornés, un par classe de requête
+
+Un GRIB peut bloquer 5 min sur Saildocs puis plusieurs minutes dans
+Playwright : il tourne dans son propre pool pour ne jamais retarder les
+réponses Claude/Mistral, et check_gmail rend la main immédiatement.
+
+v1.1.0: les workers puisent dans fair_scheduler (priorité AI courte,
+tourniquet par appareil). Les workers GRIB aident aussi sur les
+requêtes AI en attente, les workers AI ne prennent jamais de GRIB.
+v1.2.0: job en erreur remis en file par run_job après son délai de
+nouvelle tentative
+"""
+
+import threading
+from config import GRIB_WORKERS, AI_WORKERS
+from fair_scheduler import FairScheduler
+from job_runner import run_job
+
+# Classes de priorité servies par chaque pool (fair_scheduler.PRIORITY_CLASSES)
+POOL_CLASSES = {
+    'ai': ('short_ai', 'long_ai'),
+    'grib': ('short_ai', 'long_ai', 'grib'),
+}
+
+
+class WorkerPools:
+    """Threads workers par pool, alimentés par un FairScheduler commun"""
+
+    def __init__(self, sizes=None, scheduler=None):
+        sizes = sizes or {'grib': GRIB_WORKERS, 'ai': AI_WORKERS}
+        self.scheduler = scheduler or FairScheduler()
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._stats = {name: {'completed': 0, 'busy': 0} for name in sizes}
+        self._threads = []
+        for name, size in sizes.items():
+            for n in range(size):
+                thread = threading.Thread(target=self._worker, args=(name,),
+                                          name=f'{name}-worker-{n}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, job_id, job_type, device=None):
+        """
+        Met un job en file
+
+        Returns:
+            bool: False si ce job est déjà en file ou en cours (reprise + nouvelle synchro)
+        """
+        with self._lock:
+            if job_id in self._in_flight:
+                return False
+            self._in_flight.add(job_id)
+        self.scheduler.put(job_id, job_type, device)
+        return True
+
+    def _worker(self, name):
+        eligible = POOL_CLASSES[name]
+        while True:
+            job_id, _ = self.scheduler.get(eligible)
+            with self._lock:
+                self._stats[name]['busy'] += 1
+            try:
+                run_job(job_id, resubmit=self.submit)
+            except Exception as e:
+                print(f"❌ Worker {name}: {e}", flush=True)
+            finally:
+                with self._lock:
+                    self._in_flight.discard(job_id)
+                    self._stats[name]['busy'] -= 1
+                    self._stats[name]['completed'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            pools = {name: dict(stats) for name, stats in self._stats.items()}
+        return {'pools': pools, 'queues': self.scheduler.get_stats()}
+
+
+_default_pools = None
+_default_lock = threading.Lock()
+
+
+def get_worker_pools():
+    """Retourne les pools partagés du processus"""
+    global _default_pools
+    with _default_lock:
+        if _default_pools is None:
+            _default_pools = WorkerPools()
+        return _default_pools
+
+
+def submit_job(job_id, job_type, device=None):
+    """Raccourci: soumission au pool partagé (device = URL de réponse)"""
+    return get_worker_pools().submit(job_id, job_type, device)